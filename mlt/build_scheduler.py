@@ -0,0 +1,108 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import time
+from threading import Event, Lock, Thread, current_thread
+
+
+class BuildScheduler(object):
+    """Single-flight scheduler for `mlt build --watch`.
+       At most one build runs at a time. Changes that come in while a build
+       is running are coalesced into exactly one follow-up build, and the
+       running build, which is now stale, is cancelled if `cancel_stale`.
+       `build` is called with a threading.Event that is set on cancel.
+    """
+    def __init__(self, build, cancel_stale=True):
+        self.build = build
+        self.cancel_stale = cancel_stale
+        self.lock = Lock()
+        self.worker = None
+        self.cancelled = None
+        self.pending_changes = None
+        self.coalesced_changes = 0
+        self.wasted_build_time = 0.0
+
+    def schedule(self, changed_paths):
+        with self.lock:
+            if self.worker is not None:
+                if self.pending_changes is None:
+                    self.pending_changes = set()
+                self.pending_changes.update(changed_paths)
+                self.coalesced_changes = len(self.pending_changes)
+                if self.cancel_stale and not self.cancelled.is_set():
+                    print("Cancelling stale build, rebuilding with {} "
+                          "changed file(s)".format(self.coalesced_changes))
+                    self.cancelled.set()
+                else:
+                    print("Build in progress, queued {} changed "
+                          "file(s)".format(self.coalesced_changes))
+                return
+            self.cancelled = Event()
+            self.worker = Thread(target=self._run)
+            self.worker.daemon = True
+            self.worker.start()
+
+    def _run(self):
+        try:
+            while self._build_once():
+                pass
+        finally:
+            # whatever happened, the next change starts a new worker; unless
+            # it already did, after this worker was done with its builds
+            with self.lock:
+                if self.worker is current_thread():
+                    self.worker = None
+                    self.pending_changes = None
+
+    def _build_once(self):
+        """runs one build, True if changes were queued meanwhile"""
+        started_build_time = time.time()
+        try:
+            self.build(self.cancelled)
+        except SystemExit:
+            # the build already reported why it failed, keep watching
+            pass
+        except Exception as e:
+            print("Build failed: {}".format(e))
+        build_time = time.time() - started_build_time
+
+        with self.lock:
+            if self.cancelled.is_set():
+                self.wasted_build_time += build_time
+            self.cancelled = Event()
+            queued = self.pending_changes is not None
+            self.pending_changes = None
+            coalesced_changes, self.coalesced_changes = \
+                self.coalesced_changes, 0
+            if not queued:
+                self.worker = None
+        self._report(queued, coalesced_changes)
+        return queued
+
+    def _report(self, queued, coalesced_changes):
+        print("Build queue depth: {}, {} change(s) coalesced, "
+              "wasted build time: {:.1f}s".format(
+                  int(queued), coalesced_changes, self.wasted_build_time))
+
+    def wait(self, timeout=None):
+        """waits for the current and follow-up builds to finish"""
+        worker = self.worker
+        if worker is not None:
+            worker.join(timeout)
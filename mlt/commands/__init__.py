@@ -18,13 +18,6 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+# command modules are imported lazily by `mlt.main`, so don't import them
+# here, otherwise every command would pay for the imports of all of them
 from mlt.commands.base import Command  # noqa
-from mlt.commands.build import BuildCommand  # noqa
-from mlt.commands.config import ConfigCommand  # noqa
-from mlt.commands.deploy import DeployCommand  # noqa
-from mlt.commands.init import InitCommand  # noqa
-from mlt.commands.status import StatusCommand  # noqa
-from mlt.commands.templates import TemplatesCommand  # noqa
-from mlt.commands.undeploy import UndeployCommand  # noqa
-from mlt.commands.logs import LogsCommand # noqa
-from mlt.commands.events import EventsCommand  # noqa
@@ -23,11 +23,12 @@ import sys
 import time
 import uuid
 from termcolor import colored
-from watchdog.observers import Observer
 
+from mlt.build_scheduler import BuildScheduler
 from mlt.commands import Command
 from mlt.event_handler import EventHandler
-from mlt.utils import config_helpers, files, progress_bar, process_helpers
+from mlt.utils import (build_context, config_helpers, files, progress_bar,
+                       process_helpers, profile_helpers, run_history)
 
 
 class BuildCommand(Command):
@@ -41,44 +42,103 @@ class BuildCommand(Command):
         """
         self._watch_and_build() if self.args['--watch'] else self._build()
 
-    def _build(self):
-        last_build_duration = files.fetch_action_arg(
-            'build', 'last_build_duration')
+    def _build(self, cancelled=None):
+        """builds the image; when the `cancelled` Event gets set while
+           building, the build is stopped and nothing is recorded
+        """
+        build_durations = self._build_durations()
 
         started_build_time = time.time()
 
-        container_name = "{}:{}".format(self.config['name'], uuid.uuid4())
+        # nothing in the build context changed, so the last image is
+        # exactly what a new build would produce
+        with profile_helpers.span('context digest', 'phase'):
+            context_digest = build_context.context_digest()
+        last_container = files.fetch_action_arg('build', 'last_container')
+        if context_digest == files.fetch_action_arg(
+                'build', 'context_digest') and \
+                self._image_exists(last_container):
+            print("Build context unchanged, using {}".format(last_container))
+            return
+
+        image_id = str(uuid.uuid4())
+        container_name = "{}:{}".format(self.config['name'], image_id)
         print("Starting build {}".format(container_name))
 
-        # Add bar
-        build_process = process_helpers.run_popen(
-            "CONTAINER_NAME={} make build".format(container_name),
-            shell=True)
+        def record(outcome):
+            run_history.record(
+                'build', image_id, started_build_time, outcome,
+                time.time() - started_build_time, image=container_name,
+                context_digest=context_digest)
 
+        build_output = progress_bar.OutputProgress()
+        build_process = process_helpers.StreamingProcess(
+            "CONTAINER_NAME={} make build".format(container_name),
+            shell=True, on_stdout=build_output.feed,
+            # BuildKit reports its progress on stderr
+            on_stderr=build_output.feed, on_exit=build_output.close)
         progress_bar.duration_progress(
-            'Building', last_build_duration,
-            lambda: build_process.poll() is not None)
-        if build_process.poll() != 0:
+            'Building', progress_bar.estimate_duration(build_durations),
+            lambda: build_process.poll() is not None or
+            (cancelled is not None and cancelled.is_set()),
+            build_output)
+        if cancelled is not None and cancelled.is_set():
+            build_process.terminate()
+            build_process.wait()
+            record('cancelled')
+            print("Cancelled build {}".format(container_name))
+            return
+        if build_process.wait() != 0:
+            record('failed')
             # When we have an error, get the stdout and error output
             # and display them both with the error output in red.
-            output, error_msg = build_process.communicate()
-            print(output.decode("utf-8"))
-            print(colored(error_msg.decode("utf-8"), 'red'))
+            print(build_process.stdout_text())
+            print(colored(build_process.stderr_text(), 'red'))
             sys.exit(1)
 
-        built_time = time.time()
+        build_duration = time.time() - started_build_time
+        record('success')
 
         # Write last container to file
-        with open('.build.json', 'w') as f:
-            f.write(json.dumps({
+        with files.state_lock():
+            files.write_atomic('.build.json', json.dumps({
                 "last_container": container_name,
-                "last_build_duration": built_time - started_build_time
+                "last_build_duration": build_duration,
+                "build_durations": progress_bar.add_duration(
+                    build_durations, build_duration),
+                "context_digest": context_digest
             }))
 
         print("Built {}".format(container_name))
 
+    @staticmethod
+    def _build_durations():
+        """recent build durations, for estimating how long a build takes"""
+        durations = run_history.durations(
+            'build', progress_bar.DURATION_HISTORY_SIZE)
+        if durations:
+            return durations
+        # apps built before we kept a run history
+        durations = files.fetch_action_arg('build', 'build_durations')
+        if durations is None:
+            last_build_duration = files.fetch_action_arg(
+                'build', 'last_build_duration')
+            durations = [] if last_build_duration is None \
+                else [last_build_duration]
+        return durations
+
+    @staticmethod
+    def _image_exists(container_name):
+        return container_name is not None and \
+            process_helpers.StreamingProcess(
+                ["docker", "image", "inspect", container_name]).wait() == 0
+
     def _watch_and_build(self):
-        event_handler = EventHandler(self._build)
+        # watchdog is only needed in watch mode
+        from watchdog.observers import Observer
+
+        scheduler = BuildScheduler(self._build)
+        event_handler = EventHandler(scheduler.schedule)
         observer = Observer()
         observer.schedule(event_handler, './', recursive=True)
         observer.start()
@@ -19,7 +19,6 @@
 #
 
 import sys
-from tabulate import tabulate
 
 from mlt.commands import Command
 from mlt.utils import config_helpers, constants
@@ -57,6 +56,7 @@ class ConfigCommand(Command):
                 config_list.append([config_name, self.config[config_name]])
 
         if config_list:
+            from tabulate import tabulate
             print(tabulate(config_list, headers=['Parameter Name', 'Value']))
         else:
             print("No configuration parameters to display.")
@@ -17,20 +17,49 @@
 #
 # SPDX-License-Identifier: EPL-2.0
 #
+import copy
 import json
 import os
+import shutil
 import sys
 import time
 import uuid
 import yaml
+from collections import OrderedDict
 from string import Template
-from subprocess import Popen, PIPE
 from termcolor import colored
 
 from mlt.commands import Command
-from mlt.utils import (build_helpers, config_helpers, files,
-                       kubernetes_helpers, progress_bar,
-                       process_helpers, log_helpers)
+from mlt.utils import (build_helpers, concurrency_helpers, config_helpers,
+                       constants, files, kubernetes_client, kubernetes_helpers,
+                       manifest_helpers, progress_bar, process_helpers,
+                       log_helpers, profile_helpers, registry_helpers,
+                       run_history,
+                       sweep_helpers)
+
+# seconds we wait before re-opening a pod watch the API server ended, this
+# doubles every time up to the max
+WATCH_BACKOFF = 0.5
+MAX_WATCH_BACKOFF = 4
+
+# what `mlt deploy` does while the image is pushed
+PREFLIGHT_PHASES = ('crd check', 'namespace', 'render')
+
+# the dir in a run's dir with just the manifests that changed since the
+# live run, when some didn't
+CHANGED_DIR = 'changed'
+
+# runs of a sweep applied at the same time, unless --concurrency says
+SWEEP_CONCURRENCY = 4
+
+# seconds we wait before checking again whether the resource quotas of the
+# namespace allow the next runs of a sweep
+QUOTA_POLL = 5
+
+# reasons a container waits for that it won't get out of on its own
+CONTAINER_FAILURES = ('ErrImagePull', 'ImagePullBackOff', 'InvalidImageName',
+                      'ErrImageNeverPull', 'CreateContainerConfigError',
+                      'CreateContainerError', 'CrashLoopBackOff')
 
 
 class DeployCommand(Command):
@@ -40,129 +69,488 @@ class DeployCommand(Command):
         build_helpers.verify_build(self.args)
 
     def action(self):
-        skip_crd_check = self.args['--skip-crd-check']
-        if not skip_crd_check:
-            kubernetes_helpers.check_crds(exit_on_failure=True)
+        if self.args.get('--refresh-cache'):
+            kubernetes_helpers.ClusterChecks().forget()
+        self.namespace = self.config['namespace']
+        self._start_run()
+        # the run that is live now, before the push rewrites `.push.json`
+        self.live_run = dict(
+            (key, files.fetch_action_arg('push', key))
+            for key in ('app_run_id', 'app_run_objects',
+                        'app_run_api_versions', 'app_run_hashes',
+                        'app_run_renders'))
 
         if self.args['--no-push']:
-            print("Skipping image push")
+            remote_container_name = self._last_remote_container_name()
         else:
-            self._push()
+            remote_container_name = self._set_container_names()
+        if self.args.get('--sweep'):
+            self._sweep(remote_container_name)
+            return
+        if self.args.get('--dry-run'):
+            self._dry_run(remote_container_name)
+            return
 
-        self._deploy_new_container()
+        if self.args['--no-push']:
+            print("Skipping image push")
+        print("Deploying {}".format(remote_container_name))
+
+        try:
+            # nothing before the apply needs the image to be in the
+            # registry, so it all happens while we push
+            preflight = concurrency_helpers.BackgroundCall(
+                self._preflight, remote_container_name)
+            if not self.args['--no-push']:
+                self._timed('push', self._push, preflight)
+            manifests = preflight.wait()
+
+            unchanged = self._unchanged_manifests(manifests)
+            if manifests and len(unchanged) == len(manifests):
+                self._keep_live_run(remote_container_name)
+            else:
+                self._deploy_new_container(manifests, unchanged,
+                                           remote_container_name)
+        except BaseException:
+            if not self.deploy_recorded:
+                self._record_deploy('failed', remote_container_name)
+            raise
 
         if self.args["--logs"]:
             self._tail_logs()
 
-    def _push(self):
-        last_push_duration = files.fetch_action_arg(
-            'push', 'last_push_duration')
+    def _start_run(self, labels=None):
+        """gives the deploy a new run id, labelled with `labels` too"""
+        self.phase_durations = OrderedDict()
+        self.started_deploy_time = time.time()
+        self.app_run_id = str(uuid.uuid4())
+        self.run_labels = dict(kubernetes_helpers.run_labels(
+            self.config['name'], self.app_run_id), **(labels or {}))
+        self.run_objects = []
+        self.run_api_versions = {}
+        # every run renders into a dir of its own, so deploys running side
+        # by side in the same app don't apply each other's manifests
+        self.rendered_dir = os.path.join(constants.RENDERED_DIR,
+                                         self.app_run_id)
+        self.apply_dir = self.rendered_dir
+        self.deploy_recorded = False
+
+    def _preflight(self, remote_container_name):
+        """checks the cluster and renders the templates, returns the
+           manifests of the rendered objects
+        """
+        self._check_cluster()
+
+        # do template substitution across everything in `k8s-templates` dir
+        # replaces things with $ with the vars from template.substitute
+        # also patches deployment if interactive mode is set
+        return self._timed('render', self._render_templates,
+                           remote_container_name, self.config['name'],
+                           self.app_run_id)
+
+    def _check_cluster(self):
+        if not self.args['--skip-crd-check']:
+            self._timed('crd check', kubernetes_helpers.check_crds,
+                        exit_on_failure=True)
+        self._timed('namespace', kubernetes_helpers.ensure_namespace_exists,
+                    self.namespace)
+
+    def _sweep(self, remote_container_name):
+        """deploys a run per point of the `--sweep` spec. The image is
+           pushed once, then up to `--concurrency` runs are applied at a
+           time, as many as the resource quotas of the namespace allow.
+        """
+        if self.args['--interactive'] or self.args['--logs']:
+            raise ValueError("A sweep can't be deployed interactively or "
+                             "tail logs, use `mlt logs --run=<run_id>` for "
+                             "the logs of one of its runs.")
+        points = sweep_helpers.points(
+            sweep_helpers.load_spec(self.args['--sweep']))
+        if self.args.get('--dry-run'):
+            for point in points:
+                print(sweep_helpers.describe(point))
+            return
+        concurrency = int(self.args.get('--concurrency') or
+                          SWEEP_CONCURRENCY)
+        sweep_id = str(uuid.uuid4())
+
+        if self.args['--no-push']:
+            print("Skipping image push")
+        print("Deploying {} runs of sweep {} with {}".format(
+            len(points), sweep_id, remote_container_name))
+        started = time.time()
+        checks = concurrency_helpers.BackgroundCall(self._check_cluster)
+        if not self.args['--no-push']:
+            self._timed('push', self._push, checks)
+        checks.wait()
+
+        runs = [self._sweep_run(point, sweep_id, remote_container_name)
+                for point in points]
+        failed = self._deploy_sweep_runs(runs, concurrency)
+        deployed = [run for run in runs if run not in failed]
+        if deployed:
+            self._update_app_run_id(deployed[-1].app_run_id,
+                                    deployed[-1].run_objects,
+                                    deployed[-1].run_api_versions)
+        self._prune_rendered_runs()
+
+        print("Deployed {} of {} runs in {:.2f}s, see them with "
+              "`kubectl get all --namespace={} -l {}={}`".format(
+                  len(deployed), len(runs), time.time() - started,
+                  self.namespace, kubernetes_helpers.SWEEP_LABEL, sweep_id))
+        if failed:
+            sys.exit(1)
+
+    def _sweep_run(self, point, sweep_id, remote_container_name):
+        """a deploy of its own for a point of the sweep, rendered"""
+        run = copy.copy(self)
+        run.sweep_point = point
+        run.sweep_id = sweep_id
+        run.config = dict(self.config)
+        run.config[constants.TEMPLATE_PARAMETERS] = dict(
+            config_helpers.get_template_parameters(self.config), **point)
+        run._start_run({kubernetes_helpers.SWEEP_LABEL: sweep_id})
+        run.manifests = run._timed(
+            'render', run._render_templates, remote_container_name,
+            run.config['name'], run.app_run_id)
+        run.remote_container_name = remote_container_name
+        return run
+
+    def _deploy_sweep_runs(self, runs, concurrency):
+        """applies the runs in order, waiting whenever the next one doesn't
+           fit the resource quotas; returns the runs that failed
+        """
+        headroom = kubernetes_helpers.quota_headroom(self.namespace)
+        usage = dict((run.app_run_id, _quota_usage(run.manifests))
+                     for run in runs) if headroom else {}
+        for run in runs:
+            for resource, count in usage.get(run.app_run_id, {}).items():
+                if resource in headroom and count > headroom[resource][0]:
+                    raise ValueError(
+                        "A run of the sweep needs {} {} but the resource "
+                        "quota of namespace {} allows {}".format(
+                            count, resource, self.namespace,
+                            headroom[resource][0]))
+
+        failed = []
+        pending = list(runs)
+        left = dict((resource, limits[1])
+                    for resource, limits in headroom.items())
+        while pending:
+            batch = []
+            for run in pending:
+                needs = usage.get(run.app_run_id, {})
+                if any(needs.get(resource, 0) > count
+                       for resource, count in left.items()):
+                    break
+                for resource in left:
+                    left[resource] -= needs.get(resource, 0)
+                batch.append(run)
+            if not batch:
+                print("Waiting for the resource quota of namespace {} to "
+                      "allow the next {} run(s)".format(self.namespace,
+                                                        len(pending)))
+                with profile_helpers.span('quota', 'wait'):
+                    time.sleep(QUOTA_POLL)
+                    left = dict((resource, limits[1]) for resource, limits in
+                                kubernetes_helpers.quota_headroom(
+                                    self.namespace).items())
+                continue
+            pending = pending[len(batch):]
+            deployed = concurrency_helpers.parallel_map(
+                lambda run: run._deploy_sweep_run(), batch,
+                max_workers=concurrency)
+            failed.extend(run for run, ok in zip(batch, deployed) if not ok)
+        return failed
+
+    def _deploy_sweep_run(self):
+        """applies the run, returns whether that worked"""
+        self._write_manifests(self.manifests)
+        apply_process = self._apply()
+        ok = self._timed('apply', apply_process.wait) == 0
+        if ok:
+            print("Deployed run {} ({}) in {:.2f}s".format(
+                self.app_run_id, sweep_helpers.describe(self.sweep_point),
+                apply_process.duration))
+        else:
+            print(colored("Run {} ({}) failed: {}".format(
+                self.app_run_id, sweep_helpers.describe(self.sweep_point),
+                apply_process.stderr_text()), 'red'))
+        self._record_deploy('success' if ok else 'failed',
+                            self.remote_container_name,
+                            sweep=self.sweep_id, point=self.sweep_point)
+        return ok
+
+    def _timed(self, phase, func, *args, **kwargs):
+        """calls `func`, recording how long it took as `phase`"""
+        started = time.time()
+        try:
+            with profile_helpers.span(phase, 'phase'):
+                return func(*args, **kwargs)
+        finally:
+            self.phase_durations[phase] = time.time() - started
+
+    def _unchanged_manifests(self, manifests):
+        """the keys of the manifests that are the same in the live run, of
+           all of them when the deploy is the same as the live run; those
+           named after the run are only unchanged in the latter case.
+           Interactive deploys patch the templates so always change.
+        """
+        live_hashes = self.live_run['app_run_hashes']
+        if self.args.get('--force') or self.args['--interactive'] or \
+                not isinstance(live_hashes, dict):
+            return set()
+        unchanged = set(manifest['key'] for manifest in manifests
+                        if live_hashes.get(manifest['key']) ==
+                        manifest['hash'])
+        if len(unchanged) == len(manifests):
+            return unchanged
+        return set(key for key in unchanged
+                   if not manifest_helpers.is_per_run(key))
+
+    def _keep_live_run(self, remote_container_name):
+        """nothing to apply, the live run stays the latest one"""
+        print("Nothing changed since run {}, skipping apply. Use --force "
+              "to apply anyway.".format(self.live_run['app_run_id']))
+        # a push of an image no template uses rewrote `.push.json`
+        self._update_app_run_id(
+            self.live_run['app_run_id'], self.live_run['app_run_objects'],
+            self.live_run['app_run_api_versions'],
+            self.live_run['app_run_hashes'], self.live_run['app_run_renders'])
+        self.run_objects = []
+        self._record_deploy('unchanged', remote_container_name,
+                            live_run=self.live_run['app_run_id'])
+
+    def _dry_run(self, remote_container_name):
+        """prints how the manifests of a deploy would differ from the live
+           ones, without pushing or applying anything
+        """
+        manifests = self._render_templates(
+            remote_container_name, self.config['name'], self.app_run_id)
+        live = {}
+        for key in self.live_run['app_run_renders'] or []:
+            for manifest in manifest_helpers.load(key) or []:
+                live[manifest['key']] = manifest['text']
+        # the manifests of the live run may no longer be cached
+        live_hashes = self.live_run['app_run_hashes'] or {}
+        for manifest in manifests:
+            if manifest['key'] in live_hashes and \
+                    manifest['key'] not in live:
+                live[manifest['key']] = manifest['text'] if \
+                    live_hashes[manifest['key']] == manifest['hash'] else \
+                    "# the live manifest is no longer cached\n"
+
+        changes = manifest_helpers.diff(live, dict(
+            (manifest['key'], manifest['text']) for manifest in manifests))
+        if changes:
+            sys.stdout.write(changes)
+        elif self.live_run['app_run_id']:
+            print("Nothing changed since run {}".format(
+                self.live_run['app_run_id']))
+
+    def _record_deploy(self, outcome, remote_container_name, **details):
+        """adds the deploy to the run history"""
+        self.deploy_recorded = True
+        run_history.record(
+            'deploy', self.app_run_id, self.started_deploy_time, outcome,
+            time.time() - self.started_deploy_time,
+            image=remote_container_name,
+            digest=files.fetch_action_arg('push', 'last_pushed_digest'),
+            app=self.config['name'], namespace=self.namespace,
+            parameters=config_helpers.get_template_parameters(self.config),
+            phases=self.phase_durations, objects=self.run_objects,
+            api_versions=self.run_api_versions, **details)
+
+    def _print_phase_durations(self, duration):
+        pushed = 'push' in self.phase_durations
+        print("Deployed in {:.2f}s".format(duration))
+        for phase, phase_duration in self.phase_durations.items():
+            note = " (while pushing)" if pushed and \
+                phase in PREFLIGHT_PHASES else ""
+            print("  {:<10} {:>7.2f}s{}".format(phase, phase_duration, note))
+
+    def _last_remote_container_name(self):
+        remote_container_name = files.fetch_action_arg(
+            'push', 'last_remote_container')
+        if remote_container_name is None:
+            raise ValueError("No image found to deploy with. Run a plain "
+                             "`mlt deploy` to fix this. Most common reason "
+                             "for this is a --no-push was used before "
+                             "any image was available to use.")
+        return remote_container_name
+
+    def _set_container_names(self):
+        """the image of the last build, and the name it gets pushed as"""
         self.container_name = files.fetch_action_arg(
             'build', 'last_container')
 
-        self.started_push_time = time.time()
         # TODO: unify these commands by factoring out docker command
         # based on config
+        if 'gceProject' in self.config:
+            self.remote_container_name = "gcr.io/{}/{}".format(
+                self.config['gceProject'], self.container_name)
+        else:
+            self.remote_container_name = "{}/{}".format(
+                self.config['registry'], self.container_name)
+        return self.remote_container_name
+
+    def _push(self, preflight=None):
+        """pushes the image; if the `preflight` running meanwhile fails,
+           nothing will be deployed, so the push stops and its error is
+           raised right away
+        """
+        push_durations = run_history.durations(
+            'push', progress_bar.DURATION_HISTORY_SIZE) or \
+            files.fetch_action_arg('push', 'push_durations')
+        if push_durations is None:
+            last_push_duration = files.fetch_action_arg(
+                'push', 'last_push_duration')
+            push_durations = [] if last_push_duration is None \
+                else [last_push_duration]
+
+        if self._already_pushed():
+            print("{} is already in the registry, skipping image "
+                  "push".format(self.remote_container_name))
+            return
+
+        self.started_push_time = time.time()
+        self._tag()
+        self.push_output = progress_bar.OutputProgress()
         if 'gceProject' in self.config:
             self._push_gke()
         else:
             self._push_docker()
 
+        def preflight_failed():
+            return preflight is not None and preflight.failed()
+
         progress_bar.duration_progress(
-            'Pushing ', last_push_duration,
-            lambda: self.push_process.poll() is not None)
+            'Pushing ', progress_bar.estimate_duration(push_durations),
+            lambda: self.push_process.poll() is not None or
+            preflight_failed(), self.push_output)
+
+        image_id = self.container_name.rsplit(':', 1)[-1]
+        if preflight_failed() and self.push_process.poll() is None:
+            self.push_process.terminate()
+            self.push_process.wait()
+            run_history.record('push', image_id, self.started_push_time,
+                               'cancelled',
+                               time.time() - self.started_push_time,
+                               image=self.remote_container_name)
+            print("Stopped pushing {}".format(self.remote_container_name))
+            preflight.wait()
 
         # If the push fails, get the stdout and error message and display them
         # to the user, with the error message in red.
-        if self.push_process.poll() != 0:
-            push_stdout, push_error = self.push_process.communicate()
-            print(push_stdout.decode("utf-8"))
-            print(colored(push_error.decode("utf-8"), 'red'))
+        if self.push_process.wait() != 0:
+            run_history.record('push', image_id, self.started_push_time,
+                               'failed', time.time() - self.started_push_time,
+                               image=self.remote_container_name)
+            print(self.push_process.stdout_text())
+            print(colored(self.push_process.stderr_text(), 'red'))
             sys.exit(1)
 
-        with open('.push.json', 'w') as f:
-            f.write(json.dumps({
+        push_duration = time.time() - self.started_push_time
+        pushed_digest = registry_helpers.pushed_digest(
+            self.push_process.stdout_text())
+        run_history.record('push', image_id, self.started_push_time,
+                           'success', push_duration,
+                           image=self.remote_container_name,
+                           digest=pushed_digest)
+        with files.state_lock():
+            files.write_atomic('.push.json', json.dumps({
                 "last_remote_container": self.remote_container_name,
-                "last_push_duration": time.time() - self.started_push_time
+                "last_push_duration": push_duration,
+                "push_durations": progress_bar.add_duration(
+                    push_durations, push_duration),
+                "last_pushed_digest": pushed_digest
             }))
 
         print("Pushed to {}".format(self.remote_container_name))
 
+    @profile_helpers.traced('phase', 'registry check')
+    def _already_pushed(self):
+        """image tags are unique per build, so if we pushed this exact
+           image before we only need the registry to confirm that it still
+           has it under the digest we pushed
+        """
+        if self.remote_container_name != files.fetch_action_arg(
+                'push', 'last_remote_container'):
+            return False
+        pushed_digest = files.fetch_action_arg('push', 'last_pushed_digest')
+        registry_digest = registry_helpers.manifest_digest(
+            self.remote_container_name)
+        if registry_digest is None:
+            # the registry wouldn't tell us (usually it needs auth), so
+            # trust that our last push is still there
+            return True
+        return bool(pushed_digest) and registry_digest == pushed_digest
+
     def _push_gke(self):
-        self.remote_container_name = "gcr.io/{}/{}".format(
-            self.config['gceProject'], self.container_name)
-        self._tag()
-        self.push_process = Popen(["gcloud", "docker", "--", "push",
-                                   self.remote_container_name],
-                                  stdout=PIPE, stderr=PIPE)
+        self._start_push(["gcloud", "docker", "--", "push",
+                          self.remote_container_name])
 
     def _push_docker(self):
-        self.remote_container_name = "{}/{}".format(
-            self.config['registry'], self.container_name)
-        self._tag()
-        self.push_process = Popen(
-            ["docker", "push", self.remote_container_name],
-            stdout=PIPE, stderr=PIPE)
+        self._start_push(["docker", "push", self.remote_container_name])
+
+    def _start_push(self, command):
+        self.push_process = process_helpers.StreamingProcess(
+            command, on_stdout=self.push_output.feed,
+            on_exit=self.push_output.close)
 
+    @profile_helpers.traced('phase')
     def _tag(self):
         process_helpers.run(
             ["docker", "tag", self.container_name, self.remote_container_name])
 
     @staticmethod
-    def _update_app_run_id(app_run_id):
-        with open('.push.json', 'r+') as json_file:
-            data = json.load(json_file)
+    def _update_app_run_id(app_run_id, run_objects=None, api_versions=None,
+                           hashes=None, renders=None):
+        """records the run id, the `Kind/name` of the objects the run
+           deployed, the apiVersion of each of their kinds and the hashes
+           and render cache keys of their manifests in `.push.json`
+        """
+        with files.state_lock():
+            with open('.push.json', 'r') as json_file:
+                data = json.load(json_file)
             data['app_run_id'] = app_run_id
-            json_file.seek(0)
-            json.dump(data, json_file, indent=2)
-            json_file.truncate()
-
-    def _deploy_new_container(self):
-        """Substitutes image, app, run data into k8s-template selected.
+            data['app_run_objects'] = run_objects or []
+            data['app_run_api_versions'] = api_versions or {}
+            data['app_run_hashes'] = hashes or {}
+            data['app_run_renders'] = renders or []
+            files.write_atomic('.push.json', json.dumps(data, indent=2))
+
+    def _deploy_new_container(self, manifests, unchanged,
+                              remote_container_name):
+        """Applies the manifests that changed since the live run.
            Can also launch user into interactive shell with --interactive flag
         """
-        app_name = self.config['name']
-        self.namespace = self.config['namespace']
-        remote_container_name = files.fetch_action_arg(
-            'push', 'last_remote_container')
-        if remote_container_name is None:
-            raise ValueError("No image found to deploy with. Run a plain "
-                             "`mlt deploy` to fix this. Most common reason "
-                             "for this is a --no-push was used before "
-                             "any image was available to use.")
-
-        print("Deploying {}".format(remote_container_name))
-        kubernetes_helpers.ensure_namespace_exists(self.namespace)
-
-        # do template substitution across everything in `k8s-templates` dir
-        # replaces things with $ with the vars from template.substitute
-        # also patches deployment if interactive mode is set
-        self.interactive_deployment_found = False
-        app_run_id = str(uuid.uuid4())
-        for path, dirs, filenames in os.walk("k8s-templates"):
-            self.file_count = len(filenames)
-            for filename in filenames:
-                with open(os.path.join(path, filename)) as f:
-                    template = Template(f.read())
-                out = template.substitute(
-                    image=remote_container_name,
-                    app=app_name, run=app_run_id,
-                    **config_helpers.get_template_parameters(self.config))
-
-                interactive, out = self._check_for_interactive_deployment(
-                    out, filename)
-                self._apply_template(out, filename)
-                if interactive:
-                    interactive_podname = self._get_most_recent_podname()
-
-            print("\nInspect created objects by running:\n"
-                  "$ kubectl get --namespace={} all\n".format(self.namespace))
-
-        self._update_app_run_id(app_run_id)
+        for key in sorted(unchanged):
+            print("{} is unchanged since run {}".format(
+                key, self.live_run['app_run_id']))
+        # the run's dir has all of its objects, so undeploying the run
+        # deletes the unchanged ones too
+        filenames = self._write_manifests(manifests)
+        if unchanged:
+            self.apply_dir = os.path.join(self.rendered_dir, CHANGED_DIR)
+            filenames = self._write_manifests(
+                [manifest for manifest in manifests
+                 if manifest['key'] not in unchanged], self.apply_dir)
+        self._timed('apply', self._apply_templates, filenames)
+        self._prune_rendered_runs()
+
+        print("\nInspect created objects by running:\n"
+              "$ kubectl get --namespace={} all\n".format(self.namespace))
+
+        self._update_app_run_id(
+            self.app_run_id, self.run_objects, self.run_api_versions,
+            dict((manifest['key'], manifest['hash'])
+                 for manifest in manifests), self.render_keys)
+        self._record_deploy('success', remote_container_name)
+        self._print_phase_durations(time.time() - self.started_deploy_time)
         # After everything is deployed we'll make a kubectl exec
         # call into our debug container if interactive mode
         if self.args["--interactive"] and self.interactive_deployment_found:
-            self._exec_into_pod(interactive_podname)
+            self._exec_into_pod()
         elif not self.interactive_deployment_found and \
                 self.args['--interactive']:
             raise ValueError("Unable to find deployment to run interactively. "
@@ -187,32 +575,142 @@ class DeployCommand(Command):
                 self.interactive_deployment_found = True
         return interactive, data
 
-    def _apply_template(self, out, filename):
-        """take k8s-template data and create deployment in k8s dir"""
-        with open(os.path.join('k8s', filename), 'w') as f:
-            f.write(out)
-        process_helpers.run(
+    def _render_templates(self, remote_container_name, app_name,
+                          app_run_id):
+        """renders every file in `k8s-templates`, returns the manifests of
+           the objects in them. Renders of templates that didn't change,
+           with the same image and parameters, come from the cache.
+        """
+        template_parameters = config_helpers.get_template_parameters(
+            self.config)
+        self.interactive_deployment_found = False
+        self.render_keys = []
+        manifests = []
+        for path, dirs, filenames in os.walk("k8s-templates"):
+            self.file_count = len(filenames)
+            for filename in filenames:
+                with profile_helpers.span(filename, 'render'):
+                    rendered = self._render_template(
+                        os.path.join(path, filename), remote_container_name,
+                        app_name, app_run_id, template_parameters)
+                for manifest in rendered:
+                    manifest['filename'] = filename
+                manifests.extend(rendered)
+
+        for manifest in manifests:
+            self.run_objects.append(
+                manifest_helpers.for_run(manifest['key'], app_run_id))
+            self.run_api_versions[manifest['kind']] = \
+                manifest['api_version']
+        return manifests
+
+    def _render_template(self, path, remote_container_name, app_name,
+                         app_run_id, template_parameters):
+        """the manifests of the objects in the template at `path`"""
+        filename = os.path.basename(path)
+        with open(path) as f:
+            template = f.read()
+        # interactive deploys patch what they render
+        key = None if self.args['--interactive'] else \
+            manifest_helpers.render_key(
+                filename, template, image=remote_container_name,
+                app=app_name, parameters=template_parameters,
+                labels=dict(
+                    (name, manifest_helpers.normalize(value, app_run_id))
+                    for name, value in self.run_labels.items()))
+        rendered = manifest_helpers.load(key) if key else None
+        if rendered is None:
+            out = Template(template).substitute(
+                image=remote_container_name,
+                app=app_name, run=app_run_id,
+                **template_parameters)
+
+            _, out = self._check_for_interactive_deployment(out, filename)
+            rendered = self._label_objects(out)
+            if key:
+                manifest_helpers.store(key, rendered)
+        if key:
+            self.render_keys.append(key)
+        return rendered
+
+    def _label_objects(self, data):
+        """stamps the run labels on every object of a rendered template,
+           so the run can be found with a label selector later on, returns
+           their manifests. Objects shared by all runs (not named after
+           the run) only get the app label: they are only applied when
+           they change, and undeploying an earlier run must not take them
+           from the live one.
+        """
+        manifests = []
+        for obj in yaml.safe_load_all(data):
+            if obj:
+                shared = not manifest_helpers.is_per_run(
+                    manifest_helpers.object_key(obj, self.app_run_id)) and \
+                    not self.args['--interactive']
+                kubernetes_helpers.add_labels(obj, {
+                    kubernetes_helpers.APP_LABEL: self.config['name']}
+                    if shared else self.run_labels)
+                manifests.append(manifest_helpers.manifest(
+                    obj, yaml.safe_dump(obj, default_flow_style=False),
+                    self.app_run_id))
+        return manifests
+
+    def _write_manifests(self, manifests, rendered_dir=None):
+        """writes the manifests into the run's dir in `k8s` (or
+           `rendered_dir`), a file per template, returns the filenames
+        """
+        rendered_dir = rendered_dir or self.rendered_dir
+        os.makedirs(rendered_dir)
+        rendered = OrderedDict()
+        for manifest in manifests:
+            rendered.setdefault(manifest['filename'], []).append(
+                manifest_helpers.for_run(manifest['text'], self.app_run_id))
+        for filename, objects in rendered.items():
+            with open(os.path.join(rendered_dir, filename), 'w') as f:
+                f.write('---\n'.join(objects))
+        return list(rendered)
+
+    def _apply_templates(self, filenames):
+        """applies all rendered templates of the run with a single
+           `kubectl apply`, reporting how long each object took to apply
+        """
+        print("Applying {} template(s)".format(len(filenames)))
+        started_apply_time = time.time()
+
+        # kubectl reports each object as soon as it has been applied, so
+        # the time a line shows up is the time that object took
+        def show_applied(line):
+            print("{} ({:.2f}s)".format(
+                line.strip(), time.time() - started_apply_time))
+
+        apply_process = self._apply(on_stdout=show_applied)
+        if apply_process.wait() != 0:
+            print(colored(apply_process.stderr_text(), 'red'))
+            sys.exit(1)
+
+        print("Applied in {:.2f}s".format(apply_process.duration))
+
+    def _apply(self, on_stdout=None):
+        """starts a `kubectl apply` of what changed in the run"""
+        return process_helpers.StreamingProcess(
             ["kubectl", "--namespace", self.namespace,
-             "apply", "-R", "-f", "k8s"])
+             "apply", "-f", self.apply_dir], on_stdout=on_stdout)
 
-    def _get_most_recent_podname(self):
-        """don't know of a better way to do this; grab the pod
-           created by the job we just deployed
-           this gets the most recent pod by name, so we can exec
-           into it once everything is done deploying
+    @staticmethod
+    def _prune_rendered_runs():
+        """removes all but the latest `RENDERED_RUNS_KEPT` run dirs from
+           `k8s`; a deploy still going on is among the latest ones
         """
-        pod = process_helpers.run_popen(
-            "kubectl get pods --namespace {} ".format(
-                self.namespace) +
-            "--sort-by=.status.startTime", shell=True
-        ).stdout.read().decode('utf-8').strip().splitlines()
-        if pod:
-            # we want last pod listed, podname is always first
-            return pod[-1].split()[0]
-        else:
-            raise ValueError(
-                "No pods found in namespace: {}".format(
-                    self.namespace))
+        with files.state_lock():
+            try:
+                runs = [os.path.join(constants.RENDERED_DIR, name)
+                        for name in os.listdir(constants.RENDERED_DIR)]
+            except OSError:
+                return
+            runs = sorted((path for path in runs if os.path.isdir(path)),
+                          key=os.path.getmtime, reverse=True)
+            for path in runs[constants.RENDERED_RUNS_KEPT:]:
+                shutil.rmtree(path, ignore_errors=True)
 
     def _patch_template_spec(self, data):
         """Makes `command` of template yaml `sleep infinity`.
@@ -236,7 +734,9 @@ class DeployCommand(Command):
                              "spec. Unable to deploy interactively without "
                              "these.")
 
-        self.template_location['metadata'] = {'labels': {'debug': 'true'}}
+        metadata = self.template_location['metadata'] = \
+            self.template_location.get('metadata') or {}
+        metadata['labels'] = dict(metadata.get('labels') or {}, debug='true')
         self.containers_location[0].update(
             {'command':
              ["/bin/bash", "-c", "trap : TERM INT; sleep infinity & wait"]})
@@ -267,43 +767,87 @@ class DeployCommand(Command):
             for elem in data:
                 self._find_metadata_and_container_spec(elem)
 
-    def _exec_into_pod(self, podname):
-        """wait til pod comes up and then exec into it"""
+    def _exec_into_pod(self):
+        """wait til the debug pod comes up and then exec into it"""
         print("Connecting to pod...")
-        tries = 0
-        while True:
-            pod = process_helpers.run_popen(
-                "kubectl get pods --namespace {} {} -o json".format(
-                    self.namespace, podname),
-                shell=True).stdout.read().decode('utf-8')
-            if not pod:
-                continue
-
-            # check if pod is in running state
-            # gcr stores an auth token which could be returned as part
-            # of the pod json data
-            pod = json.loads(pod)
-            if pod.get('items') or pod.get('status'):
-                # if there's more than 1 thing returned, we have
-                # `pod['items']['status']` otherwise we will always have
-                # `pod['status'], so by the second if below we're safe
-                # first item is what we care about (or only item)
-                if pod.get('items'):
-                    pod = pod['items'][0]
-                if pod['status']['phase'] == 'Running':
-                    break
-
-            if tries == self.args['--retries']:
-                raise ValueError("Pod {} not Running".format(podname))
-            tries += 1
-            print("Retrying {}/{}".format(
-                tries, self.args['--retries']))
-            time.sleep(1)
+        timeout = self.args.get('--timeout')
+        podname = self._wait_for_pod(
+            constants.POD_TIMEOUT if timeout is None else timeout)
 
         # Get shell to the specified pod running in the user's namespace
         process_helpers.run_popen(
             ["kubectl", "exec", "-it", podname, "--namespace", self.namespace,
              "/bin/bash"], stdout=None, stderr=None).wait()
 
+    @profile_helpers.traced('wait', 'pod running')
+    def _wait_for_pod(self, timeout):
+        """watches the pods of the run for its debug pod, which the
+           controller may not even have created yet, until that pod is
+           Running and returns its name. Raises as soon as the pod can't
+           get there (image pull, scheduling or container failures) or
+           once `timeout` secs passed. The watch is re-opened, backing off,
+           should the API server end it early.
+        """
+        client = kubernetes_client.get_client()
+        selector = kubernetes_helpers.label_selector(
+            dict(self.run_labels, debug='true'))
+        deadline = time.time() + timeout
+        backoff = WATCH_BACKOFF
+        podname = None
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                if podname is None:
+                    raise ValueError("No pods found in namespace: {}".format(
+                        self.namespace))
+                raise ValueError("Pod {} not Running".format(podname))
+            try:
+                # lists the pods first, then watches from that listing on
+                for _, pod in client.watch(
+                        "/api/v1/namespaces/{}/pods".format(self.namespace),
+                        label_selector=selector, timeout=remaining):
+                    if podname is None:
+                        podname = pod['metadata']['name']
+                    elif pod['metadata']['name'] != podname:
+                        continue
+                    if pod['status'].get('phase') == 'Running':
+                        return podname
+                    failure = _pod_failure(pod)
+                    if failure:
+                        raise ValueError("Pod {} not Running: {}".format(
+                            podname, failure))
+            except kubernetes_client.ApiError as ex:
+                print("Retrying: {}".format(ex))
+            time.sleep(min(backoff, max(deadline - time.time(), 0)))
+            backoff = min(backoff * 2, MAX_WATCH_BACKOFF)
+
     def _tail_logs(self):
         log_helpers.call_logs(self.config, self.args)
+
+
+def _quota_usage(manifests):
+    """what applying `manifests` takes of the object count quotas"""
+    usage = {}
+    for manifest in manifests:
+        for resource, count in kubernetes_helpers.quota_usage(
+                yaml.safe_load(manifest['text'])).items():
+            usage[resource] = usage.get(resource, 0) + count
+    return usage
+
+
+def _pod_failure(pod):
+    """why `pod` won't be Running without someone stepping in, if it won't"""
+    status = pod['status']
+    if status.get('phase') in ('Succeeded', 'Failed'):
+        return "pod {}".format(status['phase'])
+    for condition in status.get('conditions') or []:
+        if condition.get('type') == 'PodScheduled' and \
+                condition.get('reason') == 'Unschedulable':
+            return condition.get('message') or 'Unschedulable'
+    for container in status.get('containerStatuses') or []:
+        waiting = (container.get('state') or {}).get('waiting') or {}
+        if waiting.get('reason') in CONTAINER_FAILURES:
+            if waiting.get('message'):
+                return "{}: {}".format(waiting['reason'], waiting['message'])
+            return waiting['reason']
+    return None
@@ -21,10 +21,23 @@
 import sys
 import json
 import os
+from threading import Event, Lock, Thread
 
 from mlt.commands import Command
-from mlt.utils import (process_helpers,
-                       config_helpers)
+from mlt.utils import (config_helpers, kubernetes_client,
+                       kubernetes_helpers, run_history)
+
+try:
+    import queue
+except ImportError:
+    # python 2
+    import Queue as queue
+
+EVENT_COLUMNS = ['LAST SEEN', 'TYPE', 'REASON', 'OBJECT', 'MESSAGE']
+
+# widths of the columns when we print events as they come, we can't
+# size them to the rows like `tabulate` does
+FOLLOW_COLUMN_WIDTHS = (10, 8, 24, 48)
 
 
 class EventsCommand(Command):
@@ -44,7 +57,9 @@ class EventsCommand(Command):
         and provides run-id to _get_event method to
         fetch events.
         """
-        if os.path.exists('.push.json'):
+        if self.args.get('--run'):
+            data = run_history.load_deployed_run(self.args['--run'])
+        elif os.path.exists('.push.json'):
             with open('.push.json', 'r') as f:
                 data = json.load(f)
         else:
@@ -58,44 +73,180 @@ class EventsCommand(Command):
             print("Please re-deploy app again, something went wrong.")
             sys.exit(1)
 
-        filter_tag = "-".join([self.config["name"],
-                               app_run_id[0],
-                               app_run_id[1]])
+        selector = kubernetes_helpers.label_selector(
+            kubernetes_helpers.run_labels(self.config["name"],
+                                          data['app_run_id']))
         namespace = self.config['namespace']
-        self._get_events(filter_tag, namespace)
+        self._get_events(RunEvents(namespace, selector,
+                                   data.get('app_run_objects') or []))
 
-    @staticmethod
-    def _get_events(filter_tag, namespace):
+    def _get_events(self, run_events):
         """
-         Fetches events
+         Prints the events of the run, and with `--follow` keeps printing
+         them as they happen until interrupted
         """
-        events_cmd = "kubectl get events --namespace {}".format(namespace)
+        follow = self.args.get('--follow')
         try:
-            events = process_helpers.run_popen(events_cmd, shell=True)
-            header_line = True
-            header = events.stdout.readline()
-            while True:
-                output = events.stdout.readline()
-                if output == '' and events.poll() is not None:
-                    error = events.stderr.readline()
-                    if error:
-                        raise Exception(error)
-                    break
-
-                if output is not '' and filter_tag in output:
-                    if header_line:
-                        print(header)
-                        header_line = False
-                    sys.stdout.write(output)
-                    sys.stdout.flush()
-
-            if header_line:
-                print("No events to display for this job")
-        except Exception as ex:
-            if 'command not found' in str(ex):
-                print("Please install `{}`. "
-                      "It is a prerequisite for `mlt events` "
-                      "to work".format(str(ex).split()[1]))
-            else:
-                print("Exception: {}".format(ex))
+            events = run_events.list()
+        except kubernetes_client.ApiError as ex:
+            print("Exception: {}".format(ex))
             sys.exit()
+
+        if self.args.get('--json'):
+            show = _print_json
+        elif follow:
+            print(_follow_row(EVENT_COLUMNS))
+            show = _print_row
+        else:
+            _print_table(events)
+            return
+
+        for event in events:
+            show(event)
+        if follow:
+            try:
+                run_events.follow(show)
+            except KeyboardInterrupt:
+                pass
+
+
+class RunEvents(object):
+    """The events of a run: those of the objects `mlt deploy` created, and
+       of the pods (found by their run labels) those created. Events carry
+       no labels, so we ask for the events of each object with a field
+       selector on the object it is about.
+    """
+    def __init__(self, namespace, selector, run_objects):
+        self.namespace = namespace
+        self.selector = selector
+        self.run_objects = list(run_objects)
+        self.client = kubernetes_client.get_client()
+        self.path = "/api/v1/namespaces/{}/events".format(namespace)
+        # what we already showed, so events aren't shown twice
+        self.seen = set()
+        self.queue = queue.Queue()
+        self.stopped = Event()
+        self.watched = set()
+        # the watch threads share `seen` and `watched`
+        self.lock = Lock()
+
+    def list(self):
+        """the events of the run so far, oldest first"""
+        pods = self.client.list(self._pods_path(),
+                                label_selector=self.selector)
+        involved = self.run_objects + [
+            "Pod/{}".format(pod['metadata']['name']) for pod in pods]
+        events = []
+        for involved_object in involved:
+            events.extend(self.client.list(
+                self.path,
+                field_selector=_involved_object_selector(involved_object)))
+        events = sorted(events, key=kubernetes_helpers.event_time)
+        self.seen.update(_event_key(event) for event in events)
+        return events
+
+    def follow(self, show):
+        """calls `show` with every new event of the run until `stop`.
+           Every object gets a watch of its own; pods the run creates
+           later are picked up by watching the pods of the run.
+        """
+        try:
+            for involved_object in self.run_objects:
+                self._watch_events(involved_object)
+            self._start(self._pods_path(), self._pod_changed,
+                        label_selector=self.selector)
+            while True:
+                event = self.queue.get()
+                if event is None:
+                    return
+                show(event)
+        finally:
+            self.stopped.set()
+
+    def stop(self):
+        self.queue.put(None)
+
+    def _pods_path(self):
+        return "/api/v1/namespaces/{}/pods".format(self.namespace)
+
+    def _pod_changed(self, event_type, pod):
+        if event_type != 'DELETED':
+            self._watch_events("Pod/{}".format(pod['metadata']['name']))
+
+    def _watch_events(self, involved_object):
+        with self.lock:
+            if involved_object in self.watched:
+                return
+            self.watched.add(involved_object)
+        self._start(self.path, self._event_changed,
+                    field_selector=_involved_object_selector(
+                        involved_object))
+
+    def _event_changed(self, event_type, event):
+        # events get DELETED once they expire, nothing happened then
+        if event_type == 'DELETED':
+            return
+        with self.lock:
+            if _event_key(event) in self.seen:
+                return
+            self.seen.add(_event_key(event))
+        self.queue.put(event)
+
+    def _start(self, path, on_change, **selectors):
+        thread = Thread(target=kubernetes_helpers.keep_watching,
+                        args=(path, on_change, self.stopped),
+                        kwargs=selectors)
+        thread.daemon = True
+        thread.start()
+
+
+def _row(event):
+    return [kubernetes_helpers.age(kubernetes_helpers.event_time(event)),
+            event.get('type', ''), event.get('reason', ''),
+            _involved_object(event), event.get('message', '').strip()]
+
+
+def _print_table(events):
+    if not events:
+        print("No events to display for this job")
+        return
+
+    from tabulate import tabulate
+    print(tabulate([_row(event) for event in events],
+                   headers=EVENT_COLUMNS, tablefmt="plain"))
+
+
+def _follow_row(row):
+    return " ".join(column.ljust(width) for column, width in
+                    zip(row, FOLLOW_COLUMN_WIDTHS)) + " " + row[-1]
+
+
+def _print_row(event):
+    print(_follow_row(_row(event)))
+    sys.stdout.flush()
+
+
+def _print_json(event):
+    """one event per line, as the API server sent it"""
+    print(json.dumps(event, sort_keys=True))
+    sys.stdout.flush()
+
+
+def _involved_object(event):
+    """the `Kind/name` of the object an event is about"""
+    return "{}/{}".format(event['involvedObject'].get('kind', ''),
+                          event['involvedObject'].get('name', ''))
+
+
+def _involved_object_selector(involved_object):
+    """the field selector for the events about a `Kind/name` object"""
+    kind, name = involved_object.split('/', 1)
+    return "involvedObject.kind={},involvedObject.name={}".format(kind, name)
+
+
+def _event_key(event):
+    """an event changes (its count and last time) every time it recurs"""
+    metadata = event['metadata']
+    return (metadata.get('uid') or metadata.get('name'),
+            metadata.get('resourceVersion'), event.get('count'),
+            kubernetes_helpers.event_time(event))
@@ -0,0 +1,80 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import json
+import sys
+
+from mlt.commands import Command
+from mlt.utils import config_helpers, run_history
+
+RUN_COLUMNS = ['RUN', 'ACTION', 'STARTED', 'DURATION', 'OUTCOME', 'IMAGE']
+
+
+class RunsCommand(Command):
+    def __init__(self, args):
+        super(RunsCommand, self).__init__(args)
+        # makes sure we're in an app dir, that's where the history is
+        self.config = config_helpers.load_config()
+
+    def action(self):
+        """lists the builds, pushes and deploys of the app or shows one"""
+        if self.args.get('show'):
+            self._show(self.args['<run_id>'])
+        else:
+            self._list(int(self.args.get('--limit') or 20))
+
+    def _list(self, limit):
+        runs = run_history.runs(limit=limit)
+        if not runs:
+            print("No runs recorded yet.")
+            return
+        from tabulate import tabulate
+        print(tabulate([[run['run_id'], run['action'],
+                         run_history.format_time(run['started']),
+                         _duration(run['duration']), run['outcome'],
+                         run['image'] or '']
+                        for run in runs],
+                       headers=RUN_COLUMNS, tablefmt="simple"))
+
+    def _show(self, run_id):
+        try:
+            runs = run_history.find(run_id)
+        except ValueError as ex:
+            print(ex)
+            sys.exit(1)
+        if not runs:
+            print("No run found with id {}.".format(run_id))
+            sys.exit(1)
+        for run in runs:
+            print("{} {} {} at {}, {}".format(
+                run['action'].capitalize(), run['run_id'], run['outcome'],
+                run_history.format_time(run['started']),
+                _duration(run['duration'])))
+            for key in ('image', 'digest'):
+                if run[key]:
+                    print("  {}: {}".format(key, run[key]))
+            for key, value in sorted(run['details'].items()):
+                if isinstance(value, (dict, list)):
+                    value = json.dumps(value, sort_keys=True)
+                print("  {}: {}".format(key, value))
+
+
+def _duration(seconds):
+    return '' if seconds is None else "{:.2f}s".format(seconds)
@@ -20,11 +20,27 @@
 
 import json
 import os
-import subprocess
 import sys
+from threading import Event, Lock, Thread
 
 from mlt.commands import Command
-from mlt.utils import config_helpers
+from mlt.utils import (concurrency_helpers, config_helpers, kubernetes_client,
+                       kubernetes_helpers, process_helpers, run_history)
+
+try:
+    import queue
+except ImportError:
+    # python 2
+    import Queue as queue
+
+# the kinds of objects that run the job of an app
+JOB_KINDS = ('Job', 'TFJob', 'PyTorchJob')
+
+JOB_COLUMNS = ['JOB', 'STATUS', 'AGE']
+POD_COLUMNS = ['POD', 'STATUS', 'RESTARTS', 'AGE', 'NODE']
+
+# moves the cursor home and clears the terminal
+CLEAR_SCREEN = "\033[H\033[2J"
 
 
 class StatusCommand(Command):
@@ -34,7 +50,9 @@ class StatusCommand(Command):
 
     def action(self):
         push_file = '.push.json'
-        if os.path.isfile(push_file):
+        if self.args.get('--run'):
+            data = run_history.load_deployed_run(self.args['--run'])
+        elif os.path.isfile(push_file):
             with open(push_file, 'r') as f:
                 data = json.load(f)
         else:
@@ -42,21 +60,201 @@ class StatusCommand(Command):
             sys.exit(1)
 
         app_run_id = data.get('app_run_id', "")
+        if self.args.get('--make'):
+            self._make_status(app_run_id)
+            return
+
+        run_status = RunStatus(
+            self.config['namespace'],
+            kubernetes_helpers.label_selector(kubernetes_helpers.run_labels(
+                self.config['name'], app_run_id)),
+            data.get('app_run_api_versions') or {})
+        try:
+            run_status.list()
+        except kubernetes_client.ApiError as ex:
+            print("Error while getting app status: {}".format(ex))
+            sys.exit(1)
+
+        if not self.args.get('--watch'):
+            print(run_status.summary())
+            return
+
+        clear = CLEAR_SCREEN if sys.stdout.isatty() else "\n"
+
+        def show(summary):
+            sys.stdout.write(clear + summary + "\n")
+            sys.stdout.flush()
+        try:
+            run_status.watch(show)
+        except KeyboardInterrupt:
+            pass
+
+    def _make_status(self, app_run_id):
+        """the `status` target of the app's Makefile"""
         job_name = "-".join([self.config["name"], app_run_id])
         namespace = self.config['namespace']
         user_env = dict(os.environ, NAMESPACE=namespace, JOB_NAME=job_name)
 
+        status = process_helpers.run_capture(["make", "status"],
+                                             env=user_env)
+        output = status.stdout_text() + status.stderr_text()
+        if status.returncode == 0:
+            print(output.strip())
+        elif "No rule to make target `status'" in output:
+            # TODO: when we have a template updating capability, add a
+            # note recommending that he user update's their template to
+            # get the status command
+            print("This app does not support the `mlt status` command. "
+                  "No `status` target was found in the Makefile.")
+        else:
+            print("Error while getting app status: {}".format(output))
+
+
+class RunStatus(object):
+    """The jobs and pods of a run, found by the run labels `mlt deploy`
+       puts on them. `list` fetches all of them concurrently, `watch`
+       then keeps them up to date from watch events.
+    """
+    def __init__(self, namespace, selector, api_versions):
+        self.selector = selector
+        self.pods_path = "/api/v1/namespaces/{}/pods".format(namespace)
+        self.job_paths = [
+            kubernetes_helpers.collection_path(api_versions[kind], kind,
+                                               namespace)
+            for kind in JOB_KINDS if api_versions.get(kind)]
+        # by `Kind/name` and by pod name
+        self.jobs = {}
+        self.pods = {}
+        self.lock = Lock()
+        self.changed = queue.Queue()
+        self.stopped = Event()
+
+    def list(self):
+        client = kubernetes_client.get_client()
+        paths = [self.pods_path] + self.job_paths
+        collections = concurrency_helpers.parallel_map(
+            lambda path: client.list(path, label_selector=self.selector),
+            paths)
+        for path, items in zip(paths, collections):
+            for obj in items:
+                self._update(path, 'ADDED', obj)
+
+    def watch(self, show):
+        """calls `show` with the summary every time the run changed, a
+           burst of changes gets shown once, until `stop`
+        """
         try:
-            output = subprocess.check_output(["make", "status"],
-                                             env=user_env,
-                                             stderr=subprocess.STDOUT)
-            print(output.decode("utf-8").strip())
-        except subprocess.CalledProcessError as e:
-            if "No rule to make target `status'" in str(e.output):
-                # TODO: when we have a template updating capability, add a
-                # note recommending that he user update's their template to
-                # get the status command
-                print("This app does not support the `mlt status` command. "
-                      "No `status` target was found in the Makefile.")
-            else:
-                print("Error while getting app status: {}".format(e.output))
+            for path in [self.pods_path] + self.job_paths:
+                thread = Thread(target=kubernetes_helpers.keep_watching,
+                                args=(path, self._changed(path), self.stopped),
+                                kwargs={'label_selector': self.selector})
+                thread.daemon = True
+                thread.start()
+            show(self.summary())
+            while True:
+                stop = self.changed.get() is None
+                while not stop and not self.changed.empty():
+                    stop = self.changed.get() is None
+                if stop:
+                    return
+                show(self.summary())
+        finally:
+            self.stopped.set()
+
+    def stop(self):
+        self.changed.put(None)
+
+    def _changed(self, path):
+        def on_change(event_type, obj):
+            if self._update(path, event_type, obj):
+                self.changed.put(True)
+        return on_change
+
+    def _update(self, path, event_type, obj):
+        """applies a change, returns whether it changed anything"""
+        if path == self.pods_path:
+            objects, key = self.pods, obj['metadata']['name']
+        else:
+            objects, key = self.jobs, "{}/{}".format(
+                obj.get('kind'), obj['metadata']['name'])
+        with self.lock:
+            if event_type == 'DELETED':
+                return objects.pop(key, None) is not None
+            # the watch first sends what `list` already saw
+            if objects.get(key) == obj:
+                return False
+            objects[key] = obj
+            return True
+
+    def summary(self):
+        from tabulate import tabulate
+        with self.lock:
+            jobs = sorted(self.jobs.items())
+            pods = sorted(self.pods.values(),
+                          key=lambda pod: pod['metadata']['name'])
+
+        sections = []
+        if jobs:
+            sections.append(tabulate(
+                [[name, job_status(job), _age(job)] for name, job in jobs],
+                headers=JOB_COLUMNS, tablefmt="plain"))
+        if not pods:
+            sections.append("No pods found for this run.")
+            return "\n\n".join(sections)
+
+        statuses = [pod_status(pod) for pod in pods]
+        counts = dict((status, statuses.count(status))
+                      for status in statuses)
+        sections.append("{} pod(s): {}".format(len(pods), ", ".join(
+            "{} {}".format(counts[status], status)
+            for status in sorted(counts))))
+        sections[-1] += "\n" + tabulate(
+            [[pod['metadata']['name'], status, pod_restarts(pod), _age(pod),
+              (pod.get('spec') or {}).get('nodeName') or '<none>']
+             for pod, status in zip(pods, statuses)],
+            headers=POD_COLUMNS, tablefmt="plain")
+        return "\n\n".join(sections)
+
+
+def job_status(job):
+    """what a job is up to, TFJobs and PyTorchJobs report a phase or (in
+       later versions) conditions, plain Jobs counts and conditions
+    """
+    status = job.get('status') or {}
+    if status.get('phase'):
+        return status['phase']
+    conditions = [condition['type'] for condition in
+                  status.get('conditions') or []
+                  if condition.get('status') == 'True']
+    if conditions:
+        return conditions[-1]
+    if status.get('active'):
+        return 'Running'
+    return 'Pending'
+
+
+def pod_status(pod):
+    """the pod's phase, or why its containers aren't running, the way
+       `kubectl get pods` shows it
+    """
+    if pod['metadata'].get('deletionTimestamp'):
+        return 'Terminating'
+    status = pod.get('status') or {}
+    for container in status.get('containerStatuses') or []:
+        state = container.get('state') or {}
+        reason = (state.get('waiting') or {}).get('reason') or \
+            (state.get('terminated') or {}).get('reason')
+        if reason and reason != 'Completed':
+            return reason
+    return status.get('phase', 'Unknown')
+
+
+def pod_restarts(pod):
+    return sum(container.get('restartCount', 0) for container in
+               (pod.get('status') or {}).get('containerStatuses') or [])
+
+
+def _age(obj):
+    return kubernetes_helpers.age(
+        (obj.get('status') or {}).get('startTime') or
+        obj['metadata'].get('creationTimestamp'))
@@ -19,7 +19,6 @@
 #
 
 import os
-from tabulate import tabulate
 
 from mlt.commands import Command
 from mlt.utils import git_helpers
@@ -42,6 +41,7 @@ class TemplatesCommand(Command):
                     print("Please make sure template repo directory exists "
                           "and you have read access to the directory.")
             else:
+                from tabulate import tabulate
                 print(tabulate(templates,
                                headers=['Template', 'Description'],
                                tablefmt="simple"))
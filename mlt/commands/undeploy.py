@@ -18,8 +18,33 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import sys
+import time
+
 from mlt.commands import Command
-from mlt.utils import config_helpers, process_helpers
+from mlt.utils import (concurrency_helpers, config_helpers, constants, files,
+                       kubernetes_client, kubernetes_helpers, log_helpers,
+                       process_helpers, profile_helpers, run_history)
+
+# objects deleted at the same time
+DELETE_CONCURRENCY = 8
+
+# secs `--wait` waits for the deleted runs to be gone, unless --timeout says
+WAIT_TIMEOUT = 300
+
+# secs between the checks whether the deleted runs are gone
+WAIT_POLL = 2
+
+# the pods of a run go with the objects that own them, the garbage
+# collector deletes them once the owner is gone instead of the API server
+# holding the delete until they are
+DELETE_OPTIONS = {'kind': 'DeleteOptions', 'apiVersion': 'v1',
+                  'propagationPolicy': 'Background'}
 
 
 class UndeployCommand(Command):
@@ -28,7 +53,185 @@ class UndeployCommand(Command):
         self.config = config_helpers.load_config()
 
     def action(self):
-        """deletes current kubernetes namespace"""
+        """deletes the objects of the latest run, or with `--run`,
+           `--older-than` or `--all` those of the runs they select
+        """
         namespace = self.config['namespace']
+        if self.args.get('--run') or self.args.get('--older-than') or \
+                self.args.get('--all'):
+            self._undeploy_runs(namespace)
+            return
         process_helpers.run(
-            ["kubectl", "--namespace", namespace, "delete", "-f", "k8s"])
+            ["kubectl", "--namespace", namespace, "delete", "-f",
+             self._rendered_dir()])
+        self._forget_live_manifests()
+
+    def _undeploy_runs(self, namespace):
+        """finds the objects of the selected runs by their run labels and
+           deletes them all in parallel, waiting for them to be gone with
+           `--wait`
+        """
+        started = time.time()
+        labels = {kubernetes_helpers.APP_LABEL: self.config['name']}
+        if self.args.get('--run'):
+            data = run_history.load_deployed_run(self.args['--run'])
+            labels[kubernetes_helpers.RUN_LABEL] = data['app_run_id']
+            api_versions = data['app_run_api_versions']
+        else:
+            api_versions = self._deployed_api_versions()
+        older_than = None
+        if self.args.get('--older-than'):
+            older_than = started - log_helpers.since_seconds(
+                self.args['--older-than'])
+
+        selector = kubernetes_helpers.label_selector(labels)
+        paths = [kubernetes_helpers.collection_path(
+            api_version, kind, namespace)
+            for kind, api_version in sorted(api_versions.items())]
+        objects = [(path, obj) for path, obj in
+                   self._find_objects(paths, selector)
+                   if older_than is None or
+                   # objects shared by all runs go with the app, not a run
+                   (_run_id(obj) and _created(obj) < older_than)]
+        if not objects:
+            print("No runs of {} found to undeploy.".format(
+                self.config['name']))
+            return
+
+        run_ids = sorted(set(_run_id(obj) for _, obj in objects) - {None})
+        print("Deleting {} object(s) of {} run(s)".format(
+            len(objects), len(run_ids)))
+        concurrency_helpers.parallel_map(
+            self._delete, objects, DELETE_CONCURRENCY)
+        self._forget_runs(run_ids, started, objects)
+
+        if self.args.get('--wait'):
+            timeout = self.args.get('--timeout')
+            timeout = WAIT_TIMEOUT if timeout is None else int(timeout)
+            pods = kubernetes_helpers.collection_path('v1', 'Pod', namespace)
+            if pods not in paths:
+                paths.append(pods)
+            deleted = set((path, obj['metadata']['name'])
+                          for path, obj in objects)
+            self._wait_until_gone(paths, selector, deleted, set(run_ids),
+                                  timeout)
+
+    @staticmethod
+    def _deployed_api_versions():
+        """the kinds of every object any recorded deploy of the app made,
+           as {kind: api version}
+        """
+        api_versions = {}
+        for run in run_history.runs(action='deploy'):
+            api_versions.update(run['details'].get('api_versions') or {})
+        api_versions.update(
+            files.fetch_action_arg('push', 'app_run_api_versions') or {})
+        return api_versions
+
+    @staticmethod
+    def _find_objects(paths, selector):
+        """(collection path, object) of every object matching `selector`
+           in the collections at `paths`; the kinds of a CRD that is gone
+           have none
+        """
+        client = kubernetes_client.get_client()
+
+        def find(path):
+            try:
+                return client.list(path, label_selector=selector)
+            except kubernetes_client.ApiError as ex:
+                if ex.status != 404:
+                    raise
+                return []
+
+        found = concurrency_helpers.parallel_map(find, paths)
+        return [(path, obj) for path, objects in zip(paths, found)
+                for obj in objects]
+
+    @staticmethod
+    def _delete(found):
+        path, obj = found
+        name = obj['metadata']['name']
+        try:
+            kubernetes_client.get_client().request(
+                'DELETE', '{}/{}'.format(path, name), body=DELETE_OPTIONS)
+        except kubernetes_client.ApiError as ex:
+            # someone else deleted it first
+            if ex.status != 404:
+                raise
+        print('{} "{}" deleted'.format(obj.get('kind', '').lower(), name))
+
+    def _forget_runs(self, run_ids, started, objects):
+        """records the runs as undeployed and removes their rendered
+           templates; when the live run is among them, its manifests too
+        """
+        duration = time.time() - started
+        for run_id in run_ids:
+            run_history.record(
+                'undeploy', run_id, started, 'success', duration=duration,
+                namespace=self.config['namespace'],
+                objects=sorted('{}/{}'.format(obj.get('kind'),
+                                              obj['metadata']['name'])
+                               for _, obj in objects
+                               if _run_id(obj) == run_id))
+            shutil.rmtree(os.path.join(constants.RENDERED_DIR, run_id),
+                          ignore_errors=True)
+        if self.args.get('--all') or \
+                files.fetch_action_arg('push', 'app_run_id') in run_ids:
+            self._forget_live_manifests()
+
+    @profile_helpers.traced('wait', 'runs gone')
+    def _wait_until_gone(self, paths, selector, deleted, run_ids, timeout):
+        """waits for the `deleted` (collection path, name)s and the pods
+           of `run_ids` to be gone, exits when they aren't after `timeout`
+           secs
+        """
+        print("Waiting for the runs to be gone")
+        deadline = time.time() + timeout
+        while True:
+            left = [obj for path, obj in self._find_objects(paths, selector)
+                    if _run_id(obj) in run_ids or
+                    (path, obj['metadata']['name']) in deleted]
+            if not left:
+                print("All {} run(s) are gone".format(len(run_ids)))
+                return
+            if time.time() >= deadline:
+                print("{} object(s) of the runs are still there after {}s"
+                      .format(len(left), timeout))
+                sys.exit(1)
+            time.sleep(min(WAIT_POLL, max(deadline - time.time(), 0)))
+
+    @staticmethod
+    def _rendered_dir():
+        """the templates of the latest deploy, apps deployed before runs
+           got a dir of their own have them right in `k8s`
+        """
+        app_run_id = files.fetch_action_arg('push', 'app_run_id')
+        if app_run_id:
+            rendered_dir = os.path.join(constants.RENDERED_DIR, app_run_id)
+            if os.path.isdir(rendered_dir):
+                return rendered_dir
+        return constants.RENDERED_DIR
+
+    @staticmethod
+    def _forget_live_manifests():
+        """nothing is live anymore, so the next deploy applies everything"""
+        if not os.path.isfile('.push.json'):
+            return
+        with files.state_lock():
+            with open('.push.json') as f:
+                data = json.load(f)
+            data.pop('app_run_hashes', None)
+            data.pop('app_run_renders', None)
+            files.write_atomic('.push.json', json.dumps(data, indent=2))
+
+
+def _run_id(obj):
+    return (obj['metadata'].get('labels') or {}).get(
+        kubernetes_helpers.RUN_LABEL)
+
+
+def _created(obj):
+    return kubernetes_helpers.epoch_seconds(
+        obj['metadata'].get('creationTimestamp') or
+        '1970-01-01T00:00:00Z')
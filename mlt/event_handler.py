@@ -20,39 +20,70 @@
 
 import os
 import time
-from subprocess import call
-from threading import Timer
+from threading import Lock, Timer
+
+from mlt.utils.gitignore import GitIgnore
 
 
 class EventHandler(object):
-    def __init__(self, callback):
+    """Collects the file changes in the project dir that aren't ignored by
+       git and calls `callback` with the set of changed paths once no new
+       change came in for `delay` seconds.
+    """
+    def __init__(self, callback, delay=3, root='.'):
         self.last_changed = time.time()
-        self.dirty = False
         self.timer = None
         self.callback = callback
-        self.ignore_directories = ["./.git"]
-        self.ignore_files = ["./"]
+        self.delay = delay
+        self.root = root
+        self.changed_paths = set()
+        self.lock = Lock()
+        self.ignore_directories = [".git"]
+        self.gitignore = GitIgnore(root)
 
     def dispatch(self, event):
-        # TODO(niklas): Could be smarter with a os.path.basename(),
-        #               but doing a prefix check for now.
-        for directory in self.ignore_directories:
-            if event.src_path.startswith(directory):
-                return
+        path = os.path.relpath(event.src_path, self.root)
+        if path == '.':
+            return
 
-        for f in self.ignore_files:
-            if event.src_path == f:
-                return
+        parts = path.split(os.sep)
+        if os.path.basename(path) == '.gitignore' or \
+                parts[:3] == ['.git', 'info', 'exclude']:
+            self.gitignore.reload()
 
-        is_ignored = call(["git", "check-ignore", event.src_path],
-                          stdout=open(os.devnull, 'wb')) == 0
-        if is_ignored:
+        if parts[0] in self.ignore_directories:
             return
 
-        if self.timer:
-            self.timer.cancel()
+        # paths outside of the project can't be gitignored by it
+        if parts[0] != os.pardir and self.gitignore.is_ignored(
+                path, is_dir=getattr(event, 'is_directory', False)):
+            return
+
+        with self.lock:
+            first_change = not self.changed_paths
+            self.changed_paths.add(path)
+            self.last_changed = time.time()
+            if self.timer is None:
+                self._start_timer(self.delay)
 
-        print("Detected change in {}".format(event.src_path))
+        if first_change:
+            print("Detected change in {}".format(event.src_path))
 
-        self.timer = Timer(3, lambda: self.callback())
+    def _start_timer(self, delay):
+        self.timer = Timer(delay, self._flush)
+        self.timer.daemon = True
         self.timer.start()
+
+    def _flush(self):
+        """one timer per batch of changes; if changes kept coming in while
+           it ran, wait for the rest of the delay instead of firing
+        """
+        with self.lock:
+            remaining = self.last_changed + self.delay - time.time()
+            if remaining > 0:
+                self._start_timer(remaining)
+                return
+            changed_paths = self.changed_paths
+            self.changed_paths = set()
+            self.timer = None
+        self.callback(changed_paths)
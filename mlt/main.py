@@ -28,13 +28,17 @@ Usage:
   mlt config (list | set <name> <value> | remove <name>)
   mlt build [--watch]
   mlt deploy [--no-push] [-i | --interactive] [-l | --logs]
-      [--retries=<retries>] [--skip-crd-check]
-      [--since=<duration>] [<kube_spec>]
-  mlt undeploy
-  mlt status
+      [--timeout=<secs>] [--retries=<retries>] [--skip-crd-check]
+      [--refresh-cache] [--dry-run | --force] [--since=<duration>]
+      [--sweep=<spec> [--concurrency=<runs>]] [<kube_spec>]
+  mlt undeploy [(--run=<run_id> | --older-than=<duration> | --all)
+      [--wait [--timeout=<secs>]]]
+  mlt status [--watch] [--make] [--run=<run_id>]
   mlt (template | templates) list [--template-repo=<repo>]
-  mlt (log | logs) [--since=<duration>] [--retries=<retries>]
-  mlt events
+  mlt (log | logs) [--since=<duration>] [--timeout=<secs>]
+      [--retries=<retries>] [--timestamps] [--run=<run_id>]
+  mlt events [--follow] [--json] [--run=<run_id>]
+  mlt runs (list [--limit=<limit>] | show <run_id>)
 
 Options:
   --template=<template>     Template name for app
@@ -48,9 +52,10 @@ Options:
                             use a namespace identical to username.
   --skip-crd-check          To avoid crd check during mlt init
                             [default: False].
-  --retries=<retries>       Number of times to connect to a pod interactively.
-                            Waits 1 second between retrying.
-                            [default: 10]
+  --refresh-cache           Check again that the CRDs and namespace are in
+                            the cluster, instead of trusting what an
+                            earlier deploy found.
+  --retries=<retries>       Deprecated, the same as --timeout.
   --interactive             Rewrites container command to infinite sleep,
                             and then drops user into `kubectl exec` shell.
                             Adds a `debug=true` label for easy discovery
@@ -59,46 +64,96 @@ Options:
                             interactively as the `kube_spec`. `kube_spec` is
                             only used with this flag.
   --logs                    Tail logs after deploying [default: False]
-  --watch                   Watch project directory and build on file changes
+  --dry-run                 Show how the manifests of the deploy differ
+                            from the ones of the live run, without pushing
+                            or applying anything.
+  --force                   Apply all manifests, even those (or all of a
+                            deploy) that didn't change since the live run.
+  --sweep=<spec>            Deploy a run per point of the sweep over
+                            template parameters in the JSON file <spec>,
+                            pushing the image once. With --dry-run, list
+                            the points.
+  --concurrency=<runs>      Number of runs of a sweep applied at the same
+                            time [default: 4].
+  --watch                   With `build`, watch project directory and build
+                            on file changes. With `status`, keep the status
+                            up to date as the run changes.
+  --make                    Show the output of the `status` target of the
+                            app's Makefile instead.
   --no-push                 Deploy your project to kubernetes using the same
                             image from your last run.
   --since=<duration>        Returns logs newer than a relative
                             duration like 10s, 1m, or 2h [default: 1m].
+  --timestamps              Prefix log lines with their timestamp and
+                            interleave the logs of all pods by time.
+  --follow                  Keep printing the events of the run as they
+                            happen.
+  --json                    Print events as JSON, one event per line.
+  --run=<run_id>            Use this deploy (or the one whose run id
+                            starts with it) instead of the latest one.
+  --older-than=<duration>   Undeploy the runs of the app created longer
+                            than a duration like 12h or 2d ago.
+  --all                     Undeploy every run of the app.
+  --wait                    Wait for the undeployed runs, their pods
+                            included, to be gone.
+  --timeout=<secs>          Number of seconds to wait for pod(s) to be
+                            Running before connecting to a pod interactively
+                            or tailing logs (10 by default), or with
+                            undeploy --wait for the runs to be gone, after
+                            that undeploy fails (300 by default).
+  --limit=<limit>           Number of runs to list [default: 20].
+
+Profiling:
+  Every command also takes --profile, to print where its time went (the
+  subprocesses, API requests, template renders and waits it did) once it
+  is done, or --profile=<file> to write that to <file> as a Chrome trace.
+  --profile <file> works too when <file> ends with .json.
 """
+import sys
+
 import mlt
 
+from importlib import import_module
+
 from docopt import docopt
 
-from mlt.commands import (BuildCommand, ConfigCommand, DeployCommand,
-                          EventsCommand, InitCommand, StatusCommand,
-                          TemplatesCommand, UndeployCommand, LogsCommand)
-from mlt.utils import regex_checks
+from mlt.utils import profile_helpers, regex_checks
 
 
 # every available command and its corresponding action will go here
+# commands are only imported once they are run, so a quick command like
+# `mlt config list` doesn't pay for importing the dependencies of the others
 COMMAND_MAP = (
-    ('build', BuildCommand),
-    ('config', ConfigCommand),
-    ('deploy', DeployCommand),
-    ('init', InitCommand),
-    ('status', StatusCommand),
-    ('template', TemplatesCommand),
-    ('templates', TemplatesCommand),
-    ('undeploy', UndeployCommand),
-    ('log', LogsCommand),
-    ('logs', LogsCommand),
-    ('events', EventsCommand)
+    ('build', 'mlt.commands.build.BuildCommand'),
+    ('config', 'mlt.commands.config.ConfigCommand'),
+    ('deploy', 'mlt.commands.deploy.DeployCommand'),
+    ('init', 'mlt.commands.init.InitCommand'),
+    ('status', 'mlt.commands.status.StatusCommand'),
+    ('template', 'mlt.commands.templates.TemplatesCommand'),
+    ('templates', 'mlt.commands.templates.TemplatesCommand'),
+    ('undeploy', 'mlt.commands.undeploy.UndeployCommand'),
+    ('log', 'mlt.commands.logs.LogsCommand'),
+    ('logs', 'mlt.commands.logs.LogsCommand'),
+    ('events', 'mlt.commands.events.EventsCommand'),
+    ('runs', 'mlt.commands.runs.RunsCommand')
 )
 
 
 def run_command(args):
     """maps params from docopt into mlt commands"""
-    for command, CommandClass in COMMAND_MAP:
+    for command, command_class in COMMAND_MAP:
         if args[command]:
-            CommandClass(args).action()
+            with profile_helpers.span('mlt ' + command, 'command'):
+                load_command(command_class)(args).action()
             return
 
 
+def load_command(command_class):
+    """imports the command class from its dotted path"""
+    module_name, class_name = command_class.rsplit('.', 1)
+    return getattr(import_module(module_name), class_name)
+
+
 def sanitize_input(args, regex=None):
     """Ensures that the values passed to us via flags aren't malicious
        Or attempts to at least! Also sets types of vars and other tweaks
@@ -128,9 +183,18 @@ def sanitize_input(args, regex=None):
     if args["-l"]:
         args["--logs"] = True
 
+    # --retries used to count checks for the pods a second apart, how long
+    # we wait for them is up to --timeout now
+    if args.get('--retries') is not None:
+        sys.stderr.write("--retries is deprecated, use --timeout=<secs> "
+                         "instead\n")
+        if args.get('--timeout') is None:
+            args['--timeout'] = args['--retries']
+
     # docopt doesn't support type assignment:
     # https://github.com/docopt/docopt/issues/8
-    args['--retries'] = int(args['--retries'])
+    if args.get('--timeout') is not None:
+        args['--timeout'] = int(args['--timeout'])
 
     # verify that the specified namespace is valid
     if args['--namespace'] and not regex_checks.k8s_name_is_valid(
@@ -148,8 +212,42 @@ def sanitize_input(args, regex=None):
     return args
 
 
+def profile_option(argv):
+    """takes `--profile[=<file>]` out of the arguments, it goes with any
+       command. Returns the other arguments and None without it, the file
+       (or '' for the summary table) with it. `--profile <file>` only
+       takes <file> along when it is a `.json` file, as the argument after
+       `--profile` may just as well be the command or one of its arguments.
+    """
+    profile = None
+    rest = []
+    args = iter(argv)
+    for arg in args:
+        if arg.startswith('--profile='):
+            profile = arg.partition('=')[2]
+        elif arg == '--profile':
+            profile = ''
+            following = next(args, None)
+            if following is not None and following.endswith('.json') and \
+                    not following.startswith('-'):
+                profile = following
+            elif following is not None:
+                rest.append(following)
+        else:
+            rest.append(arg)
+    return rest, profile
+
+
 def main():
+    argv, profile = profile_option(sys.argv[1:])
     args = sanitize_input(
-        docopt(__doc__, version="ML Container Templates Version {}".
-               format(mlt.__version__)))
-    run_command(args)
+        docopt(__doc__, argv=argv, version="ML Container Templates Version "
+               "{}".format(mlt.__version__)))
+    if profile is None:
+        run_command(args)
+        return
+    profile_helpers.start()
+    try:
+        run_command(args)
+    finally:
+        profile_helpers.finish(profile)
@@ -0,0 +1,132 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import fnmatch
+import hashlib
+import os
+from subprocess import CalledProcessError, check_output
+
+# files mlt writes into the project dir itself; they must never make the
+# build context look changed
+MLT_STATE_FILES = ('.build.json', '.push.json', '.runs.db',
+                   '.runs.db-journal', '.mlt.lock')
+
+# always part of the context, even if ignored by git
+ALWAYS_INCLUDED = ('Dockerfile', 'requirements.txt')
+
+
+def context_digest(path='.'):
+    """sha256 over the path, mode and content of every file in the docker
+       build context: files not ignored by git or .dockerignore, plus
+       the Dockerfile and requirements
+    """
+    digest = hashlib.sha256()
+    for filename in context_files(path):
+        full_path = os.path.join(path, filename)
+        digest.update(filename.encode('utf-8') + b'\0')
+        if os.path.islink(full_path):
+            digest.update(b'link\0' + os.readlink(full_path).encode('utf-8'))
+        else:
+            digest.update(str(os.stat(full_path).st_mode & 0o111).encode(
+                'utf-8') + b'\0')
+            digest.update(_file_digest(full_path))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def context_files(path='.'):
+    """sorted relative paths of the files in the build context"""
+    candidates = _git_files(path)
+    if candidates is None:
+        candidates = _walk_files(path)
+    dockerignore = _dockerignore_patterns(path)
+    selected = set(
+        f for f in candidates
+        if f not in MLT_STATE_FILES and
+        not _is_dockerignored(f, dockerignore) and
+        os.path.lexists(os.path.join(path, f)))
+    selected.update(
+        f for f in ALWAYS_INCLUDED
+        if os.path.isfile(os.path.join(path, f)))
+    selected.update(
+        f for f in os.listdir(path)
+        if fnmatch.fnmatch(f, 'requirements*.txt'))
+    return sorted(selected)
+
+
+def _file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _git_files(path):
+    """tracked and untracked files that aren't gitignored,
+       None if `path` isn't in a git repo
+    """
+    try:
+        with open(os.devnull, 'wb') as quiet:
+            output = check_output(
+                ["git", "ls-files", "-z", "--cached", "--others",
+                 "--exclude-standard"], cwd=path, stderr=quiet)
+    except (CalledProcessError, OSError):
+        return None
+    return [f for f in output.decode('utf-8').split('\0') if f]
+
+
+def _walk_files(path):
+    result = []
+    for root, dirs, filenames in os.walk(path):
+        dirs[:] = [d for d in dirs if d != '.git']
+        for filename in filenames:
+            result.append(os.path.relpath(os.path.join(root, filename), path))
+    return result
+
+
+def _dockerignore_patterns(path):
+    dockerignore = os.path.join(path, '.dockerignore')
+    if not os.path.isfile(dockerignore):
+        return []
+    patterns = []
+    with open(dockerignore) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                patterns.append(line)
+    return patterns
+
+
+def _is_dockerignored(filename, patterns):
+    """docker matches each pattern against the path and its parent dirs,
+       the last matching pattern wins and `!` re-includes
+    """
+    parts = filename.split('/')
+    prefixes = ['/'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+    ignored = False
+    for pattern in patterns:
+        negate = pattern.startswith('!')
+        pattern = pattern.lstrip('!').strip('/')
+        if pattern.startswith('./'):
+            pattern = pattern[2:]
+        if any(fnmatch.fnmatch(prefix, pattern) for prefix in prefixes):
+            ignored = not negate
+    return ignored
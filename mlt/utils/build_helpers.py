@@ -20,10 +20,11 @@
 
 import os
 
-from mlt.commands.build import BuildCommand
-
 
 def verify_build(args):
     """runs a full build if no build json file"""
     if not os.path.isfile('.build.json'):
+        # only needed when we have to build, and importing the build
+        # command also imports watchdog
+        from mlt.commands.build import BuildCommand
         BuildCommand(args).action()
@@ -0,0 +1,98 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+from threading import Thread
+
+try:
+    import queue
+except ImportError:
+    # python 2
+    import Queue as queue
+
+
+def parallel_map(func, items, max_workers=None):
+    """`[func(item) for item in items]` with the calls made on up to
+       `max_workers` threads (one per item by default), for calls that
+       mostly wait on the network or on other processes.
+       Results keep the order of `items`; if any call raised, the first
+       exception (in `items` order) is raised once all calls are done.
+    """
+    items = list(items)
+    if not items:
+        return []
+    todo = queue.Queue()
+    for index, item in enumerate(items):
+        todo.put((index, item))
+    results = [None] * len(items)
+    errors = [None] * len(items)
+
+    def work():
+        while True:
+            try:
+                index, item = todo.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[index] = func(item)
+            # also SystemExit, so a helper that exits on failure fails
+            # the caller instead of just ending this thread
+            except BaseException as ex:
+                errors[index] = ex
+
+    workers = [Thread(target=work)
+               for _ in range(min(max_workers or len(items), len(items)))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    for error in errors:
+        if error is not None:
+            raise error
+    return results
+
+
+class BackgroundCall(object):
+    """Calls `func(*args, **kwargs)` on a thread of its own right away;
+       `wait` returns what it returned, or raises what it raised.
+    """
+    def __init__(self, func, *args, **kwargs):
+        self.result = None
+        self.error = None
+        self.thread = Thread(target=self._run, args=(func, args, kwargs))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, func, args, kwargs):
+        try:
+            self.result = func(*args, **kwargs)
+        # see `parallel_map`
+        except BaseException as ex:
+            self.error = ex
+
+    def failed(self):
+        """True once the call raised, without waiting for it"""
+        return self.error is not None
+
+    def wait(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.result
@@ -30,3 +30,39 @@ TEMPLATE_CONFIG = "parameters.json"
 
 # Name of config file section that has template parameters
 TEMPLATE_PARAMETERS = "template_parameters"
+
+# Environment variable that overrides where mlt keeps its local caches
+CACHE_DIR_ENV = "MLT_CACHE_DIR"
+
+# How long (in seconds) a cached template repository is used before it is
+# refreshed from the remote; override with the env var below
+TEMPLATE_CACHE_TTL = 3600
+TEMPLATE_CACHE_TTL_ENV = "MLT_TEMPLATE_CACHE_TTL"
+
+# How long (in seconds) we trust that a CRD or namespace we saw in a
+# cluster is still there; override with the env var below
+CLUSTER_CACHE_TTL = 600
+CLUSTER_CACHE_TTL_ENV = "MLT_CLUSTER_CACHE_TTL"
+
+# Registries, besides the ones on localhost, that serve plain http (like
+# docker's `insecure-registries`), comma separated `host:port`s
+INSECURE_REGISTRIES_ENV = "MLT_INSECURE_REGISTRIES"
+
+# How long (in seconds) we wait for the pods of a run to be Running before
+# connecting to one or tailing their logs, unless --timeout says otherwise
+POD_TIMEOUT = 10
+
+# The history of the builds, pushes and deploys of an app, in the app dir
+RUN_HISTORY_FILE = ".runs.db"
+
+# Taken by mlt processes updating the state files of an app, in the app dir
+STATE_LOCK_FILE = ".mlt.lock"
+
+# The dir `mlt deploy` renders the templates of each run into, in a dir of
+# its own per run, and how many of those dirs it keeps around
+RENDERED_DIR = "k8s"
+RENDERED_RUNS_KEPT = 20
+
+# How many renders of templates `mlt deploy` keeps in its cache dir, the
+# least recently used ones go first
+RENDER_CACHE_KEPT = 200
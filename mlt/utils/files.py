@@ -18,8 +18,14 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import errno
+import fcntl
 import json
 import os
+import tempfile
+from contextlib import contextmanager
+
+from mlt.utils import constants
 
 
 def fetch_action_arg(action, arg):
@@ -28,3 +34,53 @@ def fetch_action_arg(action, arg):
     if os.path.isfile(action_json):
         with open(action_json) as f:
             return json.load(f).get(arg)
+
+
+def cache_dir(*paths):
+    """returns a path in the user's mlt cache dir, creating parent dirs
+       honors MLT_CACHE_DIR, then XDG_CACHE_HOME, then ~/.cache
+    """
+    base = os.environ.get(constants.CACHE_DIR_ENV)
+    if not base:
+        base = os.path.join(
+            os.environ.get('XDG_CACHE_HOME') or
+            os.path.join(os.path.expanduser('~'), '.cache'), 'mlt')
+    path = os.path.join(base, *paths)
+    parent = os.path.dirname(path) if paths else path
+    try:
+        os.makedirs(parent)
+    except OSError as exc:
+        # another mlt process may have created it in the meantime
+        if exc.errno != errno.EEXIST:
+            raise
+    return path
+
+
+@contextmanager
+def state_lock():
+    """holds the app dir's state lock, so mlt processes running side by
+       side in one app (e.g. parallel deploys) take turns updating
+       `.build.json` and `.push.json`
+    """
+    with open(constants.STATE_LOCK_FILE, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def write_atomic(path, text):
+    """replaces `path` with `text` in one go, readers see either the old
+       or the new contents but never a partly written file
+    """
+    fd, staging = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.rename(staging, path)
+    except BaseException:
+        os.remove(staging)
+        raise
@@ -18,24 +18,108 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import hashlib
 import os
 import shutil
 import tempfile
+import time
 from contextlib import contextmanager
 
-from mlt.utils import process_helpers
+from mlt.utils import constants, files, process_helpers
 
 
 @contextmanager
 def clone_repo(repo):
-    destination = tempfile.mkdtemp()
-    process_helpers.run_popen(
-        "git clone {} {}".format(repo, destination),
-        shell=True, stdout=False, stderr=False).wait()
+    """yields a checkout of the `mlt-templates` dir of `repo`
+       checkouts are kept in the mlt cache dir, one per repo, and only
+       refreshed with an incremental fetch once the cache TTL has expired.
+       Local repo paths are always refreshed since that is cheap.
+    """
+    destination = _cached_repo_path(repo)
+    if not os.path.isdir(os.path.join(destination, '.git')):
+        _clone(repo, destination)
+    elif _is_stale(repo, destination):
+        _refresh(repo, destination)
+    yield destination
+
+
+def _cached_repo_path(repo):
+    """cache dir name is derived from the repo so each repo has one mirror"""
+    if os.path.isdir(repo):
+        repo = os.path.abspath(repo)
+    digest = hashlib.sha1(repo.encode('utf-8')).hexdigest()[:16]
+    name = os.path.basename(repo.rstrip('/')).replace('.git', '') or 'repo'
+    return files.cache_dir('template-repos', '{}-{}'.format(name, digest))
+
+
+def _is_stale(repo, destination):
+    if os.path.isdir(repo):
+        return True
+    ttl = float(os.environ.get(constants.TEMPLATE_CACHE_TTL_ENV,
+                               constants.TEMPLATE_CACHE_TTL))
     try:
-        yield destination
+        last_fetch = os.path.getmtime(_fetch_stamp(destination))
+    except OSError:
+        return True
+    return time.time() - last_fetch >= ttl
+
+
+def _fetch_stamp(destination):
+    return os.path.join(destination, '.git', 'mlt-last-fetch')
+
+
+def _touch_fetch_stamp(destination):
+    with open(_fetch_stamp(destination), 'w') as f:
+        f.write(str(time.time()))
+
+
+def _git(args, cwd=None):
+    return process_helpers.run_popen(
+        ["git"] + args, cwd=cwd, stdout=False, stderr=False).wait()
+
+
+def _shallow_args(repo):
+    # --depth is ignored (with a warning) for local clones
+    return [] if os.path.isdir(repo) else ["--depth", "1"]
+
+
+def _clone(repo, destination):
+    """shallow clone with a sparse checkout of just the templates dir
+       the clone happens in a temp dir next to the cache so a failed or
+       interrupted clone never leaves a half populated cache behind
+    """
+    staging = tempfile.mkdtemp(dir=os.path.dirname(destination))
+    try:
+        if _git(["clone", "--no-checkout"] + _shallow_args(repo) +
+                [repo, staging]) != 0:
+            return
+        _git(["config", "core.sparseCheckout", "true"], cwd=staging)
+        with open(os.path.join(staging, '.git', 'info',
+                               'sparse-checkout'), 'w') as f:
+            f.write("/{}/\n".format(constants.TEMPLATES_DIR))
+        if _git(["checkout"], cwd=staging) != 0:
+            return
+        _touch_fetch_stamp(staging)
+        try:
+            os.rename(staging, destination)
+        except OSError:
+            # another mlt process populated the cache first, use theirs
+            pass
     finally:
         # This is really a bug in 'shutil' as described here:
         # https://bugs.python.org/issue29699
-        if os.path.exists(destination):
-            shutil.rmtree(destination)
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+
+
+def _refresh(repo, destination):
+    """incrementally fetches the remote HEAD; when offline we keep
+       using the cached checkout rather than failing
+    """
+    if _git(["fetch"] + _shallow_args(repo) + ["origin", "HEAD"],
+            cwd=destination) != 0 or \
+            _git(["reset", "--hard", "FETCH_HEAD"], cwd=destination) != 0:
+        print("Unable to refresh templates from {}, using cached "
+              "copy.".format(repo))
+        return
+    _touch_fetch_stamp(destination)
@@ -0,0 +1,201 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import os
+import re
+
+
+class GitIgnore(object):
+    """In-process gitignore matcher for a project dir.
+       Reads git's global excludes file (`core.excludesFile`), the
+       project's `.git/info/exclude` and its `.gitignore` files once and
+       matches paths against them without running git. Call `reload` when
+       any of those files change.
+    """
+    def __init__(self, root='.'):
+        self.root = root
+        self.reload()
+
+    def reload(self):
+        """(re)compiles the rules; nested .gitignore files are only read
+           for dirs that aren't ignored themselves, like git does
+        """
+        # list of (base dir relative to root, [rules]) in precedence order
+        self.rule_sets = []
+        self._add_rules('', _global_excludes_file(self.root))
+        self._add_rules('', os.path.join(self.root, '.git', 'info',
+                                         'exclude'))
+        for dirpath, dirs, filenames in os.walk(self.root):
+            base = _relpath(dirpath, self.root)
+            if '.gitignore' in filenames:
+                self._add_rules(base, os.path.join(dirpath, '.gitignore'))
+            dirs[:] = sorted(
+                d for d in dirs if d != '.git' and
+                not self.is_ignored(_join(base, d), is_dir=True))
+
+    def _add_rules(self, base, filename):
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                rules = [rule for rule in map(_parse_rule, f) if rule]
+            if rules:
+                self.rule_sets.append((base, rules))
+
+    def is_ignored(self, path, is_dir=False):
+        """`path` is relative to the root; a path is also ignored when one
+           of its parent dirs is ignored
+        """
+        parts = [part for part in path.replace(os.sep, '/').split('/')
+                 if part and part != '.']
+        if not parts:
+            return False
+        for i in range(1, len(parts) + 1):
+            prefix = '/'.join(parts[:i])
+            if self._match(prefix, is_dir or i < len(parts)):
+                return True
+        return False
+
+    def _match(self, path, is_dir):
+        ignored = False
+        for base, rules in self.rule_sets:
+            if base:
+                if not path.startswith(base + '/'):
+                    continue
+                relative = path[len(base) + 1:]
+            else:
+                relative = path
+            for regex, negate, dir_only in rules:
+                if dir_only and not is_dir:
+                    continue
+                if regex.match(relative):
+                    ignored = not negate
+        return ignored
+
+
+def _global_excludes_file(root):
+    """`core.excludesFile` from the user's or the project's git config,
+       where git looks for it by default otherwise
+    """
+    config_home = os.environ.get('XDG_CONFIG_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.config')
+    excludes_file = os.path.join(config_home, 'git', 'ignore')
+    # later files take precedence, like git reads them
+    for config_file in (os.path.join(config_home, 'git', 'config'),
+                        os.path.join(os.path.expanduser('~'), '.gitconfig'),
+                        os.path.join(root, '.git', 'config')):
+        excludes_file = _config_value(config_file, 'core', 'excludesfile',
+                                      excludes_file)
+    return os.path.expanduser(excludes_file)
+
+
+def _config_value(config_file, section, key, default):
+    """the last value of `key` in `section` of a git config file; names
+       are case-insensitive, subsections and includes aren't supported
+    """
+    if not os.path.isfile(config_file):
+        return default
+    value = default
+    current_section = None
+    with open(config_file) as f:
+        for line in f:
+            line = line.strip()
+            header = re.match(r'^\[\s*([\w.-]+)[^\]]*\]', line)
+            if header:
+                current_section = header.group(1).lower()
+                continue
+            if current_section != section or '=' not in line:
+                continue
+            name, found = line.split('=', 1)
+            if name.strip().lower() == key:
+                found = re.sub(r'\s[#;].*$', '', found).strip()
+                value = found[1:-1] if len(found) > 1 and \
+                    found[0] == found[-1] == '"' else found
+    return value
+
+
+def _relpath(path, root):
+    relative = os.path.relpath(path, root)
+    return '' if relative == '.' else relative.replace(os.sep, '/')
+
+
+def _join(base, name):
+    return base + '/' + name if base else name
+
+
+def _parse_rule(line):
+    """returns (compiled regex, negate, dir_only) or None for no rule"""
+    line = line.rstrip('\n')
+    # trailing spaces are ignored unless escaped
+    if not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    if not line or line.startswith('#'):
+        return None
+    negate = line.startswith('!')
+    if negate:
+        line = line[1:]
+    elif line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    # a slash anywhere but at the end anchors the pattern to the dir of
+    # the .gitignore, otherwise it matches at any depth
+    if '/' in line:
+        regex = '^' + _translate(line.lstrip('/')) + '$'
+    else:
+        regex = '^(?:.*/)?' + _translate(line) + '$'
+    return re.compile(regex), negate, dir_only
+
+
+def _translate(pattern):
+    """gitignore glob to regex; `*` and `?` don't match `/`, `**` does"""
+    result = ''
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            result += '(?:.*/)?'
+            i += 3
+            continue
+        elif pattern.startswith('**', i):
+            result += '.*'
+            i += 2
+            continue
+        elif c == '*':
+            result += '[^/]*'
+        elif c == '?':
+            result += '[^/]'
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                result += re.escape(c)
+            else:
+                chars = pattern[i + 1:end]
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                result += '[' + chars.replace('\\', '\\\\') + ']'
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            result += re.escape(pattern[i])
+        else:
+            result += re.escape(c)
+        i += 1
+    return result
@@ -0,0 +1,562 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""Talks to the kubernetes API server.
+   `get_client()` returns a client that reads the cluster and credentials
+   of the current kubeconfig context and keeps its connections alive
+   between requests. When the kubeconfig uses something we can't do
+   ourselves (like an auth plugin) the client runs `kubectl ... --raw`
+   instead, which speaks the same REST paths.
+"""
+import json
+import math
+import os
+import socket
+import ssl
+import tempfile
+import time
+from base64 import b64decode, b64encode
+from functools import partial
+from threading import Lock
+
+from mlt.utils import process_helpers, profile_helpers
+
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib.parse import urlencode, urlparse
+except ImportError:
+    # python 2
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib import urlencode
+    from urlparse import urlparse
+
+try:
+    import queue
+except ImportError:
+    # python 2
+    import Queue as queue
+
+# set to `kubectl` to always go through kubectl
+CLIENT_ENV = "MLT_KUBE_CLIENT"
+
+# seconds we wait for the API server to answer a plain request
+REQUEST_TIMEOUT = 30
+
+# idle keep-alive connections a client holds on to
+POOL_SIZE = 4
+
+# how kubectl reports the status codes of failed requests
+KUBECTL_ERRORS = (('(NotFound)', 404), ('(Forbidden)', 403),
+                  ('(Unauthorized)', 401), ('(AlreadyExists)', 409),
+                  ('(Conflict)', 409))
+
+_client = None
+_client_lock = Lock()
+
+
+class ApiError(Exception):
+    """a failed API request, `status` is None when there was no answer"""
+    def __init__(self, status, message):
+        super(ApiError, self).__init__(message)
+        self.status = status
+
+
+class KubeConfigError(Exception):
+    pass
+
+
+def get_client():
+    """the client everything in this process shares"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = _make_client()
+        return _client
+
+
+def reset_client():
+    """forget the shared client, e.g. after the kubeconfig changed"""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def _make_client():
+    if os.environ.get(CLIENT_ENV) != 'kubectl':
+        try:
+            return ApiClient(KubeConfig.load())
+        except KubeConfigError:
+            pass
+    return KubectlClient()
+
+
+def api_path(path, params=None):
+    """`path` with the query string of `params`, leaving out None values"""
+    params = dict((key, value) for key, value in (params or {}).items()
+                  if value is not None)
+    if not params:
+        return path
+    return "{}?{}".format(path, urlencode(sorted(params.items())))
+
+
+class _Client(object):
+    """what both clients share, built on their `request` and `stream`"""
+    def get(self, path, params=None, timeout=REQUEST_TIMEOUT):
+        return self.request('GET', path, params, timeout=timeout)
+
+    def list(self, path, label_selector=None, field_selector=None):
+        """the items of the collection at `path`"""
+        return self.get(path, {'labelSelector': label_selector,
+                               'fieldSelector': field_selector})['items']
+
+    def watch(self, path, label_selector=None, field_selector=None,
+              timeout=None):
+        """yields (event type, object) for the collection at `path`, the
+           objects that already exist first as ADDED like
+           `kubectl get --watch` does. Ends once `timeout` secs passed.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        listing = self.get(path, {'labelSelector': label_selector,
+                                  'fieldSelector': field_selector})
+        for item in listing['items']:
+            yield 'ADDED', item
+        changes = self.watch_changes(
+            path, listing['metadata'].get('resourceVersion'),
+            label_selector, field_selector,
+            None if deadline is None else deadline - time.time())
+        try:
+            for event in changes:
+                yield event
+        finally:
+            changes.close()
+
+    def watch_changes(self, path, resource_version, label_selector=None,
+                      field_selector=None, timeout=None):
+        """yields (event type, object) for what changes in the collection
+           at `path` after `resource_version`, e.g. the one of a listing.
+           Ends once `timeout` secs passed. An ERROR event, like 410 Gone
+           once `resource_version` is too old, raises ApiError.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        params = {'labelSelector': label_selector,
+                  'fieldSelector': field_selector, 'watch': 'true',
+                  'resourceVersion': resource_version}
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            params['timeoutSeconds'] = int(math.ceil(remaining))
+        stream = self.stream(path, params, deadline)
+        try:
+            for line in stream:
+                event = json.loads(line)
+                if event['type'] == 'ERROR':
+                    status = event['object']
+                    raise ApiError(status.get('code'), status.get('message'))
+                yield event['type'], event['object']
+        finally:
+            stream.close()
+
+
+class LineStream(object):
+    """The lines of a streamed response, like a watch or followed logs.
+       `close` can be called from any thread to stop it.
+    """
+    def __init__(self, lines, close):
+        self._lines = lines
+        self._close = close
+
+    def __iter__(self):
+        return self._lines
+
+    def close(self):
+        self._close()
+
+
+class ApiClient(_Client):
+    """Sends requests straight to the API server, reusing up to
+       `POOL_SIZE` idle keep-alive connections so we only pay for the TLS
+       handshake once. Streamed responses (watches, followed logs) get a
+       connection of their own.
+    """
+    def __init__(self, config):
+        self.config = config
+        self._idle = []
+        self._lock = Lock()
+
+    def request(self, method, path, params=None, body=None,
+                timeout=REQUEST_TIMEOUT):
+        """sends the request, returns the decoded json response"""
+        with profile_helpers.span('{} {}'.format(method, path), 'api'):
+            return self._request(method, path, params, body, timeout)
+
+    def _request(self, method, path, params, body, timeout):
+        for attempt in range(2):
+            connection, reused = self._connection(timeout)
+            try:
+                response = self._send(connection, method,
+                                      api_path(path, params), body)
+                data = response.read()
+            except (HTTPException, socket.error) as ex:
+                connection.close()
+                # the server may have closed the idle connection on us
+                if reused and attempt == 0:
+                    continue
+                raise ApiError(None, "Unable to reach {}: {}".format(
+                    self.config.server, ex))
+            break
+
+        if response.getheader('connection', '').lower() == 'close':
+            connection.close()
+        else:
+            self._release(connection)
+        if response.status >= 400:
+            raise _api_error(response.status, data)
+        return json.loads(data.decode('utf-8')) if data else {}
+
+    def stream(self, path, params=None, deadline=None):
+        """a LineStream of the response, which ends with the response or
+           once the `deadline` passed
+        """
+        timeout = None if deadline is None else \
+            max(deadline - time.time(), 0.01)
+        connection = self.config.connect(timeout)
+        try:
+            connection.connect()
+            # the connection lets go of its socket when the response
+            # comes without keep-alive, but we need it to stop the stream
+            sock = connection.sock
+            response = self._send(connection, 'GET', api_path(path, params))
+        except (HTTPException, socket.error) as ex:
+            connection.close()
+            raise ApiError(None, "Unable to reach {}: {}".format(
+                self.config.server, ex))
+        if response.status >= 400:
+            data = response.read()
+            connection.close()
+            raise _api_error(response.status, data)
+        return LineStream(self._lines(connection, response),
+                          partial(_shutdown, sock))
+
+    @staticmethod
+    def _lines(connection, response):
+        try:
+            for line in _iter_lines(response):
+                yield line.decode('utf-8', 'replace')
+        except (HTTPException, socket.error, ValueError, AttributeError):
+            # timed out, or closed while we were reading
+            return
+        finally:
+            connection.close()
+
+    def _send(self, connection, method, url, body=None):
+        headers = dict(self.config.headers(), Accept='application/json')
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        connection.request(method, url, body=body, headers=headers)
+        return connection.getresponse()
+
+    def _connection(self, timeout):
+        """returns an idle connection if we have one, and whether it was"""
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is not None:
+            connection.timeout = timeout
+            try:
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+            except socket.error:
+                connection.close()
+        return self.config.connect(timeout), False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < POOL_SIZE:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+
+class KubectlClient(_Client):
+    """The same requests through `kubectl --raw`, for kubeconfigs that
+       need kubectl to authenticate.
+    """
+    COMMANDS = {'GET': 'get', 'POST': 'create', 'PUT': 'replace',
+                'DELETE': 'delete'}
+
+    def request(self, method, path, params=None, body=None,
+                timeout=REQUEST_TIMEOUT):
+        command = ["kubectl", self.COMMANDS[method], "--raw",
+                   api_path(path, params)]
+        body_file = None
+        if body is not None:
+            fd, body_file = tempfile.mkstemp(suffix='.json')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(body, f)
+            command += ["-f", body_file]
+        try:
+            process = process_helpers.run_capture(command)
+        except OSError as ex:
+            raise ApiError(None, "Unable to run kubectl, please make sure "
+                                 "it is installed: {}".format(ex))
+        finally:
+            if body_file is not None:
+                os.remove(body_file)
+        if process.returncode != 0:
+            raise _kubectl_error(process.stderr_text())
+        output = process.stdout_text()
+        return json.loads(output) if output.strip() else {}
+
+    def stream(self, path, params=None, deadline=None):
+        lines = queue.Queue()
+        try:
+            process = process_helpers.StreamingProcess(
+                ["kubectl", "get", "--raw", api_path(path, params)],
+                on_stdout=lines.put, on_exit=lambda: lines.put(None))
+        except OSError as ex:
+            raise ApiError(None, "Unable to run kubectl, please make sure "
+                                 "it is installed: {}".format(ex))
+        return LineStream(self._lines(process, lines, deadline),
+                          process.terminate)
+
+    @staticmethod
+    def _lines(process, lines, deadline):
+        try:
+            while True:
+                try:
+                    line = lines.get(timeout=None if deadline is None
+                                     else max(deadline - time.time(), 0))
+                except queue.Empty:
+                    return
+                if line is None:
+                    break
+                yield line
+            if process.wait() != 0 and process.stderr_text():
+                raise _kubectl_error(process.stderr_text())
+        finally:
+            process.terminate()
+
+
+class KubeConfig(object):
+    """the API server and credentials of the current kubeconfig context"""
+    def __init__(self, server, ssl_context=None, token=None,
+                 username=None, password=None):
+        self.server = server.rstrip('/')
+        url = urlparse(self.server)
+        self.secure = url.scheme == 'https'
+        self.host = url.hostname
+        self.port = url.port or (443 if self.secure else 80)
+        self.ssl_context = ssl_context
+        self.token = token
+        self.username = username
+        self.password = password
+
+    @classmethod
+    def load(cls, path=None):
+        """reads the files in $KUBECONFIG (or ~/.kube/config) the way
+           kubectl merges them; raises KubeConfigError when we can't
+           talk to the cluster without kubectl's help
+        """
+        current_context, merged = _merge_kubeconfigs(
+            [path] if path else _kubeconfig_paths())
+        if current_context not in merged['contexts']:
+            raise KubeConfigError("No current kubeconfig context")
+        context, _ = merged['contexts'][current_context]
+        cluster, cluster_dir = merged['clusters'].get(
+            context.get('cluster'), ({}, None))
+        user, user_dir = merged['users'].get(context.get('user'), ({}, None))
+        if not cluster.get('server'):
+            raise KubeConfigError("No server for context {}".format(
+                current_context))
+        if user.get('exec') or user.get('auth-provider'):
+            raise KubeConfigError("kubectl has to authenticate us")
+
+        token = user.get('token')
+        if user.get('tokenFile'):
+            with open(_resolve(user['tokenFile'], user_dir)) as f:
+                token = f.read().strip()
+
+        ssl_context = None
+        if cluster['server'].startswith('https'):
+            ssl_context = _ssl_context(cluster, cluster_dir, user, user_dir)
+        return cls(cluster['server'], ssl_context, token,
+                   user.get('username'), user.get('password'))
+
+    def connect(self, timeout=None):
+        if self.secure:
+            return HTTPSConnection(self.host, self.port, timeout=timeout,
+                                   context=self.ssl_context)
+        return HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def headers(self):
+        if self.token:
+            return {'Authorization': 'Bearer {}'.format(self.token)}
+        if self.username:
+            credentials = "{}:{}".format(self.username, self.password or '')
+            return {'Authorization': 'Basic {}'.format(
+                b64encode(credentials.encode('utf-8')).decode('ascii'))}
+        return {}
+
+
+def current_context():
+    """`context@server` of the current kubeconfig context, or None when
+       there is none
+    """
+    try:
+        current, merged = _merge_kubeconfigs(_kubeconfig_paths())
+    except KubeConfigError:
+        return None
+    if current not in merged['contexts']:
+        return None
+    context, _ = merged['contexts'][current]
+    cluster, _ = merged['clusters'].get(context.get('cluster'), ({}, None))
+    return "{}@{}".format(current, cluster.get('server', ''))
+
+
+def _merge_kubeconfigs(paths):
+    """reads the kubeconfig files the way kubectl merges them, returns
+       the current context and every context, cluster and user by name
+       (with the dir of the file that defined it)
+    """
+    merged = {'contexts': {}, 'clusters': {}, 'users': {}}
+    current_context = None
+    for kubeconfig in paths:
+        config = _read_kubeconfig(kubeconfig)
+        current_context = current_context or config.get('current-context')
+        for section, key in (('contexts', 'context'),
+                             ('clusters', 'cluster'),
+                             ('users', 'user')):
+            for entry in config.get(section) or []:
+                # the first file to define a name wins
+                if entry.get('name') not in merged[section]:
+                    merged[section][entry.get('name')] = (
+                        entry.get(key) or {},
+                        os.path.dirname(os.path.abspath(kubeconfig)))
+    return current_context, merged
+
+
+def _kubeconfig_paths():
+    if os.environ.get('KUBECONFIG'):
+        paths = [path for path in
+                 os.environ['KUBECONFIG'].split(os.pathsep) if path]
+    else:
+        paths = [os.path.join(os.path.expanduser('~'), '.kube', 'config')]
+    paths = [path for path in paths if os.path.isfile(path)]
+    if not paths:
+        raise KubeConfigError("No kubeconfig found")
+    return paths
+
+
+def _read_kubeconfig(path):
+    # yaml is slow to import and only needed once we talk to the cluster
+    import yaml
+    try:
+        with open(path) as f:
+            return yaml.safe_load(f) or {}
+    except (IOError, yaml.YAMLError) as ex:
+        raise KubeConfigError("Unable to read {}: {}".format(path, ex))
+
+
+def _resolve(path, directory):
+    """kubeconfig paths are relative to the file they are in"""
+    return path if os.path.isabs(path) else os.path.join(directory, path)
+
+
+def _ssl_context(cluster, cluster_dir, user, user_dir):
+    context = ssl.create_default_context()
+    if cluster.get('insecure-skip-tls-verify'):
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    elif cluster.get('certificate-authority-data'):
+        context.load_verify_locations(cadata=b64decode(
+            cluster['certificate-authority-data']).decode('ascii'))
+    elif cluster.get('certificate-authority'):
+        context.load_verify_locations(
+            _resolve(cluster['certificate-authority'], cluster_dir))
+
+    cert_data = user.get('client-certificate-data')
+    key_data = user.get('client-key-data')
+    if cert_data and key_data:
+        # ssl only loads client certificates from files
+        cert_file = _temp_file(b64decode(cert_data))
+        key_file = _temp_file(b64decode(key_data))
+        try:
+            context.load_cert_chain(cert_file, key_file)
+        finally:
+            os.remove(cert_file)
+            os.remove(key_file)
+    elif user.get('client-certificate') and user.get('client-key'):
+        context.load_cert_chain(
+            _resolve(user['client-certificate'], user_dir),
+            _resolve(user['client-key'], user_dir))
+    return context
+
+
+def _temp_file(data):
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def _shutdown(sock):
+    """unblocks whoever is reading from `sock`"""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except socket.error:
+        pass
+
+
+def _iter_lines(response):
+    if hasattr(response, 'readline'):
+        return iter(response.readline, b'')
+    return _iter_lines_py2(response)
+
+
+def _iter_lines_py2(response):
+    # python 2's HTTPResponse has no readline and read(n) waits for n bytes
+    line = b''
+    while True:
+        char = response.read(1)
+        if not char:
+            break
+        line += char
+        if char == b'\n':
+            yield line
+            line = b''
+    if line:
+        yield line
+
+
+def _api_error(status, data):
+    try:
+        message = json.loads(data.decode('utf-8'))['message']
+    except (ValueError, KeyError, TypeError):
+        message = data.decode('utf-8', 'replace')
+    return ApiError(status, message)
+
+
+def _kubectl_error(stderr):
+    for marker, status in KUBECTL_ERRORS:
+        if marker in stderr:
+            return ApiError(status, stderr.strip())
+    return ApiError(None, stderr.strip())
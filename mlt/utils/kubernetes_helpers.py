@@ -18,20 +18,205 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import calendar
+import json
 import os
 import sys
-import json
+import time
+
+from mlt.utils import (concurrency_helpers, constants, files,
+                       kubernetes_client, process_helpers)
+
+# the CRD API moved out of beta in kubernetes 1.16
+CRD_PATHS = ('/apis/apiextensions.k8s.io/v1/customresourcedefinitions',
+             '/apis/apiextensions.k8s.io/v1beta1/customresourcedefinitions')
 
-from subprocess import call
+# labels `mlt deploy` puts on every object (and pod) of a run
+APP_LABEL = 'mlt-app-name'
+RUN_LABEL = 'mlt-run-id'
+# and on every run of a sweep
+SWEEP_LABEL = 'mlt-sweep-id'
 
-from mlt.utils import process_helpers
+# object count quotas a run can be checked against before it is deployed,
+# besides the `count/<resource>` ones
+COUNTED_RESOURCES = ('pods', 'services', 'configmaps', 'secrets',
+                     'persistentvolumeclaims')
+
+# seconds a single watch stays open before `keep_watching` re-opens it
+WATCH_TIMEOUT = 300
+
+# seconds we wait before re-opening a watch the API server ended, this
+# doubles every time up to the max
+WATCH_BACKOFF = 0.5
+MAX_WATCH_BACKOFF = 8
 
 
 def ensure_namespace_exists(ns):
-    exit_code = call(["kubectl", "get", "namespace", ns], stdout=open(
-        os.devnull, 'wb'), stderr=open(os.devnull, 'wb'))
-    if exit_code is not 0:
+    checks = ClusterChecks()
+    if checks.seen('namespaces', ns):
+        return
+    try:
+        kubernetes_client.get_client().get(
+            "/api/v1/namespaces/{}".format(ns))
+    except kubernetes_client.ApiError:
         process_helpers.run(["kubectl", "create", "namespace", ns])
+    checks.remember('namespaces', [ns])
+
+
+def run_labels(app_name, run_id):
+    return {APP_LABEL: app_name, RUN_LABEL: run_id}
+
+
+def collection_path(api_version, kind, namespace):
+    """the REST path of the namespaced collection of `kind` objects, e.g.
+       `/apis/kubeflow.org/v1alpha1/namespaces/ns/tfjobs`
+    """
+    prefix = "/api" if '/' not in api_version else "/apis"
+    return "{}/{}/namespaces/{}/{}".format(prefix, api_version, namespace,
+                                           _plural(kind.lower()))
+
+
+def _plural(name):
+    """the resource name of a kind, the way kubernetes guesses it"""
+    if name.endswith('s'):
+        return name + 'es'
+    if name.endswith('y'):
+        return name[:-1] + 'ies'
+    return name + 's'
+
+
+def label_selector(labels):
+    """the label selector matching all of `labels`"""
+    return ",".join("{}={}".format(key, value)
+                    for key, value in sorted(labels.items()))
+
+
+def add_labels(obj, labels):
+    """adds `labels` to a kubernetes object, to every pod template in it
+       (so the pods its controller creates get them too) and to the items
+       of a List
+    """
+    if not isinstance(obj, dict):
+        return
+    metadata = obj['metadata'] = obj.get('metadata') or {}
+    metadata['labels'] = dict(metadata.get('labels') or {}, **labels)
+    for item in obj.get('items') or []:
+        add_labels(item, labels)
+    _label_pod_templates(obj.get('spec'), labels)
+
+
+def _label_pod_templates(data, labels):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key == 'template' and isinstance(value, dict):
+                add_labels(value, labels)
+            else:
+                _label_pod_templates(value, labels)
+    elif isinstance(data, list):
+        for value in data:
+            _label_pod_templates(value, labels)
+
+
+def keep_watching(path, on_change, stopped, **selectors):
+    """calls `on_change(event type, object)` for the collection at `path`
+       until the `stopped` Event is set, re-opening the watch with backoff
+       whenever it ends or fails
+    """
+    client = kubernetes_client.get_client()
+    backoff = WATCH_BACKOFF
+    while not stopped.is_set():
+        try:
+            for event_type, obj in client.watch(
+                    path, timeout=WATCH_TIMEOUT, **selectors):
+                if stopped.is_set():
+                    return
+                on_change(event_type, obj)
+                backoff = WATCH_BACKOFF
+        except kubernetes_client.ApiError:
+            pass
+        stopped.wait(backoff)
+        backoff = min(backoff * 2, MAX_WATCH_BACKOFF)
+
+
+def quota_headroom(namespace):
+    """how many more objects the resource quotas of `namespace` allow, as
+       {resource: (hard limit, how many more)} for the object count quotas;
+       the tightest quota wins
+    """
+    headroom = {}
+    for quota in kubernetes_client.get_client().list(
+            "/api/v1/namespaces/{}/resourcequotas".format(namespace)):
+        status = quota.get('status') or {}
+        used = status.get('used') or {}
+        for resource, hard in (status.get('hard') or {}).items():
+            if resource not in COUNTED_RESOURCES and \
+                    not resource.startswith('count/'):
+                continue
+            try:
+                hard = int(hard)
+                left = hard - int(used.get(resource, 0))
+            except ValueError:
+                continue
+            if resource not in headroom or left < headroom[resource][1]:
+                headroom[resource] = (hard, left)
+    return headroom
+
+
+def quota_usage(obj):
+    """what creating `obj` takes of the object count quotas, the pods its
+       controller creates included, as {resource: count}
+    """
+    kind = obj.get('kind') or ''
+    api_version = obj.get('apiVersion') or ''
+    resource = _plural(kind.lower())
+    if '/' in api_version:
+        usage = {'count/{}.{}'.format(resource, api_version.split('/')[0]): 1}
+    else:
+        usage = {'count/' + resource: 1}
+        if resource in COUNTED_RESOURCES:
+            usage[resource] = 1
+    if kind != 'Pod':
+        pods = _pod_count(obj.get('spec'))
+        if pods:
+            usage['pods'] = pods
+    return usage
+
+
+def _pod_count(data):
+    """the pods a controller creates from the pod templates in its spec"""
+    if isinstance(data, dict):
+        if isinstance(data.get('template'), dict):
+            for key in ('replicas', 'parallelism'):
+                if isinstance(data.get(key), int):
+                    return data[key]
+            return 1
+        return sum(_pod_count(value) for value in data.values())
+    if isinstance(data, list):
+        return sum(_pod_count(value) for value in data)
+    return 0
+
+
+def event_time(event):
+    """when an event last happened, as an RFC 3339 timestamp"""
+    return event.get('lastTimestamp') or event.get('eventTime') or \
+        event['metadata'].get('creationTimestamp') or ''
+
+
+def age(timestamp, now=None):
+    """how long ago an RFC 3339 timestamp was, the way kubectl shows it"""
+    if not timestamp:
+        return '<unknown>'
+    seconds = max(0, int((now or time.time()) - epoch_seconds(timestamp)))
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            return "{}{}".format(seconds // size, unit)
+    return "{}s".format(seconds)
+
+
+def epoch_seconds(timestamp):
+    """an RFC 3339 timestamp as seconds since the epoch"""
+    return calendar.timegm(time.strptime(timestamp.split('.')[0].rstrip('Z'),
+                                         '%Y-%m-%dT%H:%M:%S'))
 
 
 def check_crds(exit_on_failure=False, app_name=None):
@@ -65,15 +250,77 @@ def checking_crds_on_k8(crd_set):
     """
     Check if given crd list installed on K8 or not.
     """
-
+    checks = ClusterChecks()
+    crds = sorted(crd for crd in crd_set
+                  if crd and not checks.seen('crds', crd))
     try:
-        current_crds_json = process_helpers.run_popen(
-            "kubectl get crd -o json", shell=True
-        ).stdout.read().decode('utf-8')
-        current_crds = set([str(x['metadata']['name'])
-                            for x in
-                            json.loads(current_crds_json)['items']])
-        return crd_set - current_crds
+        found = concurrency_helpers.parallel_map(crd_exists, crds)
     except Exception as ex:
         print("Crd_Checking - Exception: {}".format(ex))
         return set()
+    checks.remember('crds', [crd for crd, exists in zip(crds, found)
+                             if exists])
+    return set(crd for crd, exists in zip(crds, found) if not exists)
+
+
+def crd_exists(name):
+    """asks for the one CRD by name rather than listing all of them, the
+       schemas of some CRDs are huge
+    """
+    client = kubernetes_client.get_client()
+    for path in CRD_PATHS:
+        try:
+            client.get("{}/{}".format(path, name))
+            return True
+        except kubernetes_client.ApiError as ex:
+            # clusters before 1.16 only have the beta API, newer ones
+            # only the v1 one
+            if ex.status != 404:
+                raise
+    return False
+
+
+class ClusterChecks(object):
+    """The CRDs and namespaces we recently saw in the cluster of the
+       current kube context, kept in the mlt cache dir so every deploy
+       doesn't have to ask again. Only what exists is remembered, for up
+       to `CLUSTER_CACHE_TTL` secs.
+    """
+    def __init__(self):
+        self.context = kubernetes_client.current_context()
+        self.path = files.cache_dir('cluster-checks.json')
+        self.ttl = float(os.environ.get(constants.CLUSTER_CACHE_TTL_ENV,
+                                        constants.CLUSTER_CACHE_TTL))
+
+    def seen(self, kind, name):
+        checked = self._read().get(self.context, {}).get(kind, {}).get(name)
+        return checked is not None and time.time() - checked < self.ttl
+
+    def remember(self, kind, names):
+        if not names:
+            return
+        cache = self._read()
+        checks = cache.setdefault(self.context, {}).setdefault(kind, {})
+        for name in names:
+            checks[name] = time.time()
+        self._write(cache)
+
+    def forget(self):
+        cache = self._read()
+        if cache.pop(self.context, None) is not None:
+            self._write(cache)
+
+    def _read(self):
+        if self.context is None:
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _write(self, cache):
+        if self.context is None:
+            return
+        # other mlt processes may read the cache while we write it
+        files.write_atomic(self.path, json.dumps(cache))
@@ -19,11 +19,30 @@
 #
 import json
 import os
+import re
 import sys
+import time
+from threading import Semaphore, Thread
 
-from time import sleep
+from mlt.utils import (constants, kubernetes_client, kubernetes_helpers,
+                       profile_helpers, run_history)
 
-from mlt.utils import process_helpers
+try:
+    import queue
+except ImportError:
+    # python 2
+    import Queue as queue
+
+# pods in any of these phases won't change phase again before we can
+# fetch logs from them
+READY_POD_PHASES = ('Running', 'Succeeded', 'Failed')
+
+# lines buffered per pod before its log reader has to wait for the printer
+LOG_BUFFER_LINES = 1000
+
+# the units of `--since` and `--older-than` durations, in seconds
+DURATION_UNITS = {'d': 86400, 'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+DURATION_REGEX = re.compile(r'(\d+(?:\.\d+)?)(ms|d|h|m|s)')
 
 
 def call_logs(config, args):
@@ -32,7 +51,9 @@ def call_logs(config, args):
     and provides run-id to _get_logs method to
     fetch logs.
     """
-    if os.path.exists('.push.json'):
+    if args.get('--run'):
+        data = run_history.load_deployed_run(args['--run'])
+    elif os.path.exists('.push.json'):
         with open('.push.json', 'r') as f:
             data = json.load(f)
     else:
@@ -46,91 +67,189 @@ def call_logs(config, args):
         print("Please re-deploy app again, something went wrong.")
         sys.exit(1)
 
-    prefix = "-".join([config["name"], app_run_id[0], app_run_id[1]])
+    selector = kubernetes_helpers.label_selector(
+        kubernetes_helpers.run_labels(config["name"], data['app_run_id']))
     namespace = config['namespace']
-    retires = args["--retries"]
+    timeout = args.get("--timeout")
+    if timeout is None:
+        timeout = constants.POD_TIMEOUT
 
     # check for pod readiness before fetching logs.
-    found = check_for_pods_readiness(namespace, prefix, retires)
+    pods = check_for_pods_readiness(namespace, selector, timeout)
 
-    if found:
+    if pods:
         since = args["--since"]
-        _get_logs(prefix, since, namespace)
+        _get_logs(pods, since, namespace, args.get("--timestamps"))
     else:
         print("No logs found for this job.")
 
 
-def _get_logs(prefix, since, namespace):
+def _get_logs(pods, since, namespace, timestamps=False):
     """
-    Fetches logs using kubetail
+    Follows the logs of every pod of the run at the same time
     """
-    log_cmd = "kubetail {} --since {} " \
-              "--namespace {}".format(prefix, since, namespace)
+    print("Will tail {} logs...".format(len(pods)))
     try:
-        # TODO: remove shell=True. and make log_cmd as List.
-        logs = process_helpers.run_popen(log_cmd, shell=True)
-
-        while True:
-            output = logs.stdout.readline()
-            if output == '' and logs.poll() is not None:
-                error = logs.stderr.readline()
-                if error:
-                    raise Exception(error)
-                break
-            if output:
-                if 'No pods exists that matches' not in output:
-                    print(output.strip())
+        LogMultiplexer(namespace, pods, since, timestamps).run()
+    except KeyboardInterrupt:
+        pass
     except Exception as ex:
-        if 'command not found' in str(ex):
-            print("Please install `{}`. "
-                  "It is a prerequisite for `mlt logs` "
-                  "to work".format(str(ex).split()[1]))
-        else:
-            print("Exception: {}".format(ex))
+        print("Exception: {}".format(ex))
         sys.exit()
 
 
-def check_for_pods_readiness(namespace, filter_tag, retries):
-    print("Checking for pod(s) readiness")
-    tries = 0
-
-    pods_found = 0
-    pods_running = 0
-    while True:
-        if tries == retries:
-            print("Max retries Reached.")
-            break
-
-        # TODO: Remove shell=True and make it to work.
-        pods = process_helpers.run_popen(
-            "kubectl get pods --namespace {} ".format(namespace), shell=True
-        ).stdout.read().strip().splitlines()
-
-        if not pods:
-            tries += 1
-            print("Retrying {}/{}".format(tries, retries))
-            sleep(1)
-            continue
-        else:
-            for pod in pods:
-                if filter_tag in pod:
-                    pods_found += 1
-                    status = str(pod.split()[2].strip())
-                    if status == 'Running':
-                        pods_running += 1
-                    else:
-                        tries += 1
-                        print("Retrying {}/{}".format(tries, retries))
-                        sleep(1)
+class LogMultiplexer(object):
+    """Follows the logs of several pods concurrently and prints them tagged
+       with the pod name.
+       Every pod gets its own followed log stream and reader thread feeding
+       a bounded queue, so a chatty pod blocks on its own full queue
+       instead of starving the others; lines are printed round robin
+       across pods, or oldest first when `timestamps` is set.
+    """
+    def __init__(self, namespace, pods, since, timestamps=False,
+                 buffer_lines=LOG_BUFFER_LINES, output=None):
+        self.namespace = namespace
+        self.pods = pods
+        self.since = since
+        self.timestamps = timestamps
+        self.output = output or sys.stdout
+        self.queues = dict((pod, queue.Queue(maxsize=buffer_lines))
+                           for pod in pods)
+        # counts lines (and end of stream markers) waiting to be printed
+        self.pending = Semaphore(0)
+        self.streams = []
+
+    def run(self):
+        client = kubernetes_client.get_client()
+        try:
+            for pod in self.pods:
+                stream = client.stream(
+                    "/api/v1/namespaces/{}/pods/{}/log".format(
+                        self.namespace, pod), self._log_params())
+                self.streams.append(stream)
+                reader = Thread(target=self._read,
+                                args=(stream, self.queues[pod]))
+                reader.daemon = True
+                reader.start()
+            self._print_lines()
+        finally:
+            for stream in self.streams:
+                stream.close()
+
+    def _log_params(self):
+        return {'follow': 'true',
+                'sinceSeconds': since_seconds(self.since),
+                'timestamps': 'true' if self.timestamps else None}
+
+    def _read(self, stream, line_queue):
+        try:
+            for line in stream:
+                self._queue_line(line_queue, line)
+        finally:
+            self._queue_line(line_queue, None)
+
+    def _queue_line(self, line_queue, line):
+        """None marks the end of the stream"""
+        line_queue.put(line if line is None else line.rstrip('\n'))
+        self.pending.release()
+
+    def _print_lines(self):
+        heads = dict((pod, None) for pod in self.pods)
+        rotation = list(self.pods)
+        while heads:
+            self.pending.acquire()
+            for pod in heads:
+                if heads[pod] is None:
+                    try:
+                        heads[pod] = self.queues[pod].get_nowait()
+                    except queue.Empty:
                         continue
+                    if heads[pod] is None:
+                        # the stream ended, that is what we were woken for
+                        del heads[pod]
+                        rotation.remove(pod)
+                        break
+            else:
+                pod = self._next_pod(heads, rotation)
+                self.output.write("[{}] {}\n".format(pod, heads[pod]))
+                self.output.flush()
+                heads[pod] = None
+
+    def _next_pod(self, heads, rotation):
+        """picks the pod whose line gets printed next"""
+        ready = [pod for pod in rotation if heads[pod] is not None]
+        if self.timestamps:
+            return min(ready, key=lambda pod: _timestamp_key(heads[pod]))
+        # move the chosen pod to the back of the rotation
+        pod = ready[0]
+        rotation.remove(pod)
+        rotation.append(pod)
+        return pod
+
+
+def since_seconds(duration):
+    """seconds in a duration like kubectl's `--since`, e.g. 1h30m or 10s"""
+    parts = DURATION_REGEX.findall(duration or '')
+    if not parts or ''.join(
+            number + unit for number, unit in parts) != duration:
+        raise ValueError("Invalid duration {}".format(duration))
+    return max(1, int(sum(float(number) * DURATION_UNITS[unit]
+                          for number, unit in parts)))
+
+
+def _timestamp_key(line):
+    """kubectl's RFC3339Nano timestamps drop trailing zeros of the
+       fraction, so pad it before comparing timestamps as strings
+    """
+    timestamp = line.split(' ', 1)[0].rstrip('Z')
+    seconds, _, fraction = timestamp.partition('.')
+    return seconds + '.' + fraction.ljust(9, '0')
 
-        if pods_running == pods_found and pods_found > 0:
-            break
-        else:
-            pods_found = 0
-            pods_running = 0
-            tries += 1
-            print("Retrying {}/{}".format(tries, retries))
-            sleep(1)
 
-    return pods_found > 0
+@profile_helpers.traced('wait', 'pods ready')
+def check_for_pods_readiness(namespace, selector, timeout):
+    """watches the pods matching the label `selector` and returns their
+       names as soon as they are all Running (or already done), or []
+       after `timeout` secs
+    """
+    print("Checking for pod(s) readiness")
+    client = kubernetes_client.get_client()
+    path = "/api/v1/namespaces/{}/pods".format(namespace)
+    deadline = time.time() + timeout
+    # all pods that already exist count, not just the first ones listed
+    try:
+        listing = client.get(path, {'labelSelector': selector})
+    except kubernetes_client.ApiError as ex:
+        print("Unable to watch pods: {}".format(ex))
+        return []
+    phases = dict((pod['metadata']['name'], pod['status'].get('phase'))
+                  for pod in listing['items'])
+    if _all_ready(phases):
+        return sorted(phases)
+
+    pods = client.watch_changes(
+        path, listing['metadata'].get('resourceVersion'),
+        label_selector=selector, timeout=deadline - time.time())
+    try:
+        for event_type, pod in pods:
+            if event_type == 'DELETED':
+                phases.pop(pod['metadata']['name'], None)
+            else:
+                phases[pod['metadata']['name']] = pod['status'].get('phase')
+            if _all_ready(phases):
+                return sorted(phases)
+    except kubernetes_client.ApiError as ex:
+        print("Unable to watch pods: {}".format(ex))
+        return []
+    finally:
+        pods.close()
+
+    if time.time() >= deadline:
+        print("Timed out waiting for pod(s) to be Running.")
+    return []
+
+
+def _all_ready(phases):
+    """whether there are pods and all of them are Running or done"""
+    return bool(phases) and all(phase in READY_POD_PHASES
+                                for phase in phases.values())
@@ -0,0 +1,151 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""Rendered manifests, one per kubernetes object, with the run id of the
+   deploy that rendered them swapped for `RUN_MARKER`. That way the same
+   templates, image and parameters give the same manifests in every run,
+   so they can be cached and compared with the ones of the live run.
+"""
+import difflib
+import hashlib
+import json
+import os
+
+from mlt.utils import constants, files
+
+RUN_MARKER = '__MLT_RUN_ID__'
+
+# bump whenever rendering changes, so older cache entries aren't used
+RENDER_VERSION = 1
+
+
+def render_key(filename, template, **substitutions):
+    """the cache key of rendering `template` (the contents of `filename`)
+       with `substitutions`, which must not include the run id
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([RENDER_VERSION, filename, substitutions],
+                             sort_keys=True).encode('utf-8'))
+    digest.update(template.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def manifest(obj, text, run_id):
+    """the manifest of the rendered object `obj`, `text` being its YAML"""
+    return {'key': object_key(obj, run_id),
+            'kind': obj.get('kind'), 'api_version': obj.get('apiVersion'),
+            'text': normalize(text, run_id),
+            'hash': hashlib.sha256(
+                normalize(text, run_id).encode('utf-8')).hexdigest()}
+
+
+def object_key(obj, run_id):
+    """`Kind/name` of the rendered object `obj`, without the run id"""
+    name = (obj.get('metadata') or {}).get('name')
+    return normalize("{}/{}".format(obj.get('kind'), name), run_id)
+
+
+def normalize(text, run_id):
+    return text.replace(run_id, RUN_MARKER)
+
+
+def for_run(text, run_id):
+    """`text` with the marker swapped back for `run_id`"""
+    return text.replace(RUN_MARKER, run_id)
+
+
+def is_per_run(key):
+    """objects named after the run are new in every run, others (like a
+       service named after the app) are shared by all runs; `key` is the
+       key of the object's manifest
+    """
+    return RUN_MARKER in key
+
+
+def load(key):
+    """the cached manifests of a render, None if they aren't cached"""
+    path = _path(key)
+    try:
+        with open(path) as f:
+            manifests = json.load(f)
+    except (IOError, ValueError):
+        return None
+    try:
+        # renders still in use are the last to be pruned
+        os.utime(path, None)
+    except OSError:
+        pass
+    return manifests
+
+
+def store(key, manifests):
+    files.write_atomic(_path(key), json.dumps(manifests))
+    _prune()
+
+
+def _prune():
+    """removes all but the `RENDER_CACHE_KEPT` most recently used renders,
+       every build makes a new image so new renders keep coming
+    """
+    cache = files.cache_dir('rendered')
+    entries = []
+    for name in os.listdir(cache):
+        path = os.path.join(cache, name)
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            # another mlt process pruned it in the meantime
+            continue
+    for _, path in sorted(entries, reverse=True)[
+            constants.RENDER_CACHE_KEPT:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def diff(old, new):
+    """a unified diff per changed manifest, from the `old` to the `new`
+       {key: text}; `old` is None when we don't know what's live
+    """
+    old = old or {}
+    lines = []
+    for key in sorted(set(old) | set(new)):
+        if old.get(key) == new.get(key):
+            continue
+        lines.extend(difflib.unified_diff(
+            _lines(old.get(key)), _lines(new.get(key)),
+            fromfile=_display(key) if key in old else '/dev/null',
+            tofile=_display(key) if key in new else '/dev/null'))
+    return ''.join(lines)
+
+
+def _lines(text):
+    if text is None:
+        return []
+    return [line + '\n' for line in _display(text).splitlines()]
+
+
+def _display(text):
+    return text.replace(RUN_MARKER, '$run')
+
+
+def _path(key):
+    return files.cache_dir('rendered', key + '.json')
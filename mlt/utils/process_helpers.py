@@ -19,23 +19,142 @@
 #
 import os
 import sys
-from subprocess import check_output, CalledProcessError, Popen, PIPE
+import time
+from collections import deque
+from subprocess import Popen, PIPE
+from threading import Lock, Thread
+
+from mlt.utils import profile_helpers
+
+# lines of each output stream a StreamingProcess keeps for showing errors
+TAIL_LINES = 200
 
 
 def run(command, cwd=None):
-    try:
-        output = check_output(command, cwd=cwd).decode("utf-8")
-    except CalledProcessError as e:
-        print(e.output)
+    process = run_capture(command, cwd=cwd, on_stderr=sys.stderr.write)
+    if process.returncode != 0:
+        print(process.stdout_text())
         sys.exit(1)
 
-    return output
+    return process.stdout_text()
 
 
-def run_popen(command, shell=False, stdout=PIPE, stderr=PIPE):
+def run_popen(command, shell=False, stdout=PIPE, stderr=PIPE, cwd=None,
+              env=None):
     """to suppress output, pass False to stdout or stderr
-       None is a valid option that we want to allow"""
+       None is a valid option that we want to allow
+       prefer `StreamingProcess` whenever output is piped, a pipe nobody
+       reads from blocks the command once the pipe buffer fills up"""
     with open(os.devnull, 'w') as quiet:
         stdout = quiet if stdout is False else stdout
         stderr = quiet if stderr is False else stderr
-        return Popen(command, stdout=stdout, stderr=stderr, shell=shell)
+        return Popen(command, stdout=stdout, stderr=stderr, shell=shell,
+                     cwd=cwd, env=env)
+
+
+def run_capture(command, shell=False, cwd=None, env=None, on_stderr=None):
+    """runs `command` to completion keeping all of its output,
+       returns the finished `StreamingProcess`"""
+    process = StreamingProcess(command, shell=shell, cwd=cwd, env=env,
+                               on_stderr=on_stderr, tail_lines=None)
+    process.wait()
+    return process
+
+
+class StreamingProcess(object):
+    """Runs `command` with both stdout and stderr drained on background
+       threads, so a chatty command can never fill up a pipe and block.
+       Every decoded line is handed to `on_stdout` / `on_stderr` as it
+       arrives and the last `tail_lines` lines of each stream are kept
+       (all of them with None). `on_exit` is called once both streams
+       have ended.
+    """
+    def __init__(self, command, shell=False, cwd=None, env=None,
+                 on_stdout=None, on_stderr=None, on_exit=None,
+                 tail_lines=TAIL_LINES):
+        self.command = command
+        self.stdout_tail = deque(maxlen=tail_lines)
+        self.stderr_tail = deque(maxlen=tail_lines)
+        self.on_exit = on_exit
+        self.started = time.time()
+        self.finished = None
+        self.process = run_popen(command, shell=shell, cwd=cwd, env=env)
+        self._open_streams = 2
+        self._lock = Lock()
+        self.readers = [
+            self._start_reader(self.process.stdout, self.stdout_tail,
+                               on_stdout),
+            self._start_reader(self.process.stderr, self.stderr_tail,
+                               on_stderr)]
+
+    def _start_reader(self, stream, tail, callback):
+        reader = Thread(target=self._read, args=(stream, tail, callback))
+        reader.daemon = True
+        reader.start()
+        return reader
+
+    def _read(self, stream, tail, callback):
+        try:
+            for line in iter(stream.readline, b''):
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8', 'replace')
+                tail.append(line)
+                if callback is not None:
+                    callback(line)
+        finally:
+            with self._lock:
+                self._open_streams -= 1
+                ended = self._open_streams == 0
+            if ended:
+                self.finished = time.time()
+                profile_helpers.add(
+                    profile_helpers.command_name(self.command), 'exec',
+                    self.started, self.finished - self.started,
+                    command=self.command)
+                if self.on_exit is not None:
+                    self.on_exit()
+
+    @property
+    def returncode(self):
+        """None while the command is still running"""
+        return self.process.poll()
+
+    @property
+    def duration(self):
+        """seconds from start until the output ended, or until now"""
+        return (self.finished or time.time()) - self.started
+
+    def poll(self):
+        return self.process.poll()
+
+    def wait(self, timeout=None):
+        """waits for the output to be drained and the command to exit,
+           returns the exit code or None if `timeout` secs passed first
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        for reader in self.readers:
+            reader.join(None if deadline is None
+                        else max(0, deadline - time.time()))
+            if reader.is_alive():
+                return None
+        if timeout is None:
+            return self.process.wait()
+        # the output has ended, so the command is exiting; python 2's
+        # `Popen.wait` has no timeout so give it until the deadline
+        while self.poll() is None and time.time() < deadline:
+            time.sleep(0.01)
+        return self.poll()
+
+    def terminate(self):
+        if self.poll() is None:
+            self.process.terminate()
+
+    def stdout_text(self):
+        """the kept stdout lines, once the stream has ended"""
+        self.readers[0].join()
+        return ''.join(self.stdout_tail)
+
+    def stderr_text(self):
+        """the kept stderr lines, once the stream has ended"""
+        self.readers[1].join()
+        return ''.join(self.stderr_tail)
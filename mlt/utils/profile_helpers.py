@@ -0,0 +1,167 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""Where the time of an mlt command goes, for `--profile`. Spans are only
+   kept once `start` was called, until then `span` and `traced` cost next
+   to nothing. `finish` prints a summary table of the spans, or writes
+   them to a file in the Chrome trace format (open it in
+   chrome://tracing or https://ui.perfetto.dev).
+"""
+from __future__ import print_function
+
+import functools
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from threading import Lock, current_thread
+
+SUMMARY_COLUMNS = ['SPAN', 'CATEGORY', 'CALLS', 'TOTAL', 'MAX']
+
+# the spans of this process, None while we aren't profiling
+_spans = None
+_started = None
+_lock = Lock()
+
+
+def start():
+    global _spans, _started
+    _spans = []
+    _started = time.time()
+
+
+def enabled():
+    return _spans is not None
+
+
+def add(name, category, started, duration, **args):
+    """keeps a span that took `duration` secs from `started` on, for what
+       doesn't fit a `with span(...)` block
+    """
+    if _spans is None:
+        return
+    thread = current_thread()
+    with _lock:
+        _spans.append({'name': name, 'cat': category, 'started': started,
+                       'duration': duration, 'tid': thread.ident,
+                       'thread': thread.name, 'args': args})
+
+
+@contextmanager
+def span(name, category='mlt', **args):
+    """keeps how long the block took as a span"""
+    if _spans is None:
+        yield
+        return
+    started = time.time()
+    try:
+        yield
+    finally:
+        add(name, category, started, time.time() - started, **args)
+
+
+def traced(category, name=None):
+    """decorates a function so that each call is a span, named after the
+       function unless `name` is given
+    """
+    def decorate(func):
+        span_name = name or func.__name__.strip('_').replace('_', ' ')
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def command_name(command):
+    """what a subprocess span is called: the program and its subcommand,
+       e.g. `kubectl apply` or `make build`
+    """
+    words = list(command) if isinstance(command, (list, tuple)) \
+        else command.split()
+    # shell commands may start with environment variables
+    while words and '=' in words[0]:
+        words.pop(0)
+    if not words:
+        return ''
+    name = os.path.basename(words[0])
+    rest = iter(words[1:])
+    for word in rest:
+        if not word.startswith('-'):
+            return '{} {}'.format(name, word)
+        # the value of an option before the subcommand, like --namespace
+        if '=' not in word:
+            next(rest, None)
+    return name
+
+
+def finish(output=None):
+    """prints the summary of the spans to stderr, or with `output` writes
+       them there as a Chrome trace; profiling stops
+    """
+    global _spans
+    spans, _spans = _spans, None
+    if spans is None:
+        return
+    if output:
+        with open(output, 'w') as f:
+            json.dump(chrome_trace(spans, _started), f)
+        sys.stderr.write("Wrote the profile of {} span(s) to {}\n".format(
+            len(spans), output))
+    else:
+        sys.stderr.write(summary(spans) + '\n')
+
+
+def chrome_trace(spans, started):
+    """the spans as Chrome trace complete events, in microseconds since
+       `started`, with a name for every thread
+    """
+    pid = os.getpid()
+    events = [{'name': s['name'], 'cat': s['cat'], 'ph': 'X', 'pid': pid,
+               'tid': s['tid'],
+               'ts': int((s['started'] - started) * 1e6),
+               'dur': int(s['duration'] * 1e6), 'args': s['args']}
+              for s in sorted(spans, key=lambda s: s['started'])]
+    threads = dict((s['tid'], s['thread']) for s in spans)
+    events.extend({'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                   'tid': tid, 'args': {'name': name}}
+                  for tid, name in sorted(threads.items()))
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def summary(spans):
+    """a table of the spans by name, the ones that took longest first"""
+    # only needed once we profile, so every command doesn't import it
+    from tabulate import tabulate
+
+    totals = {}
+    for s in spans:
+        calls, total, longest = totals.get((s['name'], s['cat']),
+                                           (0, 0.0, 0.0))
+        totals[(s['name'], s['cat'])] = (
+            calls + 1, total + s['duration'], max(longest, s['duration']))
+    rows = [[name, category, calls, "{:.3f}s".format(total),
+             "{:.3f}s".format(longest)]
+            for (name, category), (calls, total, longest) in sorted(
+                totals.items(), key=lambda item: -item[1][1])]
+    return tabulate(rows, headers=SUMMARY_COLUMNS, tablefmt="plain")
@@ -18,34 +18,92 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
-import progressbar
+import re
 import time
+from threading import Event
 
+import progressbar
 
-def duration_progress(activity, duration, is_done):
-    def progress(activity, iterations=100):
-        bar = progressbar.ProgressBar(
-            widgets=[activity, ' ', progressbar.Bar(),
-                     ' (', progressbar.ETA(), ') ', ])
-        return bar(range(iterations))
-
-    if duration is not None:
-        iterations = 100
-        time_per_iteration = float(duration) / float(iterations)
-
-        bar = progress(activity, iterations)
-        cursor = 0
-        for cursor in range(iterations):
-            bar.next()
-            time.sleep(time_per_iteration)
-
-            # If done early.
-            if is_done():
-                bar.update(100)
-                break
-
-    if not is_done():
-        # if still not done.
+# number of past durations used to estimate how long the next run takes
+DURATION_HISTORY_SIZE = 10
+
+# seconds between redraws of the bar when the process is quiet
+REFRESH_INTERVAL = 0.5
+
+# `Step 3/12 : RUN ...` from the classic builder and
+# `#7 [3/12] RUN ...` from BuildKit's plain progress output
+BUILD_STEP_REGEX = re.compile(r'^(?:Step |#\d+ \[(?:\S+ )?)(\d+)/(\d+)')
+
+# `4d5f2b1e3a7c: Pushed` and friends, one line per layer state change
+PUSH_LAYER_REGEX = re.compile(r'^([0-9a-f]{12}): (\w[\w ]*)')
+PUSH_LAYER_DONE = ('Pushed', 'Layer already exists', 'Mounted from')
+
+
+def estimate_duration(durations):
+    """median of the recent durations, None without any history"""
+    durations = sorted(durations or [])
+    if not durations:
+        return None
+    middle = len(durations) // 2
+    if len(durations) % 2:
+        return durations[middle]
+    return (durations[middle - 1] + durations[middle]) / 2.0
+
+
+def add_duration(durations, duration):
+    """returns the rolling history with `duration` appended"""
+    return (list(durations or []) + [duration])[-DURATION_HISTORY_SIZE:]
+
+
+class OutputProgress(object):
+    """Works out how far along a docker build or push is from its output.
+       Lines are fed in as the process prints them, usually as the
+       `on_stdout` and `on_stderr` callbacks of a `StreamingProcess` (the
+       classic builder reports on stdout, BuildKit on stderr), and `close`
+       is called when the output ends; `wait` blocks until either happens,
+       which is what the progress bar sleeps on.
+    """
+    def __init__(self):
+        self.fraction = None
+        self.layers = {}
+        self.closed = False
+        self.changed = Event()
+
+    def feed(self, line):
+        self._parse(line.strip())
+        self.changed.set()
+
+    def close(self):
+        self.closed = True
+        self.changed.set()
+
+    def _parse(self, line):
+        step = BUILD_STEP_REGEX.match(line)
+        if step:
+            # a step is only done once the next one starts
+            current, total = int(step.group(1)), int(step.group(2))
+            self.fraction = float(current - 1) / total
+            return
+        layer = PUSH_LAYER_REGEX.match(line)
+        if layer:
+            self.layers[layer.group(1)] = layer.group(2)
+            done = sum(1 for state in self.layers.values()
+                       if state.startswith(PUSH_LAYER_DONE))
+            self.fraction = float(done) / len(self.layers)
+
+    def wait(self, timeout):
+        self.changed.wait(timeout)
+        self.changed.clear()
+
+
+def duration_progress(activity, duration, is_done, output=None):
+    """shows a progress bar until `is_done()`
+       progress comes from the process `output` when it reports any, and
+       otherwise from the time elapsed compared to the expected `duration`.
+       Between updates we block on the output (or sleep), never spin.
+    """
+    wait = output.wait if output is not None else time.sleep
+    if duration is None and output is None:
         bar = progressbar.ProgressBar(
             widgets=[activity, ' ', progressbar.RotatingMarker(),
                      ' (', progressbar.Timer(), ') ', ],
@@ -54,5 +112,26 @@ def duration_progress(activity, duration, is_done):
         while not is_done():
             bar.update(i)
             i += 1
+            wait(REFRESH_INTERVAL)
+        print("")
+        return
 
+    bar = progressbar.ProgressBar(
+        widgets=[activity, ' ', progressbar.Bar(),
+                 ' (', progressbar.ETA(), ') ', ], max_value=100)
+    started = time.time()
+    while not is_done():
+        bar.update(_percent_done(started, duration, output))
+        wait(REFRESH_INTERVAL)
+    bar.update(100)
     print("")
+
+
+def _percent_done(started, duration, output):
+    fraction = output.fraction if output is not None else None
+    if fraction is None:
+        if not duration:
+            return 0
+        fraction = (time.time() - started) / float(duration)
+    # only the process finishing gets us to 100%
+    return int(min(fraction, 0.99) * 100)
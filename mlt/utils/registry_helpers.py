@@ -0,0 +1,106 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import os
+import re
+import socket
+
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+except ImportError:
+    # python 2
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+
+from mlt.utils import constants
+
+# manifest types a registry may store our images as
+MANIFEST_TYPES = ', '.join([
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.oci.image.index.v1+json'])
+
+DOCKER_HUB = 'registry-1.docker.io'
+
+# `docker push` ends with a line like `<tag>: digest: sha256:... size: 123`
+PUSH_DIGEST_REGEX = re.compile(r'digest: (sha256:[0-9a-f]{64})')
+
+
+def parse_image_name(image):
+    """splits `registry/repository:tag` like docker does"""
+    name, _, tag = image.rpartition(':')
+    if not name or '/' in tag:
+        name, tag = image, 'latest'
+    registry, _, repository = name.partition('/')
+    if not repository or not ('.' in registry or ':' in registry or
+                              registry == 'localhost'):
+        registry, repository = DOCKER_HUB, name
+        if '/' not in repository:
+            repository = 'library/' + repository
+    return registry, repository, tag
+
+
+def pushed_digest(push_output):
+    """the manifest digest reported by `docker push`, None if missing"""
+    match = PUSH_DIGEST_REGEX.search(push_output)
+    return match.group(1) if match else None
+
+
+def manifest_digest(image, timeout=5):
+    """asks the registry for the manifest digest of `image` with a single
+       HEAD request to the v2 manifest API
+       returns the digest, '' if the registry doesn't have the image, or
+       None if we couldn't find out (e.g. the registry requires auth)
+    """
+    registry, repository, tag = parse_image_name(image)
+    path = '/v2/{}/manifests/{}'.format(repository, tag)
+    for connection_class in _connection_classes(registry):
+        connection = connection_class(registry, timeout=timeout)
+        try:
+            connection.request('HEAD', path, headers={
+                'Accept': MANIFEST_TYPES})
+            response = connection.getresponse()
+        except (HTTPException, socket.error):
+            continue
+        finally:
+            connection.close()
+        if response.status == 200:
+            return response.getheader('Docker-Content-Digest')
+        elif response.status == 404:
+            return ''
+        return None
+    return None
+
+
+def _connection_classes(registry):
+    """registries are https; only local test registries and the ones
+       listed in `$MLT_INSECURE_REGISTRIES` may be plain http, for
+       localhost we even start with http
+    """
+    if registry.startswith('['):
+        host = registry[1:].partition(']')[0]
+    else:
+        host = registry.partition(':')[0]
+    if host in ('localhost', '::1') or host.startswith('127.'):
+        return HTTPConnection, HTTPSConnection
+    insecure = os.environ.get(constants.INSECURE_REGISTRIES_ENV, '')
+    if registry in [name.strip() for name in insecure.split(',')]:
+        return HTTPSConnection, HTTPConnection
+    return HTTPSConnection,
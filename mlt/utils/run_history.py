@@ -0,0 +1,171 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""The history of every build, push and deploy of an app, kept in a
+   SQLite database in the app dir. `.build.json` and `.push.json` only
+   hold the latest build and push; records here are only ever added.
+   Builds and pushes are recorded under the id in their image tag,
+   deploys under their run id.
+"""
+import json
+import sqlite3
+import sys
+import time
+
+from mlt.utils import constants
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL,
+    outcome TEXT NOT NULL,
+    image TEXT,
+    digest TEXT,
+    details TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS runs_run_id ON runs (run_id);
+CREATE INDEX IF NOT EXISTS runs_action_started ON runs (action, started);
+"""
+
+COLUMNS = ('run_id', 'action', 'started', 'duration', 'outcome', 'image',
+           'digest', 'details')
+
+# seconds we wait for another mlt process to finish writing
+LOCK_TIMEOUT = 10
+
+
+def record(action, run_id, started, outcome, duration=None, image=None,
+           digest=None, **details):
+    """adds a run; a history we can't write to never fails the command"""
+    try:
+        db = _connect()
+        try:
+            with db:
+                db.execute(
+                    "INSERT INTO runs (run_id, action, started, duration, "
+                    "outcome, image, digest, details) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, action, started, duration, outcome, image,
+                     digest, json.dumps(details, sort_keys=True,
+                                        default=str)))
+        finally:
+            db.close()
+    except sqlite3.Error as ex:
+        sys.stderr.write("Unable to record {} {} in {}: {}\n".format(
+            action, run_id, constants.RUN_HISTORY_FILE, ex))
+
+
+def durations(action, limit):
+    """the durations of the last `limit` successful runs, oldest first"""
+    rows = _query("SELECT duration FROM runs WHERE action = ? AND "
+                  "outcome = 'success' AND duration IS NOT NULL "
+                  "ORDER BY started DESC LIMIT ?", (action, limit))
+    return [row[0] for row in reversed(rows)]
+
+
+def runs(action=None, limit=None):
+    """the latest runs, newest first"""
+    query = "SELECT {} FROM runs".format(", ".join(COLUMNS))
+    params = ()
+    if action:
+        query += " WHERE action = ?"
+        params = (action,)
+    query += " ORDER BY started DESC, id DESC"
+    if limit:
+        query += " LIMIT ?"
+        params += (limit,)
+    return [_run(row) for row in _query(query, params)]
+
+
+def find(run_id):
+    """every record of the run whose id is or starts with `run_id`,
+       oldest first; raises ValueError when it is the start of more than
+       one run id
+    """
+    rows = _query("SELECT {} FROM runs WHERE run_id LIKE ? ESCAPE '\\' "
+                  "ORDER BY started, id".format(", ".join(COLUMNS)),
+                  (_escape_like(run_id) + '%',))
+    run_ids = set(row[0] for row in rows)
+    if len(run_ids) > 1:
+        raise ValueError("{} is the start of {} run ids, please give more "
+                         "of it".format(run_id, len(run_ids)))
+    return [_run(row) for row in rows]
+
+
+def deployed_run(run_id):
+    """the run id, objects and kinds of the deploy `run_id`, the way
+       `.push.json` has them for the latest deploy; None when there is no
+       such deploy
+    """
+    deploys = [run for run in find(run_id) if run['action'] == 'deploy']
+    if not deploys:
+        return None
+    deploy = deploys[-1]
+    return {'app_run_id': deploy['run_id'],
+            'app_run_objects': deploy['details'].get('objects') or [],
+            'app_run_api_versions':
+                deploy['details'].get('api_versions') or {}}
+
+
+def load_deployed_run(run_id):
+    """`deployed_run`, exiting when there is no such deploy"""
+    data = deployed_run(run_id)
+    if data is None:
+        print("No deploy with run id {} found, see `mlt runs list` for "
+              "the runs of this app.".format(run_id))
+        sys.exit(1)
+    return data
+
+
+def format_time(timestamp):
+    """a run's start time in local time"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def _connect():
+    db = sqlite3.connect(constants.RUN_HISTORY_FILE, timeout=LOCK_TIMEOUT)
+    db.executescript(SCHEMA)
+    return db
+
+
+def _query(query, params):
+    """the rows `query` selects, none when the history can't be read"""
+    try:
+        db = _connect()
+        try:
+            return db.execute(query, params).fetchall()
+        finally:
+            db.close()
+    except sqlite3.Error:
+        return []
+
+
+def _run(row):
+    run = dict(zip(COLUMNS, row))
+    run['details'] = json.loads(run['details'])
+    return run
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace(
+        '_', '\\_')
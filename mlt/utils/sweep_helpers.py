@@ -0,0 +1,122 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""Sweeps over template parameters, described by a JSON spec like
+
+    {"grid": {"learning_rate": [0.1, 0.01], "batch_size": [32, 64]},
+     "random": {"dropout": {"min": 0.1, "max": 0.5},
+                "weight_decay": {"min": 1e-5, "max": 1e-2, "log": true},
+                "optimizer": ["adam", "sgd"]},
+     "samples": 3, "seed": 42}
+
+Every combination of the `grid` values is a point of the sweep; with
+`random` parameters each of those points is sampled `samples` times, a
+value picked from a list or drawn (log-)uniformly from a range.
+"""
+import itertools
+import json
+import math
+import random
+
+SPEC_KEYS = ('grid', 'random', 'samples', 'seed')
+
+
+def load_spec(path):
+    """the sweep spec in the JSON file `path`, raises ValueError if it
+       isn't a valid spec
+    """
+    try:
+        with open(path) as f:
+            spec = json.load(f)
+    except IOError as ex:
+        raise ValueError("Unable to read sweep spec {}: {}".format(path, ex))
+    except ValueError as ex:
+        raise ValueError("Sweep spec {} isn't valid JSON: {}".format(
+            path, ex))
+    validate(spec)
+    return spec
+
+
+def validate(spec):
+    if not isinstance(spec, dict) or set(spec) - set(SPEC_KEYS):
+        raise ValueError("A sweep spec is a JSON object with (some of) the "
+                         "keys {}".format(", ".join(SPEC_KEYS)))
+    grid = spec.get('grid') or {}
+    sampled = spec.get('random') or {}
+    if not grid and not sampled:
+        raise ValueError("A sweep spec needs `grid` or `random` parameters")
+    for name, values in grid.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError("Grid parameter {} needs a list of values"
+                             .format(name))
+    for name, values in sampled.items():
+        if isinstance(values, list) and values:
+            continue
+        if not isinstance(values, dict) or 'min' not in values or \
+                'max' not in values or values['min'] > values['max']:
+            raise ValueError("Random parameter {} needs a list of values or "
+                             "a range like {{\"min\": 0, \"max\": 1}}"
+                             .format(name))
+        if values.get('log') and values['min'] <= 0:
+            raise ValueError("Random parameter {} needs a range above 0 to "
+                             "be drawn log-uniformly".format(name))
+    if set(grid) & set(sampled):
+        raise ValueError("Parameters {} are both grid and random ones".format(
+            ", ".join(sorted(set(grid) & set(sampled)))))
+    samples = spec.get('samples', 1)
+    if not isinstance(samples, int) or samples < 1:
+        raise ValueError("`samples` needs to be a positive number")
+
+
+def points(spec):
+    """the template parameters of every run of the sweep, in the order
+       they run; the same spec (and seed) always gives the same points
+    """
+    validate(spec)
+    grid = spec.get('grid') or {}
+    sampled = spec.get('random') or {}
+    rng = random.Random(spec.get('seed'))
+    names = sorted(grid)
+    result = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        point = dict(zip(names, values))
+        if not sampled:
+            result.append(point)
+            continue
+        for _ in range(spec.get('samples', 1)):
+            result.append(dict(point, **dict(
+                (name, _draw(rng, sampled[name]))
+                for name in sorted(sampled))))
+    return result
+
+
+def describe(point):
+    """`point` the way we show it, e.g. `batch_size=32 learning_rate=0.1`"""
+    return " ".join("{}={}".format(name, point[name])
+                    for name in sorted(point))
+
+
+def _draw(rng, values):
+    if isinstance(values, list):
+        return rng.choice(values)
+    if values.get('log'):
+        return math.exp(rng.uniform(math.log(values['min']),
+                                    math.log(values['max'])))
+    return rng.uniform(values['min'], values['max'])
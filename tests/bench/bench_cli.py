@@ -0,0 +1,93 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""
+Benchmarks of what the mlt CLI itself costs on top of the commands it
+runs: the stubs answer right away unless MLT_BENCH_LATENCY says otherwise.
+"""
+import pytest
+
+TEMPLATE = """apiVersion: kubeflow.org/v1alpha2
+kind: TFJob
+metadata:
+  name: $app-$run-{index}
+spec:
+  tfReplicaSpecs:
+    Worker:
+      replicas: {pods}
+      template:
+        spec:
+          containers:
+          - name: $app
+            image: $image
+---
+apiVersion: v1
+kind: Service
+metadata:
+  name: $app-$run-{index}
+spec:
+  ports:
+  - port: 2222
+"""
+
+
+def add_templates(app_dir, count, pods):
+    for index in range(count):
+        app_dir.join('k8s-templates', 'job-{}.yaml'.format(index)).write(
+            TEMPLATE.format(index=index, pods=pods))
+
+
+@pytest.mark.parametrize('build_lines', [100, 10000])
+def test_build(mlt_bench, app_dir, build_lines):
+    """a build every time, the stub docker never has the last image"""
+    app_dir.join('train.py').write('print("training")\n')
+    mlt_bench(['build'], build_lines=build_lines)
+
+
+@pytest.mark.parametrize('pods', [1, 32])
+@pytest.mark.parametrize('templates', [1, 10, 50])
+def test_deploy(mlt_bench, app_dir, templates, pods):
+    add_templates(app_dir, templates, pods)
+    mlt_bench(['deploy', '--no-push', '--skip-crd-check', '--force'])
+
+
+def test_deploy_push(mlt_bench, app_dir):
+    """tags and pushes every time, the image was never pushed before"""
+    add_templates(app_dir, 1, 1)
+    push_file = app_dir.join('.push.json')
+    mlt_bench(['deploy', '--skip-crd-check', '--force'],
+              before=lambda: push_file.remove(ignore_errors=True),
+              push_lines=100)
+
+
+@pytest.mark.parametrize('log_lines,log_rate', [
+    (100, 0), (100000, 0), (200, 1000)])
+def test_logs(mlt_bench, log_lines, log_rate):
+    mlt_bench(['logs'], log_lines=log_lines, log_rate=log_rate)
+
+
+@pytest.mark.parametrize('events', [10, 100, 1000])
+def test_events(mlt_bench, events):
+    """`events` of the TFJob and of each of its 4 pods"""
+    mlt_bench(['events'], events=events, pods=4)
+
+
+def test_events_json(mlt_bench):
+    mlt_bench(['events', '--json'], events=1000, pods=4)
@@ -0,0 +1,157 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""
+CLI benchmarks: every benchmark runs `mlt` as a subprocess in an app dir,
+with the stand-ins for kubectl, docker and make in `stubs` on the PATH,
+and keeps the median wall time of `MLT_BENCH_REPEATS` runs. Medians more
+than `MLT_BENCH_TOLERANCE` slower than the ones in the baseline file fail.
+With `MLT_BENCH_SAVE=1` the medians are saved as the new baseline instead.
+"""
+from __future__ import print_function
+
+import json
+import os
+import stat
+import subprocess
+import sys
+import time
+import uuid
+
+import pytest
+
+import mlt
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+STUBS_DIR = os.path.join(BENCH_DIR, 'stubs')
+
+BASELINE_FILE = os.environ.get('MLT_BENCH_BASELINE',
+                               os.path.join(BENCH_DIR, 'baseline.json'))
+
+REPEATS = int(os.environ.get('MLT_BENCH_REPEATS', 5))
+
+# how much slower than the baseline a median may be, as a fraction of it
+TOLERANCE = float(os.environ.get('MLT_BENCH_TOLERANCE', 0.5))
+
+SAVE = bool(os.environ.get('MLT_BENCH_SAVE'))
+
+# {benchmark: {'median': secs, 'min': secs}} of this session
+RESULTS = {}
+
+
+def load_baseline():
+    try:
+        with open(BASELINE_FILE) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+@pytest.fixture
+def stub_bin(tmpdir):
+    """a dir with the stubs, run by this python"""
+    bin_dir = tmpdir.mkdir('bin')
+    for name in os.listdir(STUBS_DIR):
+        with open(os.path.join(STUBS_DIR, name)) as f:
+            code = f.read().split('\n', 1)[1]
+        path = bin_dir.join(name)
+        path.write('#!{}\n{}'.format(sys.executable, code))
+        path.chmod(path.stat().mode | stat.S_IEXEC)
+    return bin_dir
+
+
+@pytest.fixture
+def app_dir(tmpdir):
+    """an app that was built and deployed before"""
+    app = tmpdir.mkdir('app')
+    app.join('mlt.json').write(json.dumps({
+        'name': 'app', 'namespace': 'ns', 'registry': 'localhost:5000'}))
+    app.join('.build.json').write(json.dumps({
+        'last_container': 'app:1234'}))
+    app.join('.push.json').write(json.dumps({
+        'last_remote_container': 'localhost:5000/app:1234',
+        'app_run_id': str(uuid.uuid4()),
+        'app_run_objects': ['TFJob/app']}))
+    app.mkdir('k8s-templates')
+    return app
+
+
+@pytest.fixture
+def mlt_bench(request, stub_bin, app_dir, tmpdir):
+    """`bench(args, before=None, **settings)` runs `mlt <args>` in the app
+       dir, calling `before` ahead of every run, with the MLT_BENCH_*
+       `settings` for the stubs; returns the median secs it took
+    """
+    env = dict(os.environ, PYTHONPATH=mlt.BASE_DIR,
+               PATH=str(stub_bin) + os.pathsep + os.environ['PATH'],
+               KUBECONFIG=str(tmpdir.join('no-kubeconfig')),
+               MLT_KUBE_CLIENT='kubectl')
+
+    def bench(args, before=None, **settings):
+        run_env = dict(env, **dict(
+            ('MLT_BENCH_' + name.upper(), str(value))
+            for name, value in settings.items()))
+        durations = []
+        for _ in range(REPEATS):
+            if before is not None:
+                before()
+            started = time.time()
+            process = subprocess.Popen(
+                [sys.executable, '-c', 'from mlt.main import main; main()'] +
+                args, cwd=str(app_dir), env=run_env,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output, _ = process.communicate()
+            durations.append(time.time() - started)
+            assert process.returncode == 0, output.decode('utf-8')
+        median = sorted(durations)[len(durations) // 2]
+        RESULTS[request.node.name] = {'median': median,
+                                      'min': min(durations)}
+
+        baseline = load_baseline().get(request.node.name)
+        if baseline and not SAVE:
+            assert median <= baseline['median'] * (1 + TOLERANCE), \
+                "{} took {:.3f}s, the baseline is {:.3f}s".format(
+                    request.node.name, median, baseline['median'])
+        return median
+    return bench
+
+
+def pytest_sessionfinish(session):
+    if SAVE and RESULTS:
+        baseline = load_baseline()
+        baseline.update(RESULTS)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+    baseline = load_baseline()
+    terminalreporter.section('mlt benchmarks')
+    for name, result in sorted(RESULTS.items()):
+        line = "{:<40} {:>8.3f}s".format(name, result['median'])
+        if name in baseline and not SAVE:
+            line += " ({:+.0%} on the baseline)".format(
+                result['median'] / baseline[name]['median'] - 1)
+        terminalreporter.write_line(line)
+    if SAVE:
+        terminalreporter.write_line("Saved as the baseline in {}".format(
+            BASELINE_FILE))
@@ -80,3 +80,48 @@ def patch(monkeypatch):
         return m
 
     return wrapper
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmpdir):
+    """keep the mlt caches of every test out of the user's cache dir"""
+    monkeypatch.setenv('MLT_CACHE_DIR', str(tmpdir.join('mlt-cache')))
+    return tmpdir.join('mlt-cache')
+
+
+@pytest.fixture(autouse=True)
+def run_history_file(monkeypatch, tmpdir):
+    """keep the run history of every test out of the working dir"""
+    path = str(tmpdir.join('runs.db'))
+    monkeypatch.setattr('mlt.utils.constants.RUN_HISTORY_FILE', path)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def kube_client(monkeypatch):
+    """every test starts without a shared kubernetes client, and talks to
+       the cluster through kubectl unless it sets up `kube_api`
+    """
+    from mlt.utils import kubernetes_client
+    monkeypatch.setenv('MLT_KUBE_CLIENT', 'kubectl')
+    kubernetes_client.reset_client()
+    yield
+    kubernetes_client.reset_client()
+
+
+@pytest.fixture
+def kube_api(monkeypatch, tmpdir):
+    """a fake API server the kubernetes client is pointed at"""
+    from kube_api import FakeKubeApi
+    api = FakeKubeApi().start()
+    kubeconfig = tmpdir.join('kubeconfig')
+    kubeconfig.write(api.kubeconfig())
+    monkeypatch.setenv('KUBECONFIG', str(kubeconfig))
+    monkeypatch.delenv('MLT_KUBE_CLIENT')
+    # read the kubeconfig now, before tests patch `open` or `os.path`
+    from mlt.utils import kubernetes_client
+    kubernetes_client.get_client()
+    try:
+        yield api
+    finally:
+        api.stop()
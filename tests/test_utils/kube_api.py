@@ -0,0 +1,252 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import json
+import time
+from threading import Condition, Thread
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+KUBECONFIG = """apiVersion: v1
+kind: Config
+current-context: fake
+contexts:
+- name: fake
+  context: {{cluster: fake, user: fake}}
+clusters:
+- name: fake
+  cluster: {{server: '{server}'}}
+users:
+- name: fake
+  user: {{token: fake-token}}
+"""
+
+
+class FakeKubeApi(object):
+    """An in-memory stand-in for the kubernetes API server.
+       Objects live under their REST path, e.g.
+       `/api/v1/namespaces/ns/pods/name`. Collections can be listed (with
+       equality label and field selectors) and watched, and `emit` sends
+       watch events (ERROR ones with a Status) to the watchers of a
+       collection. Logs are served from
+       `logs`, keyed by pod path. The bodies of DELETE requests (their
+       DeleteOptions) are kept in `delete_options`.
+    """
+    def __init__(self):
+        self.objects = {}
+        self.logs = {}
+        self.requests = []
+        self.delete_options = []
+        self.connections = 0
+        self.events = []
+        self.changed = Condition()
+        self.stopped = False
+        self.server = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def kubeconfig(self):
+        return KUBECONFIG.format(server=self.url)
+
+    def add(self, collection, obj):
+        self.objects['{}/{}'.format(
+            collection, obj['metadata']['name'])] = obj
+        return obj
+
+    def emit(self, collection, event_type, obj):
+        with self.changed:
+            if event_type == 'DELETED':
+                self.objects.pop('{}/{}'.format(
+                    collection, obj['metadata']['name']), None)
+            elif event_type != 'ERROR':
+                self.add(collection, obj)
+            self.events.append((collection, event_type, obj))
+            self.changed.notify_all()
+
+    def list(self, collection, query):
+        items = [obj for path, obj in sorted(self.objects.items())
+                 if path.rsplit('/', 1)[0] == collection]
+        items = [obj for obj in items
+                 if _matches(obj['metadata'].get('labels') or {},
+                             query.get('labelSelector'))]
+        return [obj for obj in items
+                if _matches_fields(obj, query.get('fieldSelector'))]
+
+    def start(self):
+        api = self
+
+        class Handler(FakeKubeApiHandler):
+            pass
+        Handler.api = api
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = Thread(target=self.server.serve_forever,
+                        kwargs={'poll_interval': 0.05})
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        with self.changed:
+            self.stopped = True
+            self.changed.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeKubeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    api = None
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.api.connections += 1
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict((key, values[0])
+                     for key, values in parse_qs(url.query).items())
+        self.api.requests.append(('GET', self.path))
+        if url.path.endswith('/log'):
+            return self._send_log(url.path[:-len('/log')])
+        if query.get('watch') == 'true':
+            return self._watch(url.path, query)
+        if url.path in self.api.objects:
+            return self._send(200, self.api.objects[url.path])
+        if self._is_collection(url.path):
+            return self._send(200, {
+                'kind': 'List', 'metadata': {'resourceVersion': '1'},
+                'items': self.api.list(url.path, query)})
+        self._send(404, {'kind': 'Status', 'code': 404,
+                         'message': '{} not found'.format(url.path)})
+
+    def do_DELETE(self):
+        url = urlparse(self.path)
+        self.api.requests.append(('DELETE', self.path))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.api.delete_options.append(
+                json.loads(self.rfile.read(length).decode('utf-8')))
+        if url.path not in self.api.objects:
+            return self._send(404, {'kind': 'Status', 'code': 404,
+                                    'message': 'not found'})
+        obj = self.api.objects.pop(url.path)
+        self._send(200, obj)
+
+    def _is_collection(self, path):
+        return any(key.rsplit('/', 1)[0] == path
+                   for key in self.api.objects) or \
+            path.rsplit('/', 1)[-1] in ('pods', 'events', 'namespaces',
+                                        'customresourcedefinitions',
+                                        'jobs', 'tfjobs', 'pytorchjobs')
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream_headers(self, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+    def _send_log(self, pod_path):
+        self._stream_headers('text/plain')
+        for line in self.api.logs.get(pod_path, []):
+            self.wfile.write((line + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+    def _watch(self, collection, query):
+        """sends the events emitted for `collection` until timeoutSeconds
+           passed or the server stops
+        """
+        deadline = time.time() + float(query.get('timeoutSeconds', 5))
+        self._stream_headers('application/json')
+        sent = 0
+        with self.api.changed:
+            while time.time() < deadline:
+                events = [(event_type, obj) for path, event_type, obj in
+                          self.api.events[sent:] if path == collection]
+                sent = len(self.api.events)
+                for event_type, obj in events:
+                    if not _matches(obj['metadata'].get('labels') or {},
+                                    query.get('labelSelector')) or \
+                            not _matches_fields(obj,
+                                                query.get('fieldSelector')):
+                        continue
+                    self.wfile.write(json.dumps(
+                        {'type': event_type, 'object': obj}).encode(
+                            'utf-8') + b'\n')
+                    self.wfile.flush()
+                if self.api.stopped:
+                    break
+                self.api.changed.wait(max(deadline - time.time(), 0))
+
+    def log_message(self, *args):
+        pass
+
+
+def _matches(labels, selector):
+    for requirement in (selector or '').replace('==', '=').split(','):
+        if not requirement:
+            continue
+        if '!=' in requirement:
+            key, value = requirement.split('!=', 1)
+            if labels.get(key) == value:
+                return False
+        elif '=' in requirement:
+            key, value = requirement.split('=', 1)
+            if labels.get(key) != value:
+                return False
+        elif requirement not in labels:
+            return False
+    return True
+
+
+def _matches_fields(obj, selector):
+    for requirement in (selector or '').replace('==', '=').split(','):
+        if not requirement:
+            continue
+        negate = '!=' in requirement
+        field, value = requirement.split('!=' if negate else '=', 1)
+        actual = obj
+        for key in field.split('.'):
+            actual = (actual or {}).get(key)
+        if (actual == value) == negate:
+            return False
+    return True
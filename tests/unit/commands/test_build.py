@@ -21,6 +21,8 @@
 from __future__ import print_function
 
 import pytest
+from io import BytesIO
+from threading import Event
 
 from mock import patch, MagicMock
 from test_utils.io import catch_stdout
@@ -38,21 +40,39 @@ def open_mock(patch):
     return patch('open')
 
 
+@pytest.fixture
+def write_atomic_mock(patch):
+    patch('files.state_lock')
+    return patch('files.write_atomic')
+
+
 @pytest.fixture
 def progress_bar_mock(patch):
-    return patch('progress_bar')
+    progress_bar = patch('progress_bar')
+    progress_bar.add_duration.return_value = [1.0]
+    return progress_bar
+
+
+@pytest.fixture
+def context_digest_mock(patch):
+    return patch('build_context.context_digest',
+                 MagicMock(return_value='new-digest'))
 
 
 @pytest.fixture
 def popen_mock(patch):
     popen = MagicMock()
     popen.return_value.poll.return_value = 0  # success
+    popen.return_value.wait.return_value = 0
+    popen.return_value.stdout = BytesIO(b'')
+    popen.return_value.stderr = BytesIO(b'')
     return patch('process_helpers.run_popen', popen)
 
 
-def test_simple_build(progress_bar_mock, popen_mock, open_mock, init_mock):
+def test_simple_build(progress_bar_mock, popen_mock, open_mock, init_mock,
+                      context_digest_mock, write_atomic_mock):
     progress_bar_mock.duration_progress.side_effect = \
-        lambda x, y, z: print('Building')
+        lambda *args: print('Building')
 
     build = BuildCommand({'build': True, '--watch': False})
     build.config = MagicMock()
@@ -67,18 +87,38 @@ def test_simple_build(progress_bar_mock, popen_mock, open_mock, init_mock):
     built = output.find('Built')
     assert all(var >= 0 for var in (starting, building, built))
     assert starting < building < built
+    assert write_atomic_mock.call_args[0][0] == '.build.json'
 
 
-def test_build_errors(popen_mock, progress_bar_mock, open_mock, init_mock):
-    popen_mock.return_value.poll.return_value = 1  # set to 1 for error
+@pytest.mark.parametrize('stream', ['stdout', 'stderr'])
+def test_build_progress_from_output(patch, popen_mock, open_mock, init_mock,
+                                    context_digest_mock, write_atomic_mock,
+                                    stream):
+    """the progress comes from what `make build` prints, BuildKit prints
+       its steps on stderr
+    """
+    duration_progress = patch('progress_bar.duration_progress')
+    setattr(popen_mock.return_value, stream,
+            BytesIO(b'#5 [1/4] FROM python\n#7 [3/4] RUN make\n'))
+
+    build = BuildCommand({'build': True, '--watch': False})
+    build.config = MagicMock()
+    with catch_stdout():
+        build.action()
+
+    build_output = duration_progress.call_args[0][3]
+    assert build_output.closed
+    assert build_output.fraction == 0.5
+
+
+def test_build_errors(popen_mock, progress_bar_mock, open_mock, init_mock,
+                      context_digest_mock):
+    # `docker image inspect` fails, the build that follows succeeds
+    popen_mock.return_value.wait.return_value = 1
     output_str = "normal output..."
     error_str = "error message..."
-    build_output = MagicMock()
-    build_output.decode.return_value = output_str
-    error_output = MagicMock()
-    error_output.decode.return_value = error_str
-    popen_mock.return_value.communicate.return_value = (build_output,
-                                                        error_output)
+    popen_mock.return_value.stdout = BytesIO(output_str.encode('utf-8'))
+    popen_mock.return_value.stderr = BytesIO(error_str.encode('utf-8'))
 
     build = BuildCommand({'build': True, '--watch': False})
     build.config = MagicMock()
@@ -95,8 +135,72 @@ def test_build_errors(popen_mock, progress_bar_mock, open_mock, init_mock):
     assert output_location < error_location
 
 
+def test_build_context_unchanged(patch, popen_mock, progress_bar_mock,
+                                 open_mock, init_mock, context_digest_mock):
+    """same context digest and the image is still around: no new build"""
+    build_data = {'context_digest': 'new-digest',
+                  'last_container': 'app:1234'}
+    patch('files.fetch_action_arg',
+          MagicMock(side_effect=lambda action, arg: build_data.get(arg)))
+
+    build = BuildCommand({'build': True, '--watch': False})
+    build.config = MagicMock()
+
+    with catch_stdout() as caught_output:
+        build.action()
+        output = caught_output.getvalue()
+
+    assert 'Build context unchanged, using app:1234' in output
+    # the only process we started was the `docker image inspect`
+    popen_mock.assert_called_once()
+    assert popen_mock.call_args[0][0][:3] == ['docker', 'image', 'inspect']
+    progress_bar_mock.duration_progress.assert_not_called()
+
+
+def test_build_context_unchanged_image_removed(
+        patch, popen_mock, progress_bar_mock, open_mock, init_mock,
+        context_digest_mock, write_atomic_mock):
+    """if the last image is gone we have to build again"""
+    build_data = {'context_digest': 'new-digest',
+                  'last_container': 'app:1234'}
+    patch('files.fetch_action_arg',
+          MagicMock(side_effect=lambda action, arg: build_data.get(arg)))
+    # `docker image inspect` fails, the build that follows succeeds
+    popen_mock.return_value.wait.side_effect = [1, 0]
+
+    build = BuildCommand({'build': True, '--watch': False})
+    build.config = MagicMock()
+
+    with catch_stdout() as caught_output:
+        build.action()
+        output = caught_output.getvalue()
+
+    assert 'Starting build' in output
+    assert 'Built' in output
+
+
+def test_build_cancelled(popen_mock, progress_bar_mock, open_mock,
+                         init_mock, context_digest_mock, write_atomic_mock):
+    """a cancelled build stops the build process and records nothing"""
+    cancelled = Event()
+    cancelled.set()
+    popen_mock.return_value.poll.return_value = None
+
+    build = BuildCommand({'build': True, '--watch': False})
+    build.config = MagicMock()
+
+    with catch_stdout() as caught_output:
+        build._build(cancelled)
+        output = caught_output.getvalue()
+
+    popen_mock.return_value.terminate.assert_called_once()
+    assert 'Cancelled build' in output
+    assert 'Built' not in output
+    write_atomic_mock.assert_not_called()
+
+
 @patch('mlt.commands.build.time.sleep')
-@patch('mlt.commands.build.Observer')
+@patch('watchdog.observers.Observer')
 def test_watch_build(observer, sleep_mock, open_mock, init_mock):
     sleep_mock.side_effect = KeyboardInterrupt
 
@@ -20,14 +20,39 @@
 
 from __future__ import print_function
 
+import json
+import os
+import time
 import uuid
+from threading import Event, Thread
+
 import pytest
-from mock import call, MagicMock
+from mock import ANY, call, MagicMock
 
 from mlt.commands.deploy import DeployCommand
+from mlt.utils import run_history
+from yaml import safe_load, safe_load_all
+from mlt.utils.kubernetes_client import ApiError
 from test_utils.io import catch_stdout
 
 
+@pytest.fixture(autouse=True)
+def app_dir_state(patch, request):
+    """keeps the state files and rendered templates of the deploys out of
+       the working dir, and renders every template
+    """
+    if 'app_dir' in request.fixturenames:
+        return
+    patch('os.makedirs')
+    patch('files.state_lock')
+    patch('manifest_helpers.render_key',
+          MagicMock(side_effect=lambda filename, *args, **kwargs:
+                    'render-' + filename))
+    patch('manifest_helpers.load', MagicMock(return_value=None))
+    patch('manifest_helpers.store')
+    return patch('files.write_atomic')
+
+
 @pytest.fixture
 def sleep(patch):
     return patch('time.sleep')
@@ -54,28 +79,56 @@ def open_mock(patch):
 
 
 @pytest.fixture
-def popen_mock(patch):
-    popen_mock = MagicMock()
-    popen_mock.return_value.poll.return_value = 0
-    return patch('Popen', popen_mock)
+def popen_mock(process_helpers):
+    """the push and apply processes, both succeed by default"""
+    return process_helpers.StreamingProcess
 
 
 @pytest.fixture
 def process_helpers(patch):
-    return patch('process_helpers')
+    process_helpers_mock = MagicMock()
+    process = process_helpers_mock.StreamingProcess.return_value
+    process.poll.return_value = 0
+    process.wait.return_value = 0
+    process.duration = 0.5
+    process.stdout_text.return_value = \
+        'latest: digest: sha256:' + 'a' * 64 + ' size: 1234'
+    return patch('process_helpers', process_helpers_mock)
+
+
+@pytest.fixture
+def kube_client_mock(patch):
+    kube_client = patch('kubernetes_client')
+    kube_client.ApiError = ApiError
+    client = kube_client.get_client.return_value
+    client.list.return_value = [
+        {'metadata': {'name': 'app-pod'},
+         'status': {'phase': 'Running', 'startTime': '2018-05-17T22:28:35Z'}}]
+    client.watch.side_effect = lambda *args, **kwargs: iter(
+        [('ADDED', {'metadata': {'name': 'app-pod'},
+                    'status': {'phase': 'Running'}})])
+    return client
+
+
+def push_calls(popen_mock):
+    return [c for c in popen_mock.call_args_list if 'push' in c[0][0]]
 
 
 @pytest.fixture
 def progress_bar(patch):
     progress_mock = MagicMock()
-    progress_mock.duration_progress.side_effect = lambda x, y, z: print(
+    progress_mock.duration_progress.side_effect = lambda *args: print(
         'Pushing ')
+    progress_mock.add_duration.return_value = [1.0]
     return patch('progress_bar', progress_mock)
 
 
 @pytest.fixture
 def template(patch):
-    return patch('Template')
+    template_mock = patch('Template')
+    template_mock.return_value.substitute.return_value = \
+        'kind: TFJob\nmetadata:\n  name: app-1\n'
+    return template_mock
 
 
 @pytest.fixture
@@ -98,11 +151,11 @@ def yaml(patch):
     return patch('yaml.load')
 
 
-def deploy(no_push, skip_crd_check, interactive, extra_config_args, retries=5):
+def deploy(no_push, skip_crd_check, interactive, extra_config_args, timeout=5):
     deploy = DeployCommand(
         {'deploy': True, '--no-push': no_push,
          '--skip-crd-check': skip_crd_check,
-         '--interactive': interactive, '--retries': retries,
+         '--interactive': interactive, '--timeout': timeout,
          '--logs':False})
     deploy.config = {'name': 'app', 'namespace': 'namespace'}
     deploy.config.update(extra_config_args)
@@ -160,6 +213,12 @@ def test_deploy_docker(walk_mock, progress_bar, popen_mock, open_mock,
         extra_config_args={'registry': 'dockerhub'})
     verify_successful_deploy(output)
 
+    deploys = run_history.runs(action='deploy')
+    assert [run['outcome'] for run in deploys] == ['success']
+    assert 'TFJob/app-1' in deploys[0]['details']['objects']
+    assert [run['outcome'] for run in run_history.runs(action='push')] == \
+        ['success']
+
 
 def test_deploy_without_push(walk_mock, progress_bar, popen_mock, open_mock,
                              template, kube_helpers, process_helpers,
@@ -178,11 +237,12 @@ def test_deploy_interactive_one_file(walk_mock, progress_bar, popen_mock,
                                      open_mock, template, kube_helpers,
                                      process_helpers, verify_build,
                                      verify_init, fetch_action_arg, sleep,
-                                     yaml, json_mock):
+                                     yaml, json_mock, kube_client_mock):
     walk_mock.return_value = ['foo']
     yaml.return_value = {
         'template': {'foo': 'bar'}, 'containers': [{'foo': 'bar'}]}
-    json_mock.loads.return_value = {'status': {'phase': 'Running'}}
+    json_mock.dumps.side_effect = json.dumps
+    json_mock.load.return_value = {}
     output = deploy(
         no_push=False, skip_crd_check=True,
         interactive=True,
@@ -190,7 +250,8 @@ def test_deploy_interactive_one_file(walk_mock, progress_bar, popen_mock,
     verify_successful_deploy(output, interactive=True)
 
     # verify that kubectl commands are specifying namespace
-    for call_args in process_helpers.run_popen.call_args_list:
+    for call_args in (process_helpers.run_capture.call_args_list +
+                      process_helpers.StreamingProcess.call_args_list):
         assert isinstance(call_args, type(call))
         assert isinstance(call_args[0], tuple)
         assert len(call_args[0]) > 0
@@ -203,10 +264,11 @@ def test_deploy_interactive_two_files(walk_mock, progress_bar, popen_mock,
                                       open_mock, template, kube_helpers,
                                       process_helpers, verify_build,
                                       verify_init, fetch_action_arg, sleep,
-                                      yaml, json_mock):
-    json_mock.loads.return_value = {'status': {'phase': 'Running'}}
+                                      yaml, json_mock, kube_client_mock):
     yaml.return_value = {
         'template': {'foo': 'bar'}, 'containers': [{'foo': 'bar'}]}
+    json_mock.dumps.side_effect = json.dumps
+    json_mock.load.return_value = {}
     output = deploy(
         no_push=False, skip_crd_check=True,
         interactive=True,
@@ -218,17 +280,179 @@ def test_deploy_interactive_pod_not_run(walk_mock, progress_bar, popen_mock,
                                         open_mock, template, kube_helpers,
                                         process_helpers, verify_build,
                                         verify_init, fetch_action_arg, sleep,
-                                        yaml, json_mock):
-    json_mock.loads.return_value = {'status': {'phase': 'Error'}}
+                                        yaml, json_mock, kube_client_mock):
+    pulling = {'metadata': {'name': 'app-pod'}, 'status': {
+        'phase': 'Pending', 'containerStatuses': [{'state': {'waiting': {
+            'reason': 'ImagePullBackOff',
+            'message': 'Back-off pulling image'}}}]}}
+    kube_client_mock.watch.side_effect = lambda *args, **kwargs: iter(
+        [('ADDED', pulling)])
     yaml.return_value = {
         'template': {'foo': 'bar'}, 'containers': [{'foo': 'bar'}]}
-    with pytest.raises(ValueError):
+    json_mock.dumps.side_effect = json.dumps
+    json_mock.load.return_value = {}
+    with pytest.raises(ValueError, match='ImagePullBackOff'):
         output = deploy(
             no_push=False, skip_crd_check=True,
             interactive=True,
             extra_config_args={'registry': 'dockerhub', '<kube_spec>': 'r'})
 
 
+def test_deploy_preflight_while_pushing(
+        walk_mock, progress_bar, popen_mock, open_mock, template, kube_helpers,
+        process_helpers, verify_build, verify_init, fetch_action_arg,
+        json_mock):
+    """the namespace check doesn't wait for the push to finish"""
+    namespace_checked = Event()
+    kube_helpers.ensure_namespace_exists.side_effect = \
+        lambda namespace: namespace_checked.set()
+    saw_namespace_check = []
+
+    def start(command, **kwargs):
+        if 'push' in command:
+            saw_namespace_check.append(namespace_checked.wait(5))
+        return popen_mock.return_value
+    popen_mock.side_effect = start
+
+    output = deploy(no_push=False, skip_crd_check=False, interactive=False,
+                    extra_config_args={'registry': 'dockerhub'})
+
+    verify_successful_deploy(output)
+    assert saw_namespace_check == [True]
+    kube_helpers.check_crds.assert_called_once_with(exit_on_failure=True)
+    breakdown = output[output.index('Deployed in '):]
+    for phase in ('push', 'crd check', 'namespace', 'render', 'apply'):
+        assert '  {} '.format(phase) in breakdown
+    lines = dict((line.split()[0], line) for line in breakdown.splitlines()
+                 if line.startswith('  '))
+    assert lines['render'].endswith('(while pushing)')
+    assert not lines['apply'].endswith('(while pushing)')
+
+
+def test_deploy_crd_check_failure(
+        walk_mock, progress_bar, popen_mock, open_mock, template, kube_helpers,
+        process_helpers, verify_build, verify_init, fetch_action_arg,
+        json_mock):
+    """nothing gets applied when the cluster lacks the CRDs"""
+    kube_helpers.check_crds.side_effect = SystemExit(1)
+    with pytest.raises(SystemExit):
+        deploy(no_push=False, skip_crd_check=False, interactive=False,
+               extra_config_args={'registry': 'dockerhub'})
+    assert not [c for c in popen_mock.call_args_list if 'apply' in c[0][0]]
+    assert [run['outcome'] for run in run_history.runs(action='deploy')] == \
+        ['failed']
+
+
+def test_deploy_crd_check_failure_stops_push(
+        walk_mock, progress_bar, popen_mock, open_mock, template, kube_helpers,
+        process_helpers, verify_build, verify_init, fetch_action_arg,
+        json_mock):
+    """a failed preflight doesn't wait for the push to finish"""
+    kube_helpers.check_crds.side_effect = SystemExit(1)
+    popen_mock.return_value.poll.return_value = None  # pushing forever
+
+    def duration_progress(activity, duration, is_done, output):
+        deadline = time.time() + 5
+        while not is_done() and time.time() < deadline:
+            time.sleep(0.01)
+    progress_bar.duration_progress.side_effect = duration_progress
+
+    with pytest.raises(SystemExit):
+        deploy(no_push=False, skip_crd_check=False, interactive=False,
+               extra_config_args={'registry': 'dockerhub'})
+    popen_mock.return_value.terminate.assert_called_once()
+    assert [run['outcome'] for run in run_history.runs(action='push')] == \
+        ['cancelled']
+
+
+def _pod(phase, **status):
+    status['phase'] = phase
+    return {'metadata': {'name': 'app-pod'}, 'status': status}
+
+
+def _interactive_deploy():
+    deploy_cmd = DeployCommand({'deploy': True})
+    deploy_cmd.namespace = 'namespace'
+    deploy_cmd.run_labels = {'mlt-app-name': 'app', 'mlt-run-id': 'run-1'}
+    return deploy_cmd
+
+
+def test_deploy_wait_for_pod_running(verify_build, verify_init, sleep,
+                                     kube_client_mock):
+    """the watch is re-opened when the API server ends it early"""
+    watches = iter([[('ADDED', _pod('Pending'))],
+                    [('ADDED', _pod('Pending')),
+                     ('MODIFIED', _pod('Running'))]])
+    kube_client_mock.watch.side_effect = lambda *args, **kwargs: iter(
+        next(watches))
+    deploy_cmd = _interactive_deploy()
+
+    assert deploy_cmd._wait_for_pod(5) == 'app-pod'
+
+    assert kube_client_mock.watch.call_count == 2
+    assert kube_client_mock.watch.call_args[1]['label_selector'] == \
+        'debug=true,mlt-app-name=app,mlt-run-id=run-1'
+    sleep.assert_called_once_with(0.5)
+
+
+def test_deploy_wait_for_pod_unschedulable(verify_build, verify_init,
+                                           kube_client_mock):
+    kube_client_mock.watch.side_effect = lambda *args, **kwargs: iter(
+        [('ADDED', _pod('Pending', conditions=[{
+            'type': 'PodScheduled', 'status': 'False',
+            'reason': 'Unschedulable',
+            'message': '0/3 nodes are available'}]))])
+    deploy_cmd = _interactive_deploy()
+
+    with pytest.raises(ValueError, match='0/3 nodes are available'):
+        deploy_cmd._wait_for_pod(5)
+
+
+def test_deploy_wait_for_pod_timeout(verify_build, verify_init,
+                                     kube_client_mock):
+    kube_client_mock.watch.side_effect = lambda *args, **kwargs: iter(
+        [('ADDED', _pod('Pending'))])
+    deploy_cmd = _interactive_deploy()
+
+    with pytest.raises(ValueError, match='Pod app-pod not Running'):
+        deploy_cmd._wait_for_pod(0.3)
+
+
+def test_deploy_wait_for_pod_created_later(verify_build, verify_init,
+                                           kube_api):
+    """the debug pod may not be there yet right after the apply"""
+    pods = '/api/v1/namespaces/namespace/pods'
+    deploy_cmd = _interactive_deploy()
+    labels = dict(deploy_cmd.run_labels, debug='true')
+
+    def create_pod():
+        deadline = time.time() + 5
+        while time.time() < deadline and not [
+                path for _, path in kube_api.requests if 'watch=true' in path]:
+            time.sleep(0.01)
+        pod = {'metadata': {'name': 'app-pod-x1', 'labels': labels},
+               'status': {'phase': 'Pending'}}
+        kube_api.emit(pods, 'ADDED', pod)
+        kube_api.emit(pods, 'MODIFIED', dict(pod, status={'phase': 'Running'}))
+    creator = Thread(target=create_pod)
+    creator.daemon = True
+    creator.start()
+
+    assert deploy_cmd._wait_for_pod(5) == 'app-pod-x1'
+    # the listing didn't have the pod yet
+    assert not [path for _, path in kube_api.requests[:1]
+                if 'watch=true' in path]
+
+
+def test_deploy_wait_for_pod_never_created(verify_build, verify_init,
+                                           kube_client_mock):
+    kube_client_mock.watch.side_effect = lambda *args, **kwargs: iter([])
+    deploy_cmd = _interactive_deploy()
+
+    with pytest.raises(ValueError, match='No pods found'):
+        deploy_cmd._wait_for_pod(0.3)
+
+
 def test_deploy_update_app_run_id(open_mock, json_mock):
     run_id = str(uuid.uuid4())
     json_mock_data = {
@@ -250,14 +474,11 @@ def test_image_push_error(walk_mock, progress_bar, popen_mock, open_mock,
 
     # setup mock to induce and error during the deploy
     popen_mock.return_value.poll.return_value = 1
+    popen_mock.return_value.wait.return_value = 1
     output_str = "normal output..."
     error_str = "error message..."
-    build_output = MagicMock()
-    build_output.decode.return_value = output_str
-    error_output = MagicMock()
-    error_output.decode.return_value = error_str
-    popen_mock.return_value.communicate.return_value = (build_output,
-                                                        error_output)
+    popen_mock.return_value.stdout_text.return_value = output_str
+    popen_mock.return_value.stderr_text.return_value = error_str
 
     deploy_cmd = DeployCommand({'deploy': True,
                                 '--skip-crd-check': True,
@@ -275,3 +496,295 @@ def test_image_push_error(walk_mock, progress_bar, popen_mock, open_mock,
     error_location = output.find(error_str)
     assert all(var >= 0 for var in (output_location, error_location))
     assert output_location < error_location
+
+
+def test_deploy_applies_all_templates_once(
+        walk_mock, progress_bar, popen_mock, open_mock, template, kube_helpers,
+        process_helpers, verify_build, verify_init, fetch_action_arg,
+        json_mock):
+    """every template gets rendered first and then applied in one go"""
+    walk_mock.return_value = [
+        ('k8s-templates', [], ['job.yaml', 'service.yaml', 'config.yaml'])]
+
+    def apply(command, on_stdout=None, **kwargs):
+        for line in ['job.batch/app-1 created\n', 'service/app-1 created\n']:
+            on_stdout(line)
+        return popen_mock.return_value
+    popen_mock.side_effect = apply
+    output = deploy(
+        no_push=True, skip_crd_check=True,
+        interactive=False,
+        extra_config_args={'registry': 'dockerhub'})
+    verify_successful_deploy(output, did_push=False)
+
+    assert template.return_value.substitute.call_count == 3
+    apply_calls = [c for c in popen_mock.call_args_list
+                   if 'apply' in c[0][0]]
+    assert len(apply_calls) == 1
+    # only this run's dir, other deploys may be rendering into theirs
+    assert apply_calls[0][0][0][-2:] == ['-f', ANY]
+    rendered_dir = apply_calls[0][0][0][-1]
+    assert rendered_dir.startswith('k8s' + os.sep)
+    open_mock.assert_any_call(os.path.join(rendered_dir, 'job.yaml'), 'w')
+    assert 'Applying 3 template(s)' in output
+    assert 'service/app-1 created (' in output
+
+
+def test_deploy_apply_error(walk_mock, progress_bar, popen_mock, open_mock,
+                            template, kube_helpers, process_helpers,
+                            verify_build, verify_init, fetch_action_arg,
+                            json_mock):
+    popen_mock.return_value.wait.return_value = 1
+    popen_mock.return_value.stderr_text.return_value = \
+        'error validating data'
+    with pytest.raises(SystemExit):
+        deploy(no_push=True, skip_crd_check=True, interactive=False,
+               extra_config_args={'registry': 'dockerhub'})
+
+
+def test_deploy_already_pushed(walk_mock, progress_bar, popen_mock, open_mock,
+                               template, kube_helpers, process_helpers,
+                               verify_build, verify_init, json_mock, patch):
+    """an unchanged build is still in the registry, so no tag and no push"""
+    state = {'last_container': 'app:1234',
+             'last_remote_container': 'dockerhub/app:1234',
+             'last_pushed_digest': 'sha256:1234'}
+    patch('files.fetch_action_arg',
+          MagicMock(side_effect=lambda action, arg: state.get(arg)))
+    manifest_digest = patch('registry_helpers.manifest_digest',
+                            MagicMock(return_value='sha256:1234'))
+    output = deploy(
+        no_push=False, skip_crd_check=True,
+        interactive=False,
+        extra_config_args={'registry': 'dockerhub'})
+
+    assert 'dockerhub/app:1234 is already in the registry' in output
+    manifest_digest.assert_called_once_with('dockerhub/app:1234')
+    assert not push_calls(popen_mock)
+    process_helpers.run.assert_not_called()
+
+
+@pytest.mark.parametrize('registry_digest', ['', 'sha256:5678'])
+def test_deploy_pushed_image_gone(walk_mock, progress_bar, popen_mock,
+                                  open_mock, template, kube_helpers,
+                                  process_helpers, verify_build, verify_init,
+                                  json_mock, patch, registry_digest):
+    """the registry lost our image or has a different one under the tag"""
+    state = {'last_container': 'app:1234',
+             'last_remote_container': 'dockerhub/app:1234',
+             'last_pushed_digest': 'sha256:1234'}
+    patch('files.fetch_action_arg',
+          MagicMock(side_effect=lambda action, arg: state.get(arg)))
+    patch('registry_helpers.manifest_digest',
+          MagicMock(return_value=registry_digest))
+    output = deploy(
+        no_push=False, skip_crd_check=True,
+        interactive=False,
+        extra_config_args={'registry': 'dockerhub'})
+
+    verify_successful_deploy(output)
+    assert len(push_calls(popen_mock)) == 1
+    json_mock.dumps.assert_any_call({
+        'last_remote_container': 'dockerhub/app:1234',
+        'last_push_duration': ANY,
+        'push_durations': [1.0],
+        'last_pushed_digest': 'sha256:' + 'a' * 64})
+
+
+def test_prune_rendered_runs(patch, tmpdir):
+    """the latest runs are kept, as are files that aren't run dirs"""
+    patch('constants.RENDERED_DIR', str(tmpdir))
+    patch('constants.RENDERED_RUNS_KEPT', 2)
+    for age, run in enumerate(['run-3', 'run-2', 'run-1']):
+        tmpdir.mkdir(run)
+        os.utime(str(tmpdir.join(run)), (age, 1000 - age))
+    tmpdir.join('job.yaml').write('')
+
+    DeployCommand._prune_rendered_runs()
+
+    assert sorted(os.listdir(str(tmpdir))) == ['job.yaml', 'run-2', 'run-3']
+
+
+JOB_TEMPLATE = """apiVersion: batch/v1
+kind: Job
+metadata:
+  name: $app-$run
+spec:
+  template:
+    spec:
+      containers:
+      - name: $app
+        image: $image
+        env:
+        - name: GREETING
+          value: $greeting
+"""
+
+SERVICE_TEMPLATE = """apiVersion: v1
+kind: Service
+metadata:
+  name: $app
+"""
+
+
+@pytest.fixture
+def app_dir(monkeypatch, tmpdir, patch, verify_build, verify_init,
+            popen_mock):
+    """an app dir the deploys render into for real, only kubectl is fake;
+       fixtures that patch have to come first, they need the working dir
+    """
+    patch('kubernetes_helpers.ensure_namespace_exists')
+    monkeypatch.chdir(str(tmpdir))
+    templates = tmpdir.mkdir('k8s-templates')
+    templates.join('job.yaml').write(JOB_TEMPLATE)
+    templates.join('service.yaml').write(SERVICE_TEMPLATE)
+    tmpdir.join('.push.json').write(json.dumps(
+        {'last_remote_container': 'dockerhub/app:1234'}))
+    return tmpdir
+
+
+def deploy_app(greeting='hi', **args):
+    deploy_cmd = DeployCommand(dict({
+        'deploy': True, '--no-push': True, '--skip-crd-check': True,
+        '--interactive': False, '--logs': False}, **args))
+    deploy_cmd.config = {'name': 'app', 'namespace': 'namespace',
+                         'template_parameters': {'greeting': greeting}}
+    with catch_stdout() as caught_output:
+        deploy_cmd.action()
+        return caught_output.getvalue()
+
+
+def live_run_id(app_dir):
+    return json.loads(app_dir.join('.push.json').read())['app_run_id']
+
+
+def test_deploy_unchanged(app_dir, popen_mock):
+    """an identical redeploy applies nothing, one with a changed job only
+       the job
+    """
+    deploy_app()
+    first_run = live_run_id(app_dir)
+    assert popen_mock.call_count == 1
+
+    output = deploy_app()
+    assert 'Nothing changed since run {}'.format(first_run) in output
+    assert popen_mock.call_count == 1
+    assert live_run_id(app_dir) == first_run
+    assert [run['outcome'] for run in run_history.runs(action='deploy')] \
+        == ['unchanged', 'success']
+
+    output = deploy_app(greeting='hello')
+    assert popen_mock.call_count == 2
+    assert 'Service/app is unchanged since run {}'.format(first_run) in output
+    second_run = live_run_id(app_dir)
+    # the run's dir has all objects, so undeploying it deletes them all,
+    # but only the changed job gets applied
+    run_dir = app_dir.join('k8s', second_run)
+    assert sorted(os.listdir(str(run_dir))) == [
+        'changed', 'job.yaml', 'service.yaml']
+    assert os.listdir(str(run_dir.join('changed'))) == ['job.yaml']
+    assert popen_mock.call_args[0][0][-1] == os.path.join(
+        'k8s', second_run, 'changed')
+    rendered = run_dir.join('job.yaml').read()
+    assert 'name: app-' + second_run in rendered
+    assert 'mlt-run-id: ' + second_run in rendered
+
+    deploy_app(greeting='hello', **{'--force': True})
+    assert popen_mock.call_count == 3
+    assert sorted(os.listdir(str(app_dir.join('k8s', live_run_id(
+        app_dir))))) == ['job.yaml', 'service.yaml']
+    assert popen_mock.call_args[0][0][-1] == os.path.join(
+        'k8s', live_run_id(app_dir))
+
+
+def test_deploy_shared_objects_labels(app_dir):
+    """objects not named after the run are shared by all runs, so they
+       don't get a run label an earlier run could be undeployed by
+    """
+    deploy_app()
+    run_dir = app_dir.join('k8s', live_run_id(app_dir))
+    service = safe_load(run_dir.join('service.yaml').read())
+    assert service['metadata']['labels'] == {'mlt-app-name': 'app'}
+    job = safe_load(run_dir.join('job.yaml').read())
+    assert job['metadata']['labels']['mlt-run-id'] == live_run_id(app_dir)
+
+
+def test_deploy_dry_run(app_dir, popen_mock):
+    deploy_app()
+    first_run = live_run_id(app_dir)
+
+    output = deploy_app(greeting='hello', **{'--dry-run': True})
+    assert '--- Job/app-$run\n+++ Job/app-$run\n' in output
+    assert '-          value: hi\n+          value: hello\n' in output
+    assert 'Service' not in output
+    assert popen_mock.call_count == 1
+    assert live_run_id(app_dir) == first_run
+
+    output = deploy_app(**{'--dry-run': True})
+    assert output == 'Nothing changed since run {}\n'.format(first_run)
+
+
+@pytest.fixture
+def sweep_spec(app_dir):
+    spec = app_dir.join('sweep.json')
+    spec.write(json.dumps({'grid': {'greeting': ['a', 'b', 'c']}}))
+    return str(spec)
+
+
+@pytest.fixture
+def quota_headroom(monkeypatch):
+    headroom = MagicMock(return_value={})
+    monkeypatch.setattr('mlt.utils.kubernetes_helpers.quota_headroom',
+                        headroom)
+    return headroom
+
+
+def test_deploy_sweep(app_dir, popen_mock, sweep_spec, quota_headroom):
+    output = deploy_app(**{'--sweep': sweep_spec, '--concurrency': '2'})
+
+    assert popen_mock.call_count == 3
+    runs = run_history.runs(action='deploy')
+    assert sorted(run['details']['point']['greeting'] for run in runs) == \
+        ['a', 'b', 'c']
+    assert set(run['outcome'] for run in runs) == {'success'}
+    assert len(set(run['details']['sweep'] for run in runs)) == 1
+    for run in runs:
+        rendered = safe_load_all(
+            app_dir.join('k8s', run['run_id'], 'job.yaml').read())
+        job = [obj for obj in rendered if obj['kind'] == 'Job'][0]
+        assert job['metadata']['labels']['mlt-sweep-id'] == \
+            run['details']['sweep']
+        assert job['spec']['template']['spec']['containers'][0]['env'] == [
+            {'name': 'GREETING', 'value': run['details']['point']['greeting']}]
+        assert 'Deployed run {}'.format(run['run_id']) in output
+    assert live_run_id(app_dir) in [run['run_id'] for run in runs]
+    assert 'Deployed 3 of 3 runs' in output
+
+
+def test_deploy_sweep_waits_for_quota(sleep, app_dir, popen_mock, sweep_spec,
+                                      quota_headroom):
+    # every run takes a pod, there is room for one and then for two more
+    quota_headroom.side_effect = [{'pods': (2, 1)}, {'pods': (2, 2)}]
+    output = deploy_app(**{'--sweep': sweep_spec})
+
+    assert 'Waiting for the resource quota of namespace namespace to ' \
+        'allow the next 2 run(s)' in output
+    assert popen_mock.call_count == 3
+    assert quota_headroom.call_count == 2
+
+
+def test_deploy_sweep_run_over_quota(app_dir, popen_mock, sweep_spec,
+                                     quota_headroom):
+    quota_headroom.return_value = {'count/jobs.batch': (0, 0)}
+    with pytest.raises(ValueError, match='allows 0'):
+        deploy_app(**{'--sweep': sweep_spec})
+    assert popen_mock.call_count == 0
+
+
+def test_deploy_sweep_failed_run(app_dir, popen_mock, sweep_spec,
+                                 quota_headroom):
+    popen_mock.return_value.wait.side_effect = [0, 1, 0]
+    with pytest.raises(SystemExit):
+        deploy_app(**{'--sweep': sweep_spec, '--concurrency': '1'})
+    assert sorted(run['outcome'] for run in run_history.runs()) == \
+        ['failed', 'success', 'success']
@@ -22,8 +22,11 @@ from __future__ import print_function
 
 import pytest
 
+import json
 import uuid
-from mlt.commands.events import EventsCommand
+from threading import Timer
+
+from mlt.commands.events import EventsCommand, RunEvents
 from test_utils.io import catch_stdout
 
 @pytest.fixture
@@ -36,42 +39,79 @@ def open_mock(patch):
 
 @pytest.fixture
 def os_path_mock(patch):
-    return patch('os.path')
+    return patch('os.path.exists')
 
 @pytest.fixture
-def process_helpers(patch):
-    return patch('process_helpers.run_popen')
+def process_helpers(kube_api):
+    return kube_api
+
+
+EVENTS = '/api/v1/namespaces/namespace/events'
+PODS = '/api/v1/namespaces/namespace/pods'
+
+
+def event(name, object_name, message='Started container',
+          timestamp='2018-05-17T22:28:34Z', kind='Pod'):
+    return {'metadata': {'name': name}, 'type': 'Normal',
+            'reason': 'Started', 'message': message,
+            'lastTimestamp': timestamp,
+            'involvedObject': {'kind': kind, 'name': object_name}}
+
+
+def pod(name, app, run_id):
+    return {'metadata': {'name': name, 'labels': {
+        'mlt-app-name': app, 'mlt-run-id': run_id}}}
 
 @pytest.fixture
 def verify_init(patch):
     return patch('config_helpers.load_config')
 
-def test_events_get_events(json_mock, open_mock, verify_init, process_helpers, os_path_mock):
+def test_events_get_events(process_helpers, json_mock, open_mock,
+                           verify_init, os_path_mock):
     run_id = str(uuid.uuid4())
-    os_path_mock.exists.return_value = True
+    os_path_mock.return_value = True
     json_mock_data = {
         'last_remote_container': 'gcr.io/app_name:container_id',
         'last_push_duration': 0.18889,
-        'app_run_id': run_id}
+        'app_run_id': run_id,
+        'app_run_objects': ['TFJob/app-' + run_id]}
     json_mock.load.return_value = json_mock_data
 
     events_command = EventsCommand({'events': True})
     events_command.config = {'name': 'app', 'namespace': 'namespace'}
 
-    head_value ="LAST SEEN   FIRST SEEN   COUNT"
-    event_value = '-'.join(['app', run_id])
-    process_helpers.return_value.stdout.readline.side_effect = [head_value, event_value, '']
-    process_helpers.return_value.poll.return_value = 1
-    process_helpers.return_value.stderr.readline.return_value = ''
+    pod_name = '-'.join(['app', run_id, 'worker-0'])
+    process_helpers.add(PODS, pod(pod_name, 'app', run_id))
+    # named like our run, but deployed by another app
+    process_helpers.add(PODS, pod('app-' + run_id + '-ps-0', 'app2', run_id))
+    process_helpers.add(EVENTS, event('e1', pod_name, 'Pulled image',
+                                      '2018-05-17T22:28:35Z'))
+    process_helpers.add(EVENTS, event('e2', pod_name))
+    process_helpers.add(EVENTS, event('e3', 'other-app-pod'))
+    process_helpers.add(EVENTS, event('e4', 'app-' + run_id + '-ps-0'))
+    process_helpers.add(EVENTS, event('e5', 'app-' + run_id, 'Created pods',
+                                      '2018-05-17T22:28:30Z', kind='TFJob'))
     with catch_stdout() as caught_output:
         events_command.action()
         output = caught_output.getvalue()
-    assert head_value in output
-    assert event_value in output
+    lines = output.splitlines()
+    assert lines[0].split() == ['LAST', 'SEEN', 'TYPE', 'REASON', 'OBJECT',
+                                'MESSAGE']
+    assert 'TFJob/app-' + run_id in lines[1]
+    assert 'Pod/' + pod_name in lines[2]
+    # oldest first
+    assert 'Started container' in lines[2]
+    assert 'Pulled image' in lines[3]
+    assert 'other-app-pod' not in output
+    assert '-ps-0' not in output
+    assert ('GET', PODS + '?labelSelector=mlt-app-name%3Dapp%2Cmlt-run-id%3D'
+            + run_id) in process_helpers.requests
+    # only the events of our objects are fetched
+    assert ('GET', EVENTS) not in process_helpers.requests
 
 def test_events_no_push_json_file(open_mock, verify_init,
                                 process_helpers, os_path_mock):
-    os_path_mock.exists.return_value = False
+    os_path_mock.return_value = False
     events_command = EventsCommand({'events': True})
     events_command.config = {'name': 'app', 'namespace': 'namespace'}
 
@@ -85,7 +125,7 @@ def test_events_no_push_json_file(open_mock, verify_init,
 def test_events_corrupted_app_run_id(json_mock, open_mock,
                                    verify_init, process_helpers, os_path_mock):
     run_id = '31dea6fc'
-    os_path_mock.exists.return_value = True
+    os_path_mock.return_value = True
     json_mock_data = {
         'last_remote_container': 'gcr.io/app_name:container_id',
         'last_push_duration': 0.18889,
@@ -102,10 +142,10 @@ def test_events_corrupted_app_run_id(json_mock, open_mock,
 
     assert"Please re-deploy app again, something went wrong." in output
 
-def test_events_no_resources_found(json_mock, open_mock, verify_init,
-                        process_helpers, os_path_mock):
+def test_events_no_resources_found(process_helpers, json_mock, open_mock,
+                                   verify_init, os_path_mock):
     run_id = str(uuid.uuid4())
-    os_path_mock.exists.return_value = True
+    os_path_mock.return_value = True
     json_mock_data = {
         'last_remote_container': 'gcr.io/app_name:container_id',
         'last_push_duration': 0.18889,
@@ -115,19 +155,19 @@ def test_events_no_resources_found(json_mock, open_mock, verify_init,
     events_command = EventsCommand({'events': True})
     events_command.config = {'name': 'app', 'namespace': 'namespace'}
 
-    process_helpers.side_effect = Exception("No resources found")
+    process_helpers.stop()
 
     with catch_stdout() as caught_output:
         with pytest.raises(SystemExit):
             events_command.action()
         output = caught_output.getvalue()
 
-    assert "No resources found" in output
+    assert "Exception: Unable to reach" in output
 
-def test_events_no_events_to_display(json_mock, open_mock, verify_init,
-                        process_helpers, os_path_mock):
+def test_events_no_events_to_display(process_helpers, json_mock, open_mock,
+                                     verify_init, os_path_mock):
     run_id = str(uuid.uuid4())
-    os_path_mock.exists.return_value = True
+    os_path_mock.return_value = True
     json_mock_data = {
         'last_remote_container': 'gcr.io/app_name:container_id',
         'last_push_duration': 0.18889,
@@ -137,12 +177,79 @@ def test_events_no_events_to_display(json_mock, open_mock, verify_init,
     events_command = EventsCommand({'events': True})
     events_command.config = {'name': 'app', 'namespace': 'namespace'}
 
-    head_value = "LAST SEEN   FIRST SEEN   COUNT"
-    process_helpers.return_value.stdout.readline.side_effect = [head_value, "current job events missing", '']
-    process_helpers.return_value.poll.return_value = 1
-    process_helpers.return_value.stderr.readline.return_value = ''
+    process_helpers.add(EVENTS, event('e1', 'current-job-events-missing'))
     with catch_stdout() as caught_output:
         events_command.action()
         output = caught_output.getvalue()
 
     assert "No events to display for this job" in output
+
+
+def test_events_json(process_helpers, json_mock, open_mock, verify_init,
+                     os_path_mock):
+    run_id = str(uuid.uuid4())
+    os_path_mock.return_value = True
+    json_mock.load.return_value = {'app_run_id': run_id}
+    json_mock.dumps.side_effect = json.dumps
+
+    events_command = EventsCommand({'events': True, '--json': True})
+    events_command.config = {'name': 'app', 'namespace': 'namespace'}
+
+    pod_name = '-'.join(['app', run_id, 'worker-0'])
+    process_helpers.add(PODS, pod(pod_name, 'app', run_id))
+    process_helpers.add(EVENTS, event('e1', pod_name))
+    with catch_stdout() as caught_output:
+        events_command.action()
+        output = caught_output.getvalue()
+
+    assert [json.loads(line)['metadata']['name']
+            for line in output.splitlines()] == ['e1']
+
+
+def test_events_follow(process_helpers):
+    """new events and the events of pods created later show up once"""
+    selector = 'mlt-app-name=app,mlt-run-id=run'
+    job_event = process_helpers.add(
+        EVENTS, event('e1', 'app-run', 'Created pod', kind='TFJob'))
+    run_events = RunEvents('namespace', selector, ['TFJob/app-run'])
+    assert run_events.list() == [job_event]
+
+    shown = []
+
+    def show(shown_event):
+        shown.append(shown_event['metadata']['name'])
+        if len(shown) == 2:
+            run_events.stop()
+
+    def deploy_pod():
+        process_helpers.emit(PODS, 'ADDED', pod('app-run-0', 'app', 'run'))
+        process_helpers.emit(EVENTS, 'ADDED', event('e2', 'other-pod'))
+        process_helpers.emit(EVENTS, 'ADDED', event('e3', 'app-run-0'))
+        process_helpers.emit(EVENTS, 'ADDED', event(
+            'e4', 'app-run', 'Job done', kind='TFJob'))
+    timer = Timer(0.2, deploy_pod)
+    timer.start()
+    stopper = Timer(5, run_events.stop)
+    stopper.start()
+    run_events.follow(show)
+    stopper.cancel()
+    timer.join()
+
+    assert sorted(shown) == ['e3', 'e4']
+
+def test_events_of_earlier_run(process_helpers, open_mock, verify_init,
+                               os_path_mock):
+    from mlt.utils import run_history
+    run_id = str(uuid.uuid4())
+    run_history.record('deploy', run_id, 1.0, 'success',
+                       objects=['TFJob/app-' + run_id])
+    events_command = EventsCommand({'events': True, '--run': run_id[:8]})
+    events_command.config = {'name': 'app', 'namespace': 'namespace'}
+    process_helpers.add(EVENTS, event('e1', 'app-' + run_id, 'Created pods',
+                                      kind='TFJob'))
+    with catch_stdout() as caught_output:
+        events_command.action()
+        output = caught_output.getvalue()
+    assert 'TFJob/app-' + run_id in output
+    # the latest deploy isn't looked at
+    open_mock.assert_not_called()
@@ -20,14 +20,19 @@
 
 from __future__ import print_function
 
+import errno
 import pytest
-
 import uuid
-from mlt.utils.log_helpers import check_for_pods_readiness
+from io import StringIO
+from threading import Timer
+
+from mlt.utils.log_helpers import (check_for_pods_readiness, LogMultiplexer,
+                                   since_seconds)
 from mlt.commands.logs import LogsCommand
 
 from test_utils.io import catch_stdout
 
+PODS = '/api/v1/namespaces/namespace/pods'
 
 @pytest.fixture
 def json_mock(patch):
@@ -39,15 +44,15 @@ def open_mock(patch):
 
 @pytest.fixture
 def sleep_mock(patch):
-    return patch('log_helpers.sleep')
+    return patch('log_helpers.time.sleep')
 
 @pytest.fixture
-def process_helpers(patch):
-    return patch('log_helpers.process_helpers.run_popen')
+def process_helpers(kube_api):
+    return kube_api
 
 @pytest.fixture
 def os_path_mock(patch):
-    return patch('log_helpers.os.path')
+    return patch('log_helpers.os.path.exists')
 
 @pytest.fixture
 def check_for_pods_readiness_mock(patch):
@@ -57,33 +62,38 @@ def check_for_pods_readiness_mock(patch):
 def verify_init(patch):
     return patch('config_helpers.load_config')
 
-def test_logs_get_logs(json_mock, open_mock, verify_init, sleep_mock,
-                       check_for_pods_readiness_mock,
-                       process_helpers, os_path_mock):
+def test_logs_get_logs(process_helpers, json_mock, open_mock, verify_init,
+                       sleep_mock, check_for_pods_readiness_mock,
+                       os_path_mock):
     run_id = str(uuid.uuid4())
-    os_path_mock.exists.return_value = True
+    os_path_mock.return_value = True
     json_mock_data = {
         'last_remote_container': 'gcr.io/app_name:container_id',
         'last_push_duration': 0.18889,
         'app_run_id': run_id}
     json_mock.load.return_value = json_mock_data
-    logs_command = LogsCommand({'logs': True, '--since': '1m', '--retries':5})
+    logs_command = LogsCommand({'logs': True, '--since': '1m', '--timeout': 5})
     logs_command.config = {'name': 'app', 'namespace': 'namespace'}
 
-    log_value = '-'.join(['app', run_id])
-    check_for_pods_readiness_mock.return_value = True
-    process_helpers.return_value.stdout.readline.side_effect = [log_value, '']
-    process_helpers.return_value.poll.return_value = 1
-    process_helpers.return_value.stderr.readline.return_value = ''
+    pod_name = '-'.join(['app', run_id, 'worker-0'])
+    check_for_pods_readiness_mock.return_value = [pod_name]
+    process_helpers.logs[PODS + '/' + pod_name] = ['training step 1']
     with catch_stdout() as caught_output:
         logs_command.action()
         output = caught_output.getvalue()
-    assert log_value in output
+    assert '[{}] training step 1'.format(pod_name) in output
+    log_request = [path for method, path in process_helpers.requests
+                   if '/log?' in path][0]
+    assert log_request.startswith(PODS + '/' + pod_name + '/log?')
+    assert 'follow=true' in log_request
+    assert 'sinceSeconds=60' in log_request
+    check_for_pods_readiness_mock.assert_called_once_with(
+        'namespace', 'mlt-app-name=app,mlt-run-id=' + run_id, 5)
 
 def test_logs_no_push_json_file(open_mock, verify_init, sleep_mock,
                                 process_helpers, os_path_mock):
-    os_path_mock.exists.return_value = False
-    logs_command = LogsCommand({'logs': True, '--since': '1m', '--retries':5})
+    os_path_mock.return_value = False
+    logs_command = LogsCommand({'logs': True, '--since': '1m', '--timeout': 5})
     logs_command.config = {'name': 'app', 'namespace': 'namespace'}
 
     with catch_stdout() as caught_output:
@@ -96,13 +106,13 @@ def test_logs_no_push_json_file(open_mock, verify_init, sleep_mock,
 def test_logs_corrupted_app_run_id(json_mock, open_mock, sleep_mock,
                                    verify_init, process_helpers, os_path_mock):
     run_id = '31dea6fc'
-    os_path_mock.exists.return_value = True
+    os_path_mock.return_value = True
     json_mock_data = {
         'last_remote_container': 'gcr.io/app_name:container_id',
         'last_push_duration': 0.18889,
         'app_run_id': run_id}
     json_mock.load.return_value = json_mock_data
-    logs_command = LogsCommand({'logs': True, '--since': '1m', '--retries':5})
+    logs_command = LogsCommand({'logs': True, '--since': '1m', '--timeout': 5})
     logs_command.config = {'name': 'app', 'namespace': 'namespace'}
 
     with catch_stdout() as caught_output:
@@ -116,61 +126,57 @@ def test_logs_exception(json_mock, open_mock, verify_init, sleep_mock,
                         check_for_pods_readiness_mock,
                         process_helpers, os_path_mock):
     run_id = str(uuid.uuid4())
-    os_path_mock.exists.return_value = True
+    os_path_mock.return_value = True
     json_mock_data = {
         'last_remote_container': 'gcr.io/app_name:container_id',
         'last_push_duration': 0.18889,
         'app_run_id': run_id}
-    check_for_pods_readiness_mock.return_value = True
+    check_for_pods_readiness_mock.return_value = ['pod']
     json_mock.load.return_value = json_mock_data
-    logs_command = LogsCommand({'logs': True, '--since': '1m', '--retries':5})
+    logs_command = LogsCommand({'logs': True, '--since': 'forever',
+                                '--timeout': 5})
     logs_command.config = {'name': 'app', 'namespace': 'namespace'}
 
-    process_helpers.side_effect = OSError
-
     with catch_stdout() as caught_output:
         with pytest.raises(SystemExit):
             logs_command.action()
         output = caught_output.getvalue()
 
-    assert "Exception:" in output
+    assert "Exception: Invalid duration forever" in output
 
 
-def test_logs_command_not_found(json_mock, open_mock, sleep_mock, check_for_pods_readiness_mock,
-                                verify_init, process_helpers, os_path_mock):
+def test_logs_command_not_found(patch, json_mock, open_mock, sleep_mock, check_for_pods_readiness_mock,
+                                verify_init, os_path_mock):
     run_id = str(uuid.uuid4())
-    os_path_mock.exists.return_value = True
+    os_path_mock.return_value = True
     json_mock_data = {
         'last_remote_container': 'gcr.io/app_name:container_id',
         'last_push_duration': 0.18889,
         'app_run_id': run_id}
     json_mock.load.return_value = json_mock_data
-    logs_command = LogsCommand({'logs': True, '--since': '1m', '--retries':5})
+    logs_command = LogsCommand({'logs': True, '--since': '1m', '--timeout': 5})
     logs_command.config = {'name': 'app', 'namespace': 'namespace'}
-    check_for_pods_readiness_mock.return_value = True
-    command_not_found = '/bin/sh: kubetail: command not found'
-    process_helpers.return_value.stdout.readline.return_value = ''
-    process_helpers.return_value.poll.return_value = 1
-    process_helpers.return_value.\
-        stderr.readline.side_effect = Exception(command_not_found)
+    check_for_pods_readiness_mock.return_value = ['pod']
+    patch('log_helpers.kubernetes_client.process_helpers.StreamingProcess'
+          ).side_effect = OSError(errno.ENOENT, 'No such file or directory')
     with catch_stdout() as caught_output:
         with pytest.raises(SystemExit):
             logs_command.action()
         output = caught_output.getvalue()
 
-    assert 'It is a prerequisite' in output
+    assert 'please make sure it is installed' in output
 
 
 def test_logs_no_logs_found(json_mock, open_mock, sleep_mock, check_for_pods_readiness_mock,
                                 verify_init, process_helpers, os_path_mock):
     run_id = str(uuid.uuid4())
-    os_path_mock.exists.return_value = True
+    os_path_mock.return_value = True
     json_mock_data = {
         'last_remote_container': 'gcr.io/app_name:container_id',
         'last_push_duration': 0.18889,
         'app_run_id': run_id}
     json_mock.load.return_value = json_mock_data
-    logs_command = LogsCommand({'logs': True, '--since': '1m', '--retries':5})
+    logs_command = LogsCommand({'logs': True, '--since': '1m', '--timeout': 5})
     logs_command.config = {'name': 'app', 'namespace': 'namespace'}
     check_for_pods_readiness_mock.return_value = False
     with catch_stdout() as caught_output:
@@ -179,31 +185,173 @@ def test_logs_no_logs_found(json_mock, open_mock, sleep_mock, check_for_pods_rea
     assert "No logs found for this job." in output
 
 
-def test_logs_check_for_pods_readiness(process_helpers, sleep_mock):
-    run_id = str(uuid.uuid4()).split("-")
-    filter_tag = "-".join(["app", run_id[0], run_id[1]])
-    process_helpers.return_value.stdout.read.return_value = "\n".join(["random-pod1",
-                                            "random-pod2",
-                                            filter_tag+"-ps-"+run_id[3]+" 1/1  Running  0  16d",
-                                             filter_tag+"-worker1-"+run_id[3]+" 1/1  Running  0  16d",
-                                             filter_tag+"-worker2-"+run_id[3]+" 1/1  Running  0  16d"])
+SELECTOR = 'mlt-app-name=app,mlt-run-id=run'
+
+
+def _pod(name, phase, run_id=None):
+    pod = {'metadata': {'name': name, 'labels': {}},
+           'status': {'phase': phase}}
+    if run_id:
+        pod['metadata']['labels'].update(
+            {'mlt-app-name': 'app', 'mlt-run-id': run_id})
+    return pod
+
+
+def _emit_later(api, event_type, pod, delay=0.2):
+    timer = Timer(delay, api.emit, args=(PODS, event_type, pod))
+    timer.start()
+    return timer
+
+
+def test_logs_check_for_pods_readiness(process_helpers):
+    job_name = "app-run"
+    process_helpers.add(PODS, _pod("random-pod1", "Running"))
+    process_helpers.add(PODS, _pod("other-run-pod", "Pending", "other"))
+    process_helpers.add(PODS, _pod(job_name + "-ps-0", "Pending", "run"))
+    process_helpers.add(PODS, _pod(job_name + "-worker-0", "Running",
+                                   "run"))
+    timer = _emit_later(process_helpers, 'MODIFIED',
+                        _pod(job_name + "-ps-0", "Running", "run"))
 
     with catch_stdout() as caught_output:
-        found = check_for_pods_readiness(namespace='namespace', filter_tag=filter_tag, retries=5)
+        found = check_for_pods_readiness(
+            namespace='namespace', selector=SELECTOR, timeout=5)
         output = caught_output.getvalue()
+    timer.join()
 
-    assert found == True
+    assert found == [job_name + "-ps-0", job_name + "-worker-0"]
     assert "Checking for pod(s) readiness" in output
+    assert any('watch=true' in path
+               for method, path in process_helpers.requests)
+
+
+def test_logs_check_for_pods_readiness_all_pods(process_helpers):
+    """a Running pod listed first doesn't count as all of them"""
+    job_name = "app-run"
+    process_helpers.add(PODS, _pod(job_name + "-ps-0", "Running", "run"))
+    process_helpers.add(PODS, _pod(job_name + "-worker-0", "Pending",
+                                   "run"))
+    process_helpers.add(PODS, _pod(job_name + "-worker-1", "Running",
+                                   "run"))
+    timer = _emit_later(process_helpers, 'MODIFIED',
+                        _pod(job_name + "-worker-0", "Running", "run"))
+
+    with catch_stdout():
+        found = check_for_pods_readiness(
+            namespace='namespace', selector=SELECTOR, timeout=5)
+    timer.join()
+
+    assert found == [job_name + "-ps-0", job_name + "-worker-0",
+                     job_name + "-worker-1"]
+
+
+def test_logs_check_for_pods_readiness_all_running(process_helpers):
+    """no need to watch when every pod is Running already"""
+    for name in ("app-run-ps-0", "app-run-worker-0", "app-run-worker-1"):
+        process_helpers.add(PODS, _pod(name, "Running", "run"))
+
+    with catch_stdout():
+        found = check_for_pods_readiness(
+            namespace='namespace', selector=SELECTOR, timeout=5)
+
+    assert found == ["app-run-ps-0", "app-run-worker-0", "app-run-worker-1"]
+    assert not any('watch=true' in path
+                   for method, path in process_helpers.requests)
+
+
+def test_logs_check_for_pods_readiness_pod_deleted(process_helpers):
+    job_name = "app-run"
+    pending = _pod(job_name + "-ps-0", "Pending", "run")
+    process_helpers.add(PODS, pending)
+    process_helpers.add(PODS, _pod(job_name + "-worker-0", "Running",
+                                   "run"))
+    timer = _emit_later(process_helpers, 'DELETED', pending)
+
+    with catch_stdout():
+        found = check_for_pods_readiness(
+            namespace='namespace', selector=SELECTOR, timeout=5)
+    timer.join()
+
+    assert found == [job_name + "-worker-0"]
+
+
+def test_logs_check_for_pods_readiness_timeout(process_helpers):
+    """the watch stays open without our pods showing up"""
+    process_helpers.add(PODS, _pod("random-pod1", "Running"))
+
+    with catch_stdout() as caught_output:
+        found = check_for_pods_readiness(
+            namespace='namespace', selector=SELECTOR, timeout=0.3)
+        output = caught_output.getvalue()
+
+    assert found == []
+    assert "Timed out waiting for pod(s) to be Running." in output
+
 
-def test_logs_check_for_pods_readiness_max_retries_reached(process_helpers, sleep_mock):
-    run_id = str(uuid.uuid4()).split("-")
-    filter_tag = "-".join(["app", run_id[0], run_id[1]])
+def test_logs_check_for_pods_readiness_api_error(process_helpers):
+    process_helpers.stop()
 
-    process_helpers.return_value.stdout.read.return_value = "\n".join(["random-pod1",
-                                                                      "random-pod2"])
     with catch_stdout() as caught_output:
-        found = check_for_pods_readiness(namespace='namespace', filter_tag=filter_tag, retries=5)
+        found = check_for_pods_readiness(
+            namespace='namespace', selector=SELECTOR, timeout=1)
         output = caught_output.getvalue()
 
-    assert found == False
-    assert "Max retries Reached." in output
+    assert found == []
+    assert "Unable to watch pods:" in output
+
+
+def _multiplexer(lines, timestamps=False):
+    """a multiplexer whose readers already queued up `lines` per pod"""
+    output = StringIO()
+    multiplexer = LogMultiplexer('namespace', sorted(lines), '1m',
+                                 timestamps=timestamps, output=output)
+    for pod, pod_lines in lines.items():
+        for line in pod_lines + [None]:
+            multiplexer._queue_line(multiplexer.queues[pod], line)
+    return multiplexer, output
+
+
+def test_log_multiplexer_round_robin():
+    """a chatty pod doesn't get to print all its lines first"""
+    multiplexer, output = _multiplexer({
+        'chatty': ['chatty {}'.format(i) for i in range(5)],
+        'quiet': ['quiet 0', 'quiet 1']})
+    multiplexer._print_lines()
+    assert output.getvalue().splitlines()[:4] == [
+        '[chatty] chatty 0', '[quiet] quiet 0',
+        '[chatty] chatty 1', '[quiet] quiet 1']
+    assert len(output.getvalue().splitlines()) == 7
+
+
+def test_log_multiplexer_timestamps():
+    multiplexer, output = _multiplexer({
+        'ps': ['2018-05-17T22:28:34.5Z ps 0',
+               '2018-05-17T22:28:36Z ps 1'],
+        'worker': ['2018-05-17T22:28:34.57Z worker 0',
+                   '2018-05-17T22:28:35.000000001Z worker 1']}, True)
+    multiplexer._print_lines()
+    assert [line.split()[-1] for line in output.getvalue().splitlines()] \
+        == ['0', '0', '1', '1']
+    assert output.getvalue().splitlines()[0].startswith('[ps]')
+    assert output.getvalue().splitlines()[2].startswith('[worker]')
+
+
+def test_log_multiplexer_run(kube_api):
+    kube_api.logs[PODS + '/a'] = ['hello from a']
+    kube_api.logs[PODS + '/b'] = ['hello from b', 'bye from b']
+    output = StringIO()
+    LogMultiplexer('namespace', ['a', 'b'], '1m', output=output).run()
+    assert sorted(output.getvalue().splitlines()) == [
+        '[a] hello from a', '[b] bye from b', '[b] hello from b']
+
+
+@pytest.mark.parametrize('duration,seconds', [
+    ('1m', 60), ('1h30m', 5400), ('10s', 10), ('1.5m', 90), ('10ms', 1)])
+def test_since_seconds(duration, seconds):
+    assert since_seconds(duration) == seconds
+
+
+@pytest.mark.parametrize('duration', ['', '1', 'forever', '1m foo'])
+def test_since_seconds_invalid(duration):
+    with pytest.raises(ValueError):
+        since_seconds(duration)
@@ -0,0 +1,79 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+from __future__ import print_function
+
+import pytest
+
+from mlt.commands.runs import RunsCommand
+from mlt.utils import run_history
+from test_utils.io import catch_stdout
+
+
+@pytest.fixture(autouse=True)
+def load_config(patch):
+    return patch('config_helpers.load_config')
+
+
+def runs_command(**args):
+    return RunsCommand(dict({'runs': True, 'list': False, 'show': False,
+                             '--limit': '20', '<run_id>': None}, **args))
+
+
+def test_runs_list():
+    run_history.record('build', 'abc', 100.0, 'success', duration=2.5,
+                       image='gcr.io/app:abc')
+    run_history.record('deploy', 'app-1', 200.0, 'failed')
+    with catch_stdout() as caught_output:
+        runs_command(list=True).action()
+        lines = caught_output.getvalue().splitlines()
+    assert lines[0].split() == ['RUN', 'ACTION', 'STARTED', 'DURATION',
+                                'OUTCOME', 'IMAGE']
+    assert lines[2].split()[:2] == ['app-1', 'deploy']
+    assert lines[3].split()[:2] == ['abc', 'build']
+    assert '2.50s' in lines[3] and 'gcr.io/app:abc' in lines[3]
+
+
+def test_runs_list_empty():
+    with catch_stdout() as caught_output:
+        runs_command(list=True).action()
+        assert caught_output.getvalue().strip() == "No runs recorded yet."
+
+
+def test_runs_show():
+    run_history.record('deploy', 'app-1', 200.0, 'success', duration=1.0,
+                       image='gcr.io/app:abc', objects=['TFJob/app-1'],
+                       namespace='ns')
+    with catch_stdout() as caught_output:
+        runs_command(show=True, **{'<run_id>': 'app'}).action()
+        output = caught_output.getvalue()
+    assert 'Deploy app-1 success' in output
+    assert 'image: gcr.io/app:abc' in output
+    assert 'namespace: ns' in output
+    assert 'objects: ["TFJob/app-1"]' in output
+
+
+@pytest.mark.parametrize('run_id', ['nope', 'app-'])
+def test_runs_show_not_found_or_ambiguous(run_id):
+    run_history.record('deploy', 'app-1', 1.0, 'success')
+    run_history.record('deploy', 'app-2', 2.0, 'success')
+    with catch_stdout():
+        with pytest.raises(SystemExit):
+            runs_command(show=True, **{'<run_id>': run_id}).action()
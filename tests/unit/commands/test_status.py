@@ -22,12 +22,13 @@ from __future__ import print_function
 
 import pytest
 import uuid
+from threading import Timer
 
 from mock import patch, MagicMock
-from subprocess import CalledProcessError
 from test_utils.io import catch_stdout
 
-from mlt.commands.status import StatusCommand
+from mlt.commands.status import (RunStatus, StatusCommand, job_status,
+                                 pod_status)
 
 
 @pytest.fixture
@@ -51,7 +52,10 @@ def json_mock(patch):
 
 @pytest.fixture
 def subprocess_mock(patch):
-    return patch('subprocess.check_output')
+    run_capture = patch('process_helpers.run_capture')
+    run_capture.return_value.returncode = 0
+    run_capture.return_value.stderr_text.return_value = ''
+    return run_capture
 
 
 @pytest.fixture
@@ -59,8 +63,8 @@ def default_status_mock(patch):
     return patch('StatusCommand._default_status')
 
 
-def status():
-    status_cmd = StatusCommand({})
+def status(args=None):
+    status_cmd = StatusCommand({'--make': True} if args is None else args)
     status_cmd.config = {'name': 'app', 'namespace': 'namespace'}
 
     with catch_stdout() as caught_output:
@@ -105,7 +109,7 @@ def test_successful_status(init_mock, open_mock, isfile_mock,
     isfile_mock.return_value = True
     json_mock.load.return_value = {"app_run_id": "123-456-789"}
     expected_output = "Job and pod status"
-    subprocess_mock.return_value.decode.return_value = expected_output
+    subprocess_mock.return_value.stdout_text.return_value = expected_output
     status_output = status()
     assert expected_output in status_output
 
@@ -118,9 +122,10 @@ def test_status_not_in_makefile(init_mock, open_mock,
     isfile_mock.return_value = True
     json_mock.load.return_value = {"app_run_id": "123-456-789"}
     expected_output = "This app does not support the `mlt status` command"
-    subprocess_mock.side_effect = CalledProcessError(
-        returncode=2, cmd="make status",
-        output="No rule to make target `status'")
+    subprocess_mock.return_value.returncode = 2
+    subprocess_mock.return_value.stdout_text.return_value = ''
+    subprocess_mock.return_value.stderr_text.return_value = \
+        "make: *** No rule to make target `status'.  Stop."
     status_output = status()
     assert expected_output in status_output
 
@@ -134,7 +139,99 @@ def test_status_makefile_error(init_mock, open_mock, isfile_mock, json_mock,
     isfile_mock.return_value = True
     json_mock.load.return_value = {"app_run_id": "123-456-789"}
     error_msg = "Makefile status target error"
-    subprocess_mock.side_effect = CalledProcessError(
-        returncode=2, cmd="make status", output=error_msg)
+    subprocess_mock.return_value.returncode = 2
+    subprocess_mock.return_value.stdout_text.return_value = error_msg
     status_output = status()
     assert error_msg in status_output
+
+
+PODS = '/api/v1/namespaces/namespace/pods'
+TFJOBS = '/apis/kubeflow.org/v1alpha1/namespaces/namespace/tfjobs'
+RUN_LABELS = {'mlt-app-name': 'app', 'mlt-run-id': '123-456-789'}
+
+
+def _pod(name, phase='Running', labels=RUN_LABELS, **status):
+    status['phase'] = phase
+    return {'metadata': {'name': name, 'labels': labels},
+            'spec': {'nodeName': 'node-1'}, 'status': status}
+
+
+def test_native_status(kube_api, init_mock, open_mock, isfile_mock,
+                       json_mock):
+    isfile_mock.return_value = True
+    json_mock.load.return_value = {
+        "app_run_id": "123-456-789",
+        "app_run_api_versions": {"TFJob": "kubeflow.org/v1alpha1"}}
+    kube_api.add(TFJOBS, {'kind': 'TFJob', 'metadata': {
+        'name': 'app-123-456-789', 'labels': RUN_LABELS},
+        'status': {'phase': 'Running'}})
+    kube_api.add(PODS, _pod('app-123-456-789-ps-0'))
+    kube_api.add(PODS, _pod('app-123-456-789-worker-0', 'Pending',
+                            containerStatuses=[{
+                                'restartCount': 2, 'state': {'waiting': {
+                                    'reason': 'ImagePullBackOff'}}}]))
+    kube_api.add(PODS, _pod('other-app-pod', labels={'mlt-app-name': 'x'}))
+
+    output = status({})
+
+    assert 'TFJob/app-123-456-789' in output
+    assert '2 pod(s): 1 ImagePullBackOff, 1 Running' in output
+    assert 'other-app-pod' not in output
+    worker = [line for line in output.splitlines()
+              if 'worker-0' in line][0]
+    assert worker.split()[1:] == ['ImagePullBackOff', '2', '<unknown>',
+                                  'node-1']
+
+
+def test_native_status_no_pods(kube_api, init_mock, open_mock, isfile_mock,
+                               json_mock):
+    isfile_mock.return_value = True
+    json_mock.load.return_value = {"app_run_id": "123-456-789"}
+    assert 'No pods found for this run.' in status({})
+
+
+def test_status_watch(kube_api):
+    """changes to the run show up as they happen"""
+    selector = 'mlt-app-name=app,mlt-run-id=123-456-789'
+    kube_api.add(PODS, _pod('app-ps-0', 'Pending'))
+    run_status = RunStatus('namespace', selector, {})
+    run_status.list()
+
+    summaries = []
+
+    def show(summary):
+        summaries.append(summary)
+        if 'Running' in summary:
+            run_status.stop()
+    timer = Timer(0.2, kube_api.emit, args=(PODS, 'MODIFIED',
+                                            _pod('app-ps-0')))
+    timer.start()
+    stopper = Timer(5, run_status.stop)
+    stopper.start()
+    run_status.watch(show)
+    stopper.cancel()
+    timer.join()
+
+    assert '1 pod(s): 1 Pending' in summaries[0]
+    assert '1 pod(s): 1 Running' in summaries[-1]
+
+
+@pytest.mark.parametrize('job,expected', [
+    ({'status': {'phase': 'Done'}}, 'Done'),
+    ({'status': {'conditions': [
+        {'type': 'Created', 'status': 'True'},
+        {'type': 'Succeeded', 'status': 'True'}]}}, 'Succeeded'),
+    ({'status': {'active': 2}}, 'Running'),
+    ({}, 'Pending')])
+def test_job_status(job, expected):
+    assert job_status(job) == expected
+
+
+def test_pod_status():
+    assert pod_status(_pod('p', 'Succeeded', containerStatuses=[
+        {'state': {'terminated': {'reason': 'Completed'}}}])) == 'Succeeded'
+    assert pod_status(_pod('p', 'Failed', containerStatuses=[
+        {'state': {'terminated': {'reason': 'OOMKilled'}}}])) == 'OOMKilled'
+    terminating = _pod('p')
+    terminating['metadata']['deletionTimestamp'] = '2018-05-17T22:28:34Z'
+    assert pod_status(terminating) == 'Terminating'
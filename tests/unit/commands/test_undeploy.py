@@ -18,9 +18,16 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import json
+import os
+from threading import Timer
+
+import pytest
 from mock import patch
 
 from mlt.commands.undeploy import UndeployCommand
+from mlt.utils import run_history
+from test_utils.io import catch_stdout
 
 
 @patch('mlt.commands.undeploy.config_helpers.load_config')
@@ -30,3 +37,159 @@ def test_undeploy(proc_helpers, load_config):
     undeploy.config = {'namespace': 'foo'}
     undeploy.action()
     proc_helpers.run.assert_called_once()
+
+
+@patch('mlt.commands.undeploy.config_helpers.load_config')
+@patch('mlt.commands.undeploy.process_helpers')
+@patch('mlt.commands.undeploy.files.fetch_action_arg')
+def test_undeploy_latest_run(fetch_action_arg, proc_helpers, load_config,
+                             tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    tmpdir.mkdir('k8s').mkdir('run-1')
+    fetch_action_arg.return_value = 'run-1'
+    undeploy = UndeployCommand({'undeploy': True})
+    undeploy.config = {'namespace': 'foo'}
+    undeploy.action()
+    proc_helpers.run.assert_called_once_with(
+        ["kubectl", "--namespace", "foo", "delete", "-f",
+         os.path.join("k8s", "run-1")])
+
+
+@patch('mlt.commands.undeploy.config_helpers.load_config')
+@patch('mlt.commands.undeploy.process_helpers')
+def test_undeploy_forgets_live_manifests(proc_helpers, load_config, tmpdir,
+                                         monkeypatch):
+    """so the next deploy doesn't skip what is no longer there"""
+    monkeypatch.chdir(str(tmpdir))
+    tmpdir.join('.push.json').write(json.dumps({
+        'app_run_id': 'run-1', 'app_run_hashes': {'Service/app': 'abc'},
+        'app_run_renders': ['def']}))
+    undeploy = UndeployCommand({'undeploy': True})
+    undeploy.config = {'namespace': 'foo'}
+    undeploy.action()
+    assert json.loads(tmpdir.join('.push.json').read()) == {
+        'app_run_id': 'run-1'}
+
+
+TFJOBS = '/apis/kubeflow.org/v1alpha2/namespaces/foo/tfjobs'
+SERVICES = '/api/v1/namespaces/foo/services'
+PODS = '/api/v1/namespaces/foo/pods'
+
+
+def _obj(kind, name, run_id, created='2018-01-01T00:00:00Z', app='app'):
+    return {'kind': kind, 'metadata': {
+        'name': name, 'creationTimestamp': created,
+        'labels': {'mlt-app-name': app, 'mlt-run-id': run_id}}}
+
+
+@pytest.fixture
+def app_runs(kube_api, tmpdir, monkeypatch):
+    """two runs of the app and one of another app in namespace foo, both
+       deploys of the app recorded in the run history
+    """
+    monkeypatch.chdir(str(tmpdir))
+    for run_id in ('run-1', 'run-2'):
+        tmpdir.join('k8s', run_id).ensure(dir=True)
+        run_history.record('deploy', run_id, 1.0, 'success', api_versions={
+            'TFJob': 'kubeflow.org/v1alpha2', 'Service': 'v1'})
+    kube_api.add(TFJOBS, _obj('TFJob', 'job-1', 'run-1'))
+    kube_api.add(SERVICES, _obj('Service', 'svc-1', 'run-1'))
+    kube_api.add(TFJOBS, _obj('TFJob', 'job-2', 'run-2',
+                              created='2999-01-01T00:00:00Z'))
+    kube_api.add(TFJOBS, _obj('TFJob', 'other', 'run-3', app='other'))
+    return kube_api
+
+
+def undeploy_runs(**args):
+    undeploy = UndeployCommand(dict({'undeploy': True}, **args))
+    undeploy.config = {'namespace': 'foo', 'name': 'app'}
+    with catch_stdout() as caught_output:
+        undeploy.action()
+        return caught_output.getvalue()
+
+
+@patch('mlt.commands.undeploy.config_helpers.load_config')
+def test_undeploy_all(load_config, app_runs, tmpdir):
+    output = undeploy_runs(**{'--all': True})
+    assert 'Deleting 3 object(s) of 2 run(s)' in output
+    assert sorted(app_runs.objects) == [TFJOBS + '/other']
+    assert app_runs.delete_options == [{
+        'kind': 'DeleteOptions', 'apiVersion': 'v1',
+        'propagationPolicy': 'Background'}] * 3
+    assert not tmpdir.join('k8s', 'run-1').check()
+    assert sorted(run['run_id'] for run in run_history.runs(
+        action='undeploy')) == ['run-1', 'run-2']
+
+
+@patch('mlt.commands.undeploy.config_helpers.load_config')
+def test_undeploy_run(load_config, app_runs, tmpdir):
+    undeploy_runs(**{'--run': 'run-2'})
+    assert TFJOBS + '/job-2' not in app_runs.objects
+    assert TFJOBS + '/job-1' in app_runs.objects
+    assert tmpdir.join('k8s', 'run-1').check()
+    assert not tmpdir.join('k8s', 'run-2').check()
+    undeploy = run_history.runs(action='undeploy')[0]
+    assert undeploy['run_id'] == 'run-2'
+    assert undeploy['details']['objects'] == ['TFJob/job-2']
+
+
+@patch('mlt.commands.undeploy.config_helpers.load_config')
+def test_undeploy_older_than(load_config, app_runs):
+    undeploy_runs(**{'--older-than': '1d'})
+    assert sorted(app_runs.objects) == [TFJOBS + '/job-2',
+                                        TFJOBS + '/other']
+
+
+@patch('mlt.commands.undeploy.config_helpers.load_config')
+def test_undeploy_shared_objects(load_config, app_runs):
+    """objects shared by all runs only carry the app label, they stay
+       until the whole app is undeployed
+    """
+    shared = _obj('Service', 'app', None)
+    del shared['metadata']['labels']['mlt-run-id']
+    app_runs.add(SERVICES, shared)
+    undeploy_runs(**{'--older-than': '1d'})
+    assert SERVICES + '/app' in app_runs.objects
+    undeploy_runs(**{'--run': 'run-2'})
+    assert SERVICES + '/app' in app_runs.objects
+
+    output = undeploy_runs(**{'--all': True})
+    assert 'Deleting 1 object(s) of 0 run(s)' in output
+    assert sorted(app_runs.objects) == [TFJOBS + '/other']
+
+
+@patch('mlt.commands.undeploy.config_helpers.load_config')
+def test_undeploy_live_run(load_config, app_runs, tmpdir):
+    tmpdir.join('.push.json').write(json.dumps({
+        'app_run_id': 'run-1', 'app_run_hashes': {'Service/app': 'abc'}}))
+    undeploy_runs(**{'--run': 'run-1'})
+    assert json.loads(tmpdir.join('.push.json').read()) == {
+        'app_run_id': 'run-1'}
+
+
+@patch('mlt.commands.undeploy.config_helpers.load_config')
+def test_undeploy_nothing_found(load_config, app_runs):
+    output = undeploy_runs(**{'--older-than': '10000d'})
+    assert output.strip() == "No runs of app found to undeploy."
+    assert not app_runs.delete_options
+
+
+@patch('mlt.commands.undeploy.config_helpers.load_config')
+@patch('mlt.commands.undeploy.WAIT_POLL', 0.05)
+def test_undeploy_wait(load_config, app_runs):
+    """the garbage collector takes the pods of the job away later on"""
+    app_runs.add(PODS, _obj('Pod', 'job-1-worker-0', 'run-1'))
+    Timer(0.2, app_runs.objects.pop, args=(PODS + '/job-1-worker-0',)
+          ).start()
+    output = undeploy_runs(**{'--run': 'run-1', '--wait': True,
+                              '--timeout': '5'})
+    assert 'All 1 run(s) are gone' in output
+
+
+@patch('mlt.commands.undeploy.config_helpers.load_config')
+@patch('mlt.commands.undeploy.WAIT_POLL', 0.05)
+def test_undeploy_wait_timeout(load_config, app_runs):
+    app_runs.add(PODS, _obj('Pod', 'job-1-worker-0', 'run-1'))
+    with pytest.raises(SystemExit):
+        undeploy_runs(**{'--run': 'run-1', '--wait': True,
+                         '--timeout': '0'})
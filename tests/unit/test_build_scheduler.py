@@ -0,0 +1,208 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import time
+from threading import Event
+
+from mock import MagicMock
+
+from mlt.build_scheduler import BuildScheduler
+from test_utils.io import catch_stdout
+
+
+class FakeBuild(object):
+    """a build that runs until it's released or cancelled"""
+    def __init__(self):
+        self.started = []
+        self.cancelled = []
+        self.release = Event()
+
+    def __call__(self, cancelled):
+        self.started.append(time.time())
+        while not self.release.is_set():
+            if cancelled.wait(0.01):
+                self.cancelled.append(True)
+                return
+
+
+def _wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_single_build():
+    build = FakeBuild()
+    build.release.set()
+    scheduler = BuildScheduler(build)
+    with catch_stdout() as caught_output:
+        scheduler.schedule({'main.py'})
+        scheduler.wait(2)
+        output = caught_output.getvalue()
+    assert len(build.started) == 1
+    assert 'Build queue depth: 0, 0 change(s) coalesced' in output
+
+
+def test_changes_during_build_are_coalesced():
+    """three changes during a build mean one follow-up build"""
+    build = FakeBuild()
+    scheduler = BuildScheduler(build, cancel_stale=False)
+    with catch_stdout() as caught_output:
+        scheduler.schedule({'main.py'})
+        _wait_for(lambda: build.started)
+        scheduler.schedule({'a.py'})
+        scheduler.schedule({'b.py'})
+        scheduler.schedule({'a.py', 'c.py'})
+        build.release.set()
+        scheduler.wait(2)
+        output = caught_output.getvalue()
+
+    assert len(build.started) == 2
+    assert not build.cancelled
+    assert 'Build in progress, queued 3 changed file(s)' in output
+    assert 'Build queue depth: 1, 3 change(s) coalesced' in output
+    assert scheduler.worker is None
+
+
+def test_stale_build_is_cancelled():
+    build = FakeBuild()
+    scheduler = BuildScheduler(build)
+    with catch_stdout() as caught_output:
+        scheduler.schedule({'main.py'})
+        _wait_for(lambda: build.started)
+        time.sleep(0.05)
+        scheduler.schedule({'a.py'})
+        _wait_for(lambda: len(build.started) == 2)
+        build.release.set()
+        scheduler.wait(2)
+        output = caught_output.getvalue()
+
+    assert build.cancelled == [True]
+    assert len(build.started) == 2
+    assert 'Cancelling stale build' in output
+    assert scheduler.wasted_build_time >= 0.05
+
+
+def test_failed_build_keeps_scheduling():
+    def failing_build(cancelled):
+        raise SystemExit(1)
+
+    scheduler = BuildScheduler(failing_build)
+    with catch_stdout():
+        scheduler.schedule({'main.py'})
+        scheduler.wait(2)
+        assert scheduler.worker is None
+        scheduler.schedule({'main.py'})
+        scheduler.wait(2)
+    assert scheduler.worker is None
+
+
+def test_build_error_keeps_scheduling():
+    """an unexpected error is reported and the next change builds again"""
+    builds = []
+
+    def broken_build(cancelled):
+        builds.append(True)
+        raise OSError(2, 'No such file or directory')
+
+    scheduler = BuildScheduler(broken_build)
+    with catch_stdout() as caught_output:
+        scheduler.schedule({'main.py'})
+        scheduler.wait(2)
+        assert scheduler.worker is None
+        scheduler.schedule({'main.py'})
+        scheduler.wait(2)
+        output = caught_output.getvalue()
+    assert len(builds) == 2
+    assert 'Build failed: [Errno 2] No such file or directory' in output
+    assert scheduler.worker is None
+    assert scheduler.pending_changes is None
+
+
+def test_scheduler_recovers_from_worker_crash():
+    """even if the worker itself fails with a build queued, the next change
+       starts a new worker
+    """
+    build = FakeBuild()
+    scheduler = BuildScheduler(build)
+    scheduler._report = MagicMock(side_effect=RuntimeError('boom'))
+    errors = []
+    run = scheduler._run
+
+    def run_worker():
+        try:
+            run()
+        except RuntimeError as ex:
+            errors.append(ex)
+    scheduler._run = run_worker
+
+    with catch_stdout():
+        scheduler.schedule({'main.py'})
+        _wait_for(lambda: build.started)
+        worker = scheduler.worker
+        scheduler.schedule({'a.py'})
+        worker.join(2)
+    assert [str(ex) for ex in errors] == ['boom']
+    assert scheduler.worker is None
+    assert scheduler.pending_changes is None
+
+
+def test_finished_worker_leaves_next_worker_alone():
+    """a change that starts a new worker while the last one is still on
+       its way out must not lead to two builds at a time
+    """
+    running = []
+    most_running = []
+    release = Event()
+
+    def build(cancelled):
+        running.append(True)
+        most_running.append(len(running))
+        release.wait(2)
+        running.pop()
+
+    scheduler = BuildScheduler(build, cancel_stale=False)
+    report = scheduler._report
+    next_worker = []
+
+    def report_then_schedule(queued, coalesced_changes):
+        report(queued, coalesced_changes)
+        if not next_worker:
+            # the first worker is done but its thread hasn't ended yet
+            release.clear()
+            scheduler.schedule({'b.py'})
+            next_worker.append(scheduler.worker)
+    scheduler._report = report_then_schedule
+
+    with catch_stdout():
+        release.set()
+        scheduler.schedule({'a.py'})
+        first_worker = scheduler.worker
+        _wait_for(lambda: next_worker)
+        first_worker.join(2)
+        first_worker_done = scheduler.worker is next_worker[0]
+        scheduler.schedule({'c.py'})
+        release.set()
+        scheduler.wait(2)
+
+    assert first_worker_done
+    assert max(most_running) == 1
+    assert len(most_running) == 3
+    assert scheduler.worker is None
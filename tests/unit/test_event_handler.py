@@ -18,45 +18,88 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
-from mock import MagicMock, patch
+import os
+import time
+
+import pytest
+from mock import MagicMock
 
 from mlt.event_handler import EventHandler
 from test_utils.io import catch_stdout
 
 
-@patch('mlt.event_handler.call')
-def test_dispatch_git(call):
+@pytest.fixture
+def project(tmpdir):
+    project_dir = str(tmpdir)
+    with open(os.path.join(project_dir, '.gitignore'), 'w') as f:
+        f.write('data/\n*.ckpt\n')
+    return project_dir
+
+
+def _event(project, path, is_directory=False):
+    return MagicMock(src_path=os.path.join(project, path),
+                     is_directory=is_directory)
+
+
+def test_dispatch_git(project):
     """if event relates to git we return immediately"""
-    event_handler = EventHandler(lambda: 'foo')
-    event_handler.dispatch(MagicMock(src_path='./.git/index'))
-    call.assert_not_called()
+    event_handler = EventHandler(lambda changed: 'foo', root=project)
+    event_handler.dispatch(_event(project, '.git/index'))
+    assert event_handler.timer is None
 
 
-@patch('mlt.event_handler.call')
-def test_dispatch_directory(call):
+def test_dispatch_directory(project):
     """if event is the main dir we do nothing"""
-    event_handler = EventHandler(lambda: 'foo')
-    event_handler.dispatch(MagicMock(src_path='./'))
-    call.assert_not_called()
-
-
-@patch('mlt.event_handler.open')
-@patch('mlt.event_handler.call')
-def test_dispatch_is_ignored(call, open_mock):
-    """if git check-ignore passes, we do nothing"""
-    call.return_value = 0
-    event_handler = EventHandler(lambda: 'foo')
-    event_handler.dispatch(MagicMock())
+    event_handler = EventHandler(lambda changed: 'foo', root=project)
+    event_handler.dispatch(MagicMock(src_path=project))
     assert event_handler.timer is None
 
 
-@patch('mlt.event_handler.open')
-@patch('mlt.event_handler.call')
-def test_dispatch(call, open_mock):
+@pytest.mark.parametrize('path', ['data/checkpoint', 'model.ckpt',
+                                  'logs/step-1.ckpt'])
+def test_dispatch_is_ignored(project, path):
+    """if the path is gitignored, we do nothing"""
+    event_handler = EventHandler(lambda changed: 'foo', root=project)
+    event_handler.dispatch(_event(project, path))
+    assert event_handler.timer is None
+
+
+def test_dispatch(project):
     """normal file event handling"""
-    event_handler = EventHandler(lambda: 'foo')
+    event_handler = EventHandler(lambda changed: 'foo', root=project)
     event_handler.timer = None
     with catch_stdout() as caught_output:
         event_handler.dispatch(MagicMock(src_path='/foo'))
         output = caught_output.getvalue()
+    event_handler.timer.cancel()
     assert output == 'Detected change in /foo\n'
+
+
+def test_dispatch_batches_changes(project):
+    """many events within the delay turn into one callback"""
+    callback = MagicMock()
+    event_handler = EventHandler(callback, delay=0.1, root=project)
+    with catch_stdout() as caught_output:
+        for i in range(100):
+            event_handler.dispatch(_event(project, 'src/{}.py'.format(i)))
+            event_handler.dispatch(_event(project, 'data/{}'.format(i)))
+        output = caught_output.getvalue()
+        time.sleep(0.3)
+
+    assert output.count('Detected change') == 1
+    callback.assert_called_once_with(
+        set('src/{}.py'.format(i) for i in range(100)))
+    assert event_handler.timer is None
+
+
+def test_dispatch_reloads_gitignore(project):
+    event_handler = EventHandler(lambda changed: 'foo', root=project)
+    with open(os.path.join(project, '.gitignore'), 'a') as f:
+        f.write('output/\n')
+    with catch_stdout():
+        event_handler.dispatch(_event(project, '.gitignore'))
+    event_handler.timer.cancel()
+    event_handler.timer = None
+
+    event_handler.dispatch(_event(project, 'output/model.pb'))
+    assert event_handler.timer is None
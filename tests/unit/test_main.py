@@ -19,9 +19,13 @@
 #
 
 import pytest
-from mock import MagicMock, patch
+from docopt import docopt
+from mock import patch
 
-from mlt.main import main, run_command
+from mlt import main as mlt_main
+from mlt.commands import Command
+from mlt.main import (COMMAND_MAP, load_command, main, profile_option,
+                      run_command, sanitize_input)
 
 """
 All these tests assert that given a command arg from docopt we call
@@ -34,10 +38,20 @@ the right command
                           'undeploy', 'foo'])
 def test_run_command(command):
     # couldn't get this to work as a function decorator
-    with patch('mlt.main.COMMAND_MAP', ((command, MagicMock()),)) \
-            as COMMAND_MAP:
+    with patch('mlt.main.COMMAND_MAP',
+               ((command, 'mlt.commands.foo.FooCommand'),)), \
+            patch('mlt.main.load_command') as load_command:
         run_command({command: True})
-        COMMAND_MAP[0][1].return_value.action.assert_called_once()
+        load_command.assert_called_once_with('mlt.commands.foo.FooCommand')
+        load_command.return_value.return_value.action.assert_called_once()
+
+
+@pytest.mark.parametrize('command,command_class', COMMAND_MAP)
+def test_load_command(command, command_class):
+    """every command in the map can be imported"""
+    CommandClass = load_command(command_class)
+    assert issubclass(CommandClass, Command)
+    assert CommandClass.__name__ == command_class.rsplit('.', 1)[1]
 
 
 @pytest.mark.parametrize('args',
@@ -107,3 +121,42 @@ def test_main_set_remove_name(docopt_mock, command):
     with pytest.raises(ValueError):
         main()
         run_command(args)
+
+
+@pytest.mark.parametrize('argv,timeout', [
+    (['deploy'], None),
+    (['deploy', '--timeout=30'], 30),
+    (['logs', '--retries=7'], 7),
+    (['logs', '--retries=7', '--timeout=3'], 3),
+    (['undeploy', '--all', '--wait', '--timeout=5'], 5),
+])
+def test_sanitize_timeout(argv, timeout):
+    """--retries is the deprecated name of --timeout"""
+    args = sanitize_input(docopt(mlt_main.__doc__, argv=argv))
+    assert args['--timeout'] == timeout
+
+
+@pytest.mark.parametrize('argv,expected', [
+    (['status'], (['status'], None)),
+    (['--profile', 'status', '--watch'], (['status', '--watch'], '')),
+    (['deploy', '--profile=trace.json'], (['deploy'], 'trace.json')),
+    (['deploy', '--profile', 'trace.json'], (['deploy'], 'trace.json')),
+    (['deploy', '--profile', '--no-push'], (['deploy', '--no-push'], '')),
+    (['init', '--profile', 'my-app'], (['init', 'my-app'], '')),
+    (['deploy', '--profile'], (['deploy'], '')),
+])
+def test_profile_option(argv, expected):
+    assert profile_option(argv) == expected
+
+
+@patch('mlt.main.docopt')
+@patch('mlt.main.run_command')
+@patch('mlt.main.profile_helpers')
+def test_main_profile(profile_helpers, run_command, docopt):
+    docopt.return_value = {'<name>': None, '-i': False, '-l': False,
+                           '--retries': '5', '--namespace': None}
+    with patch('sys.argv', ['mlt', 'status', '--profile=trace.json']):
+        main()
+    assert docopt.call_args[1]['argv'] == ['status']
+    profile_helpers.start.assert_called_once()
+    profile_helpers.finish.assert_called_once_with('trace.json')
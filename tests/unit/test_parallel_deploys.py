@@ -0,0 +1,146 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+
+"""
+Stress test: CI runs sweeps as many `mlt deploy`s side by side from one app
+dir, against stand-ins for kubectl and docker. None of them may see or
+apply the manifests of another, and the app's state files must survive.
+"""
+import json
+import os
+import stat
+import subprocess
+import sys
+
+import yaml
+
+import mlt
+from mlt.utils import run_history
+
+DEPLOYS = 8
+
+TEMPLATE = """apiVersion: kubeflow.org/v1alpha2
+kind: TFJob
+metadata:
+  name: $app-$run
+spec:
+  tfReplicaSpecs:
+    Worker:
+      template:
+        spec:
+          containers:
+          - name: $app
+            image: $image
+"""
+
+# fails the apply when the dir it is given holds another run's manifests
+KUBECTL = """
+import os
+import sys
+
+import yaml
+
+args = sys.argv[1:]
+if args[:2] == ['get', '--raw']:
+    print('{"metadata": {"name": "ns"}}')
+elif 'apply' in args:
+    rendered_dir = args[args.index('-f') + 1]
+    run_id = os.path.basename(rendered_dir)
+    for filename in sorted(os.listdir(rendered_dir)):
+        with open(os.path.join(rendered_dir, filename)) as f:
+            for obj in yaml.safe_load_all(f):
+                if obj['metadata']['labels']['mlt-run-id'] != run_id:
+                    sys.exit('{} is not from run {}'.format(filename, run_id))
+                print('tfjob.kubeflow.org/{} created'.format(
+                    obj['metadata']['name']))
+    with open(os.environ['APPLIED_LOG'], 'a') as log:
+        log.write(run_id + '\\n')
+else:
+    sys.exit('unexpected kubectl {}'.format(args))
+"""
+
+DOCKER = """
+import sys
+
+if sys.argv[1] == 'push':
+    print('1234: digest: sha256:' + 'a' * 64 + ' size: 1234')
+"""
+
+
+def stub(bin_dir, name, code):
+    path = bin_dir.join(name)
+    path.write('#!{}\n{}'.format(sys.executable, code))
+    path.chmod(path.stat().mode | stat.S_IEXEC)
+
+
+def make_app(app_dir):
+    app_dir.join('mlt.json').write(json.dumps({
+        'name': 'app', 'namespace': 'ns', 'registry': 'localhost:5000'}))
+    app_dir.join('.build.json').write(json.dumps({
+        'last_container': 'app:1234'}))
+    app_dir.mkdir('k8s-templates').join('job.yaml').write(TEMPLATE)
+
+
+def test_parallel_deploys(tmpdir, monkeypatch):
+    app_dir = tmpdir.mkdir('app')
+    make_app(app_dir)
+    bin_dir = tmpdir.mkdir('bin')
+    stub(bin_dir, 'kubectl', KUBECTL)
+    stub(bin_dir, 'docker', DOCKER)
+    applied_log = tmpdir.join('applied.log')
+    env = dict(os.environ, PYTHONPATH=mlt.BASE_DIR,
+               PATH=str(bin_dir) + os.pathsep + os.environ['PATH'],
+               KUBECONFIG=str(tmpdir.join('no-kubeconfig')),
+               APPLIED_LOG=str(applied_log))
+
+    # the deploys are all the same, without --force the ones starting after
+    # another one finished wouldn't apply anything
+    deploys = [subprocess.Popen(
+        [sys.executable, '-c', 'from mlt.main import main; main()',
+         'deploy', '--skip-crd-check', '--force'], cwd=str(app_dir), env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        for _ in range(DEPLOYS)]
+    for deploy in deploys:
+        output, _ = deploy.communicate()
+        assert deploy.returncode == 0, output.decode('utf-8')
+
+    run_ids = set(applied_log.read().split())
+    assert len(run_ids) == DEPLOYS
+    # every run rendered into a dir of its own
+    assert set(os.listdir(str(app_dir.join('k8s')))) == run_ids
+    for run_id in run_ids:
+        rendered = app_dir.join('k8s', run_id, 'job.yaml').read()
+        assert yaml.safe_load(rendered)['metadata']['name'] == \
+            'app-' + run_id
+
+    # the state is from one of the deploys, not a mix of them
+    push = json.loads(app_dir.join('.push.json').read())
+    assert push['app_run_id'] in run_ids
+    assert push['app_run_objects'] == ['TFJob/app-' + push['app_run_id']]
+    assert push['last_remote_container'] == 'localhost:5000/app:1234'
+    assert not [name for name in os.listdir(str(app_dir))
+                if name.endswith('.tmp')]
+
+    monkeypatch.setattr('mlt.utils.constants.RUN_HISTORY_FILE',
+                        str(app_dir.join('.runs.db')))
+    deployed = run_history.runs(action='deploy')
+    assert set(run['run_id'] for run in deployed) == run_ids
+    assert set(run['outcome'] for run in deployed) == {'success'}
@@ -0,0 +1,89 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+
+"""
+Cold start benchmark: the quick commands get called from scripts in loops,
+so importing `mlt` for them must stay cheap
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import mlt
+
+# modules that only the heavier commands need
+HEAVY_MODULES = ('watchdog', 'yaml', 'tabulate', 'progressbar', 'termcolor',
+                 'mlt.commands.build', 'mlt.commands.deploy')
+
+LIGHTWEIGHT_COMMANDS = ('mlt.commands.config.ConfigCommand',
+                        'mlt.commands.status.StatusCommand',
+                        'mlt.commands.events.EventsCommand',
+                        'mlt.commands.undeploy.UndeployCommand')
+
+# microseconds spent importing mlt for a lightweight command, not counting
+# the version lookup that only happens in a git checkout; it used to take
+# well over 100ms before commands were loaded lazily
+STARTUP_BUDGET_US = int(os.environ.get('MLT_STARTUP_BUDGET_US', 75000))
+
+
+def import_times(command_class):
+    """runs `python -X importtime` loading `command_class` the way `mlt`
+       does, returns {module: (depth, cumulative microseconds)}
+    """
+    code = "from mlt.main import load_command; load_command({!r})".format(
+        command_class)
+    env = dict(os.environ, PYTHONPATH=mlt.BASE_DIR)
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', code], env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    assert process.returncode == 0, err
+    times = {}
+    for line in err.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (len(name) - len(name.lstrip()),
+                               int(cumulative))
+    return times
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason="-X importtime needs python 3.7")
+@pytest.mark.parametrize('command_class', LIGHTWEIGHT_COMMANDS)
+def test_lightweight_command_startup(command_class):
+    times = import_times(command_class)
+
+    heavy = [module for module in times
+             if module.split('.')[0] in HEAVY_MODULES or
+             module in HEAVY_MODULES]
+    assert not heavy, "{} imports {}".format(command_class, heavy)
+
+    # top level imports of ours, which include everything they import
+    startup = sum(cumulative for module, (depth, cumulative)
+                  in times.items()
+                  if depth == 1 and module.split('.')[0] == 'mlt')
+    # the package itself only looks up its version
+    startup -= times.get('mlt', (0, 0))[1]
+    assert startup <= STARTUP_BUDGET_US, \
+        "importing {} took {}us".format(command_class, startup)
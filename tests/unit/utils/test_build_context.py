@@ -0,0 +1,88 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import os
+
+import pytest
+
+from mlt.utils.build_context import context_digest, context_files
+from mlt.utils.process_helpers import run
+
+
+@pytest.fixture
+def project(tmpdir):
+    """a git project with an ignored data dir"""
+    project_dir = str(tmpdir.join('project'))
+    os.makedirs(os.path.join(project_dir, 'data'))
+    _write(project_dir, '.gitignore', 'data/\n.build.json\n')
+    _write(project_dir, 'Dockerfile', 'FROM python\n')
+    _write(project_dir, 'main.py', 'print("hi")\n')
+    _write(project_dir, 'data/checkpoint', '0')
+    run(['git', 'init', '-q', project_dir])
+    return project_dir
+
+
+def _write(project_dir, filename, content):
+    with open(os.path.join(project_dir, filename), 'w') as f:
+        f.write(content)
+
+
+def test_context_files(project):
+    _write(project, '.build.json', '{}')
+    _write(project, 'untracked.py', '')
+    assert context_files(project) == [
+        '.gitignore', 'Dockerfile', 'main.py', 'untracked.py']
+
+
+def test_context_digest_ignores_ignored_files(project):
+    digest = context_digest(project)
+    _write(project, 'data/checkpoint', '1')
+    _write(project, '.push.json', '{}')
+    assert context_digest(project) == digest
+
+
+def test_context_digest_changes_with_content(project):
+    digest = context_digest(project)
+    _write(project, 'main.py', 'print("hello")\n')
+    assert context_digest(project) != digest
+
+
+def test_context_digest_changes_with_mode(project):
+    digest = context_digest(project)
+    os.chmod(os.path.join(project, 'main.py'), 0o755)
+    assert context_digest(project) != digest
+
+
+def test_dockerignore(project):
+    _write(project, '.dockerignore', '*.md\ndocs\n!docs/keep.md\n')
+    os.makedirs(os.path.join(project, 'docs'))
+    _write(project, 'README.md', '')
+    _write(project, 'docs/other.txt', '')
+    _write(project, 'docs/keep.md', '')
+    files = context_files(project)
+    assert 'README.md' not in files
+    assert 'docs/other.txt' not in files
+    assert 'docs/keep.md' in files
+
+
+def test_no_git_repo(tmpdir):
+    _write(str(tmpdir), 'Dockerfile', 'FROM python\n')
+    _write(str(tmpdir), 'main.py', '')
+    assert context_files(str(tmpdir)) == ['Dockerfile', 'main.py']
@@ -23,7 +23,7 @@ from mock import patch
 from mlt.utils.build_helpers import verify_build
 
 
-@patch('mlt.utils.build_helpers.BuildCommand')
+@patch('mlt.commands.build.BuildCommand')
 def test_needs_build_command_bad_build(BuildClass):
     verify_build({})
     assert BuildClass.return_value.action.called
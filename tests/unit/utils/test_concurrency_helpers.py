@@ -0,0 +1,84 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import time
+from threading import Lock
+
+import pytest
+
+from mlt.utils.concurrency_helpers import BackgroundCall, parallel_map
+
+
+def test_parallel_map_keeps_order():
+    def slow_square(number):
+        time.sleep(0.05 * (3 - number))
+        return number * number
+    assert parallel_map(slow_square, [0, 1, 2]) == [0, 1, 4]
+    assert parallel_map(slow_square, []) == []
+
+
+def test_parallel_map_max_workers():
+    running = []
+    most = []
+    lock = Lock()
+
+    def work(item):
+        with lock:
+            running.append(item)
+            most.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(item)
+
+    parallel_map(work, range(6), max_workers=2)
+    assert max(most) == 2
+
+
+def test_parallel_map_raises_first_error():
+    calls = []
+
+    def fail_odd(number):
+        calls.append(number)
+        if number % 2:
+            raise ValueError(number)
+        return number
+
+    with pytest.raises(ValueError) as error:
+        parallel_map(fail_odd, [0, 1, 2, 3])
+    assert str(error.value) == '1'
+    # every call was still made
+    assert sorted(calls) == [0, 1, 2, 3]
+
+
+def test_parallel_map_system_exit():
+    def exit_(item):
+        raise SystemExit(1)
+
+    with pytest.raises(SystemExit):
+        parallel_map(exit_, [1])
+
+
+def test_background_call():
+    assert BackgroundCall(lambda a, b=0: a + b, 1, b=2).wait() == 3
+
+    def fail():
+        raise ValueError('failed')
+    with pytest.raises(ValueError):
+        BackgroundCall(fail).wait()
@@ -18,9 +18,12 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import os
+from threading import Thread
+
 from mock import patch
 
-from mlt.utils.files import fetch_action_arg
+from mlt.utils.files import fetch_action_arg, state_lock, write_atomic
 
 
 @patch('mlt.utils.files.open')
@@ -41,3 +44,32 @@ def test_fetch_action_arg_file_present(json_load_mock, isfile_mock, open_mock):
     open_mock.assert_called_once()
     json_load_mock.assert_called_once()
     assert result == action_data
+
+
+def test_write_atomic(tmpdir):
+    path = str(tmpdir.join('.push.json'))
+    write_atomic(path, 'old')
+    write_atomic(path, 'new')
+    assert tmpdir.join('.push.json').read() == 'new'
+    # no staging files are left behind
+    assert os.listdir(str(tmpdir)) == ['.push.json']
+
+
+def test_state_lock_takes_turns(monkeypatch, tmpdir):
+    monkeypatch.chdir(str(tmpdir))
+    counter = tmpdir.join('counter')
+    counter.write('0')
+
+    def increment():
+        for _ in range(50):
+            with state_lock():
+                counter.write(str(int(counter.read()) + 1))
+
+    # flock locks belong to the open file, so threads exclude each other
+    # like processes do
+    threads = [Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.read() == '200'
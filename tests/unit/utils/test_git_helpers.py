@@ -0,0 +1,124 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import os
+import time
+
+import pytest
+from mock import patch
+
+from mlt.utils import git_helpers
+from mlt.utils.process_helpers import run
+
+
+@pytest.fixture
+def template_repo(tmpdir):
+    """a local repo with one template and a file outside of the templates"""
+    repo = str(tmpdir.join('repo'))
+    os.makedirs(os.path.join(repo, 'mlt-templates', 'hello-world'))
+    with open(os.path.join(repo, 'mlt-templates', 'hello-world',
+                           'README.md'), 'w') as f:
+        f.write('hello')
+    with open(os.path.join(repo, 'setup.py'), 'w') as f:
+        f.write('')
+    _commit(repo, init=True)
+    return repo
+
+
+def _commit(repo, init=False):
+    if init:
+        run(['git', 'init', '-q', repo])
+    run(['git', 'add', '.'], cwd=repo)
+    run(['git', '-c', 'user.name=mlt', '-c', 'user.email=mlt@example.com',
+         'commit', '-q', '-m', 'templates'], cwd=repo)
+
+
+def test_clone_repo_sparse_checkout(template_repo):
+    """only the templates dir is checked out"""
+    with git_helpers.clone_repo(template_repo) as clone:
+        assert os.path.isfile(os.path.join(
+            clone, 'mlt-templates', 'hello-world', 'README.md'))
+        assert not os.path.exists(os.path.join(clone, 'setup.py'))
+
+
+def test_clone_repo_is_cached(template_repo):
+    """the checkout survives the context manager and is reused"""
+    with git_helpers.clone_repo(template_repo) as clone:
+        pass
+    assert os.path.isdir(clone)
+
+    with patch('mlt.utils.git_helpers._clone') as clone_mock:
+        with git_helpers.clone_repo(template_repo) as second_clone:
+            assert second_clone == clone
+    clone_mock.assert_not_called()
+
+
+def test_clone_repo_local_refresh(template_repo):
+    """local repos are refreshed every time so new commits show up"""
+    with git_helpers.clone_repo(template_repo):
+        pass
+    os.makedirs(os.path.join(template_repo, 'mlt-templates', 'new'))
+    with open(os.path.join(template_repo, 'mlt-templates', 'new',
+                           'README.md'), 'w') as f:
+        f.write('new')
+    _commit(template_repo)
+
+    with git_helpers.clone_repo(template_repo) as clone:
+        assert os.path.isdir(os.path.join(clone, 'mlt-templates', 'new'))
+
+
+def test_remote_repo_within_ttl_not_refreshed(tmpdir):
+    repo = 'https://github.com/IntelAI/mlt'
+    destination = git_helpers._cached_repo_path(repo)
+    os.makedirs(os.path.join(destination, '.git'))
+    git_helpers._touch_fetch_stamp(destination)
+
+    with patch('mlt.utils.git_helpers._refresh') as refresh_mock:
+        with git_helpers.clone_repo(repo):
+            pass
+    refresh_mock.assert_not_called()
+
+
+def test_remote_repo_ttl_expired(tmpdir, monkeypatch):
+    repo = 'https://github.com/IntelAI/mlt'
+    destination = git_helpers._cached_repo_path(repo)
+    os.makedirs(os.path.join(destination, '.git'))
+    git_helpers._touch_fetch_stamp(destination)
+    monkeypatch.setenv('MLT_TEMPLATE_CACHE_TTL', '0')
+
+    with patch('mlt.utils.git_helpers._refresh') as refresh_mock:
+        with git_helpers.clone_repo(repo):
+            pass
+    refresh_mock.assert_called_once_with(repo, destination)
+
+
+@patch('mlt.utils.git_helpers._git')
+def test_refresh_offline_uses_cache(git_mock, tmpdir):
+    """a failed fetch keeps the cached checkout and its old stamp"""
+    git_mock.return_value = 128
+    destination = str(tmpdir)
+    os.makedirs(os.path.join(destination, '.git'))
+    git_helpers._touch_fetch_stamp(destination)
+    old_stamp = os.path.getmtime(git_helpers._fetch_stamp(destination))
+    time.sleep(0.01)
+
+    git_helpers._refresh('https://github.com/IntelAI/mlt', destination)
+    assert os.path.getmtime(
+        git_helpers._fetch_stamp(destination)) == old_stamp
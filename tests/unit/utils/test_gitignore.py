@@ -0,0 +1,124 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import os
+
+import pytest
+
+from mlt.utils.gitignore import GitIgnore
+from mlt.utils.process_helpers import run_popen
+
+GITIGNORE = """
+# comment
+*.pyc
+/build
+data/
+!data/keep
+logs/**/*.log
+docs/*.md
+!important.pyc
+\\#literal
+foo/**/bar
+sub/nested.txt
+[a-c]?.tmp
+"""
+
+PATHS = [
+    'main.pyc', 'src/main.pyc', 'important.pyc', 'src/important.pyc',
+    'build', 'build/out.o', 'src/build', 'data', 'data/keep',
+    'src/data/file', 'logs/a.log', 'logs/x/y/b.log', 'logs/a.txt',
+    'docs/readme.md', 'docs/api/readme.md', '#literal', 'foo/bar',
+    'foo/a/b/bar', 'sub/nested.txt', 'x/sub/nested.txt', 'a1.tmp',
+    'd1.tmp', 'ab1.tmp', 'main.py', 'nested/thing.out', 'nested/keep.out',
+]
+
+
+@pytest.fixture
+def home(tmpdir, monkeypatch):
+    """a home dir of its own, so the user's git config stays out of it"""
+    home_dir = str(tmpdir.mkdir('home'))
+    monkeypatch.setenv('HOME', home_dir)
+    monkeypatch.delenv('XDG_CONFIG_HOME', raising=False)
+    return home_dir
+
+
+@pytest.fixture
+def project(tmpdir, home):
+    project_dir = str(tmpdir.mkdir('project'))
+    run_popen(['git', 'init', '-q', project_dir]).wait()
+    with open(os.path.join(project_dir, '.gitignore'), 'w') as f:
+        f.write(GITIGNORE)
+    os.makedirs(os.path.join(project_dir, 'nested'))
+    with open(os.path.join(project_dir, 'nested', '.gitignore'), 'w') as f:
+        f.write('*.out\n!keep.out\n')
+    for directory in ('build', 'data', 'src/build'):
+        os.makedirs(os.path.join(project_dir, directory))
+    return project_dir
+
+
+def _git_ignored(project, path):
+    return run_popen(['git', 'check-ignore', '-q', '--no-index', path],
+                     cwd=project).wait() == 0
+
+
+@pytest.mark.parametrize('path', PATHS)
+def test_matches_git_check_ignore(project, path):
+    is_dir = os.path.isdir(os.path.join(project, path))
+    assert GitIgnore(project).is_ignored(path, is_dir) == \
+        _git_ignored(project, path)
+
+
+def test_info_exclude(project):
+    with open(os.path.join(project, '.git', 'info', 'exclude'), 'w') as f:
+        f.write('secret.txt\n')
+    assert GitIgnore(project).is_ignored('secret.txt')
+
+
+def test_reload(project):
+    gitignore = GitIgnore(project)
+    assert not gitignore.is_ignored('model.h5')
+    with open(os.path.join(project, '.gitignore'), 'a') as f:
+        f.write('*.h5\n')
+    gitignore.reload()
+    assert gitignore.is_ignored('model.h5')
+
+
+def test_global_excludes_default(project, home):
+    os.makedirs(os.path.join(home, '.config', 'git'))
+    with open(os.path.join(home, '.config', 'git', 'ignore'), 'w') as f:
+        f.write('*.swp\n')
+    assert GitIgnore(project).is_ignored('src/main.py.swp')
+    assert _git_ignored(project, 'src/main.py.swp')
+
+
+def test_global_excludes_from_config(project, home):
+    """core.excludesFile has the lowest precedence of all"""
+    with open(os.path.join(home, '.gitconfig'), 'w') as f:
+        f.write('[user]\n\tname = someone\n'
+                '[core]\n\texcludesFile = ~/ignores  # global\n')
+    with open(os.path.join(home, 'ignores'), 'w') as f:
+        f.write('*.bak\nmain.py\n')
+    with open(os.path.join(project, '.gitignore'), 'a') as f:
+        f.write('!keep.bak\n')
+    gitignore = GitIgnore(project)
+    for path in ('model.bak', 'keep.bak', 'main.py'):
+        assert gitignore.is_ignored(path) == _git_ignored(project, path)
+    assert gitignore.is_ignored('model.bak')
+    assert not gitignore.is_ignored('keep.bak')
@@ -0,0 +1,233 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+
+import json
+import socket
+import time
+from threading import Timer
+
+import pytest
+from mock import MagicMock
+
+from mlt.utils import profile_helpers
+from mlt.utils.kubernetes_client import (ApiClient, ApiError,
+                                         current_context, get_client,
+                                         KubeConfig, KubeConfigError,
+                                         KubectlClient)
+
+PODS = '/api/v1/namespaces/ns/pods'
+
+
+def pod(name, phase='Running', **labels):
+    return {'metadata': {'name': name, 'labels': labels},
+            'status': {'phase': phase}}
+
+
+def test_get_client_uses_kubeconfig(kube_api):
+    client = get_client()
+    assert isinstance(client, ApiClient)
+    assert client.config.server == kube_api.url
+    assert client.config.headers() == {'Authorization': 'Bearer fake-token'}
+    assert get_client() is client
+
+
+def test_get_client_falls_back_to_kubectl(monkeypatch, tmpdir):
+    monkeypatch.delenv('MLT_KUBE_CLIENT')
+    monkeypatch.setenv('KUBECONFIG', str(tmpdir.join('missing')))
+    assert isinstance(get_client(), KubectlClient)
+
+
+def test_kubeconfig_auth_plugins_need_kubectl(tmpdir):
+    kubeconfig = tmpdir.join('config')
+    kubeconfig.write("""
+current-context: gke
+contexts: [{name: gke, context: {cluster: gke, user: gke}}]
+clusters: [{name: gke, cluster: {server: 'https://1.2.3.4'}}]
+users: [{name: gke, user: {auth-provider: {name: gcp}}}]
+""")
+    with pytest.raises(KubeConfigError):
+        KubeConfig.load(str(kubeconfig))
+
+
+def test_kubeconfig_merges_files(monkeypatch, tmpdir):
+    first = tmpdir.join('first')
+    first.write("""
+current-context: dev
+contexts: [{name: dev, context: {cluster: dev, user: dev}}]
+""")
+    second = tmpdir.join('second')
+    second.write("""
+current-context: other
+clusters: [{name: dev, cluster: {server: 'http://localhost:8001'}}]
+users: [{name: dev, user: {username: admin, password: secret}}]
+""")
+    monkeypatch.setenv('KUBECONFIG', '{}:{}'.format(first, second))
+    config = KubeConfig.load()
+    assert (config.host, config.port) == ('localhost', 8001)
+    assert config.headers()['Authorization'].startswith('Basic ')
+    assert current_context() == 'dev@http://localhost:8001'
+
+
+def test_current_context_without_kubeconfig(monkeypatch, tmpdir):
+    monkeypatch.setenv('KUBECONFIG', str(tmpdir.join('missing')))
+    assert current_context() is None
+
+
+def test_requests_reuse_connection(kube_api):
+    kube_api.add(PODS, pod('a'))
+    client = get_client()
+    for _ in range(5):
+        assert client.get(PODS + '/a')['metadata']['name'] == 'a'
+    assert kube_api.connections == 1
+
+
+def test_reconnects_after_server_closed_idle_connection(kube_api):
+    kube_api.add(PODS, pod('a'))
+    client = get_client()
+    client.get(PODS + '/a')
+    client._idle[0].sock.shutdown(socket.SHUT_RDWR)
+    assert client.get(PODS + '/a')['metadata']['name'] == 'a'
+
+
+def test_not_found(kube_api):
+    with pytest.raises(ApiError) as error:
+        get_client().get(PODS + '/missing')
+    assert error.value.status == 404
+
+
+def test_requests_are_profiled(kube_api):
+    kube_api.add(PODS, pod('a'))
+    profile_helpers.start()
+    try:
+        get_client().get(PODS + '/a')
+        with pytest.raises(ApiError):
+            get_client().get(PODS + '/missing')
+        assert [(span['name'], span['cat'])
+                for span in profile_helpers._spans] == [
+            ('GET ' + PODS + '/a', 'api'), ('GET ' + PODS + '/missing', 'api')]
+    finally:
+        profile_helpers.finish('')
+
+
+def test_unreachable(monkeypatch, tmpdir):
+    kubeconfig = tmpdir.join('config')
+    kubeconfig.write("""
+current-context: c
+contexts: [{name: c, context: {cluster: c, user: c}}]
+clusters: [{name: c, cluster: {server: 'http://127.0.0.1:1'}}]
+users: [{name: c, user: {}}]
+""")
+    client = ApiClient(KubeConfig.load(str(kubeconfig)))
+    with pytest.raises(ApiError) as error:
+        client.get(PODS)
+    assert error.value.status is None
+
+
+def test_list_with_selectors(kube_api):
+    kube_api.add(PODS, pod('a', app='x'))
+    kube_api.add(PODS, pod('b', app='y'))
+    client = get_client()
+    assert [p['metadata']['name'] for p in client.list(PODS)] == ['a', 'b']
+    assert [p['metadata']['name']
+            for p in client.list(PODS, label_selector='app=y')] == ['b']
+    assert [p['metadata']['name']
+            for p in client.list(PODS, field_selector='metadata.name=a')] \
+        == ['a']
+
+
+def test_watch(kube_api):
+    kube_api.add(PODS, pod('a', 'Pending'))
+    Timer(0.2, kube_api.emit, (PODS, 'MODIFIED', pod('a'))).start()
+    events = []
+    for event_type, obj in get_client().watch(PODS, timeout=5):
+        events.append((event_type, obj['status']['phase']))
+        if obj['status']['phase'] == 'Running':
+            break
+    assert events == [('ADDED', 'Pending'), ('MODIFIED', 'Running')]
+
+
+def test_watch_error_event(kube_api):
+    """an ERROR event is a Status, not an object of the collection"""
+    kube_api.add(PODS, pod('a', 'Pending'))
+    Timer(0.2, kube_api.emit, (PODS, 'ERROR', {
+        'kind': 'Status', 'metadata': {}, 'status': 'Failure', 'code': 410,
+        'reason': 'Expired', 'message': 'too old resource version'})).start()
+    events = []
+    with pytest.raises(ApiError, match='too old resource version') as error:
+        for event_type, obj in get_client().watch(PODS, timeout=5):
+            events.append((event_type, obj['metadata']['name']))
+    assert error.value.status == 410
+    assert events == [('ADDED', 'a')]
+
+
+def test_watch_timeout(kube_api):
+    started = time.time()
+    assert list(get_client().watch(PODS, timeout=0.5)) == []
+    assert time.time() - started < 3
+
+
+def test_stream_logs(kube_api):
+    kube_api.logs[PODS + '/a'] = ['one', 'two']
+    assert list(get_client().stream(PODS + '/a/log', {'follow': 'true'})) \
+        == ['one\n', 'two\n']
+
+
+def test_stream_close_from_another_thread(kube_api):
+    """closing a stream unblocks the thread reading it"""
+    stream = get_client().stream(PODS, {'watch': 'true',
+                                        'timeoutSeconds': '30'})
+    Timer(0.2, stream.close).start()
+    started = time.time()
+    assert list(stream) == []
+    assert time.time() - started < 5
+
+
+def test_kubectl_client_get(patch):
+    run_capture = patch('process_helpers.run_capture')
+    run_capture.return_value.returncode = 0
+    run_capture.return_value.stdout_text.return_value = json.dumps(pod('a'))
+    assert KubectlClient().get(PODS + '/a', {'x': 'y'}) == pod('a')
+    run_capture.assert_called_once_with(
+        ['kubectl', 'get', '--raw', PODS + '/a?x=y'])
+
+
+def test_kubectl_client_not_found(patch):
+    run_capture = patch('process_helpers.run_capture')
+    run_capture.return_value.returncode = 1
+    run_capture.return_value.stderr_text.return_value = \
+        'Error from server (NotFound): pods "a" not found'
+    with pytest.raises(ApiError) as error:
+        KubectlClient().get(PODS + '/a')
+    assert error.value.status == 404
+
+
+def test_kubectl_client_stream(patch):
+    def streaming_process(command, on_stdout, on_exit):
+        on_stdout('{"type": "ADDED", "object": {"metadata": {}}}\n')
+        on_exit()
+        process = MagicMock()
+        process.wait.return_value = 0
+        return process
+    patch('process_helpers.StreamingProcess',
+          MagicMock(side_effect=streaming_process))
+    client = KubectlClient()
+    client.get = MagicMock(return_value={'metadata': {}, 'items': []})
+    assert list(client.watch(PODS)) == [('ADDED', {'metadata': {}})]
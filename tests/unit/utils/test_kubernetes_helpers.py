@@ -18,27 +18,163 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
-import uuid
 from mock import patch
 
-from mlt.utils.kubernetes_helpers import ensure_namespace_exists
+from mlt.utils.kubernetes_client import ApiError
+from mlt.utils.kubernetes_helpers import (ClusterChecks, add_labels, age,
+                                          checking_crds_on_k8,
+                                          collection_path,
+                                          ensure_namespace_exists,
+                                          label_selector, quota_headroom,
+                                          quota_usage, run_labels)
+
+CRDS = '/apis/apiextensions.k8s.io/v1/customresourcedefinitions'
 
 
-@patch('mlt.utils.kubernetes_helpers.call')
-@patch('mlt.utils.kubernetes_helpers.open')
 @patch('mlt.utils.kubernetes_helpers.process_helpers')
-def test_ensure_namespace_no_exist(proc_helpers, open_mock, call):
-    call.return_value = 0
+def test_ensure_namespace_no_exist(proc_helpers, kube_api):
+    kube_api.add('/api/v1/namespaces', {'metadata': {'name': 'ns'}})
 
-    ensure_namespace_exists(str(uuid.uuid4()))
+    ensure_namespace_exists('ns')
     proc_helpers.run.assert_not_called()
 
 
-@patch('mlt.utils.kubernetes_helpers.call')
-@patch('mlt.utils.kubernetes_helpers.open')
 @patch('mlt.utils.kubernetes_helpers.process_helpers')
-def test_ensure_namespace_already_exists(proc_helpers, open_mock, call):
-    call.return_value = 1
+def test_ensure_namespace_already_exists(proc_helpers, kube_api):
+    ensure_namespace_exists('ns')
+    proc_helpers.run.assert_called_once_with(
+        ["kubectl", "create", "namespace", "ns"])
+
+
+def test_checking_crds_on_k8(kube_api):
+    kube_api.add(CRDS, {'metadata': {'name': 'tfjobs.kubeflow.org'}})
+    assert checking_crds_on_k8({'tfjobs.kubeflow.org',
+                                'pytorchjobs.kubeflow.org'}) == \
+        {'pytorchjobs.kubeflow.org'}
+
+
+@patch('mlt.utils.kubernetes_helpers.kubernetes_client.get_client')
+def test_checking_crds_on_old_cluster(get_client):
+    """clusters before 1.16 only have the beta CRD API"""
+    def get_crd(path):
+        if '/v1/' in path:
+            raise ApiError(404, 'not found')
+        return {'metadata': {'name': path.rsplit('/', 1)[1]}}
+    get_client.return_value.get.side_effect = get_crd
+    assert checking_crds_on_k8({'tfjobs.kubeflow.org'}) == set()
+
+
+def test_checking_crds_by_name(kube_api):
+    """only the CRDs we need are fetched, and the ones found are cached"""
+    kube_api.add(CRDS, {'metadata': {'name': 'tfjobs.kubeflow.org'}})
+    kube_api.add(CRDS, {'metadata': {'name': 'huge.example.com'}})
+    for _ in range(2):
+        assert checking_crds_on_k8({'tfjobs.kubeflow.org',
+                                    'pytorchjobs.kubeflow.org'}) == \
+            {'pytorchjobs.kubeflow.org'}
+
+    requests = [path for _, path in kube_api.requests]
+    assert requests.count(CRDS + '/tfjobs.kubeflow.org') == 1
+    assert requests.count(CRDS + '/pytorchjobs.kubeflow.org') == 2
+    assert CRDS not in requests
+
+
+def test_checking_crds_cache_expires(kube_api, monkeypatch):
+    monkeypatch.setenv('MLT_CLUSTER_CACHE_TTL', '0')
+    kube_api.add(CRDS, {'metadata': {'name': 'tfjobs.kubeflow.org'}})
+    checking_crds_on_k8({'tfjobs.kubeflow.org'})
+    checking_crds_on_k8({'tfjobs.kubeflow.org'})
+    assert [path for _, path in kube_api.requests].count(
+        CRDS + '/tfjobs.kubeflow.org') == 2
+
+
+@patch('mlt.utils.kubernetes_helpers.process_helpers')
+def test_ensure_namespace_cached(proc_helpers, kube_api):
+    kube_api.add('/api/v1/namespaces', {'metadata': {'name': 'ns'}})
+    ensure_namespace_exists('ns')
+    ensure_namespace_exists('ns')
+    assert len(kube_api.requests) == 1
+
+    ClusterChecks().forget()
+    ensure_namespace_exists('ns')
+    assert len(kube_api.requests) == 2
+
+
+def test_age():
+    now = 1526596114  # 2018-05-17T22:28:34Z
+    assert age('2018-05-17T22:28:34Z', now) == '0s'
+    assert age('2018-05-17T22:27:04Z', now) == '1m'
+    assert age('2018-05-17T20:28:34.123456Z', now) == '2h'
+    assert age('2018-05-14T22:28:34Z', now) == '3d'
+    assert age(None) == '<unknown>'
+
+
+def test_label_selector():
+    assert label_selector(run_labels('app', '1234')) == \
+        'mlt-app-name=app,mlt-run-id=1234'
+
+
+def test_add_labels():
+    """the object and the pods its controller creates get the labels"""
+    job = {'kind': 'TFJob', 'metadata': {'name': 'app-1234',
+                                         'labels': {'team': 'ml'}},
+           'spec': {'tfReplicaSpecs': {
+               'Worker': {'template': {'spec': {'containers': []}}},
+               'PS': {'template': {'metadata': {'labels': {'ps': 'yes'}}}}}}}
+    labels = run_labels('app', '1234')
+    add_labels(job, labels)
+
+    assert job['metadata']['labels'] == dict(labels, team='ml')
+    replicas = job['spec']['tfReplicaSpecs']
+    assert replicas['Worker']['template']['metadata']['labels'] == labels
+    assert replicas['PS']['template']['metadata']['labels'] == \
+        dict(labels, ps='yes')
+
+
+def test_add_labels_list():
+    objects = {'kind': 'List', 'items': [
+        {'kind': 'Service', 'metadata': {'name': 'app'}}]}
+    add_labels(objects, run_labels('app', '1234'))
+    assert objects['items'][0]['metadata']['labels'] == \
+        run_labels('app', '1234')
+
+
+def test_collection_path():
+    assert collection_path('v1', 'Service', 'ns') == \
+        '/api/v1/namespaces/ns/services'
+    assert collection_path('kubeflow.org/v1alpha1', 'TFJob', 'ns') == \
+        '/apis/kubeflow.org/v1alpha1/namespaces/ns/tfjobs'
+    assert collection_path('extensions/v1beta1', 'Ingress', 'ns') == \
+        '/apis/extensions/v1beta1/namespaces/ns/ingresses'
+    assert collection_path('networking.k8s.io/v1', 'NetworkPolicy',
+                           'ns') == \
+        '/apis/networking.k8s.io/v1/namespaces/ns/networkpolicies'
+
+
+def test_quota_headroom(kube_api):
+    quotas = '/api/v1/namespaces/ns/resourcequotas'
+    kube_api.add(quotas, {'metadata': {'name': 'objects'}, 'status': {
+        'hard': {'pods': '10', 'count/tfjobs.kubeflow.org': '5',
+                 'requests.cpu': '4'},
+        'used': {'pods': '4', 'count/tfjobs.kubeflow.org': '1',
+                 'requests.cpu': '1500m'}}})
+    kube_api.add(quotas, {'metadata': {'name': 'pods'}, 'status': {
+        'hard': {'pods': '8'}, 'used': {'pods': '4'}}})
+    # the tightest quota wins, resources other than counts are left out
+    assert quota_headroom('ns') == {'pods': (8, 4),
+                                    'count/tfjobs.kubeflow.org': (5, 4)}
+
 
-    ensure_namespace_exists(str(uuid.uuid4()))
-    proc_helpers.run.assert_called_once()
+def test_quota_usage():
+    assert quota_usage({'kind': 'Pod', 'apiVersion': 'v1'}) == {
+        'pods': 1, 'count/pods': 1}
+    assert quota_usage({'kind': 'Service', 'apiVersion': 'v1'}) == {
+        'services': 1, 'count/services': 1}
+    assert quota_usage({'kind': 'Job', 'apiVersion': 'batch/v1', 'spec': {
+        'parallelism': 3, 'template': {'spec': {}}}}) == {
+        'count/jobs.batch': 1, 'pods': 3}
+    tfjob = {'kind': 'TFJob', 'apiVersion': 'kubeflow.org/v1alpha2',
+             'spec': {'tfReplicaSpecs': {
+                 'PS': {'replicas': 1, 'template': {}},
+                 'Worker': {'replicas': 2, 'template': {}}}}}
+    assert quota_usage(tfjob) == {'count/tfjobs.kubeflow.org': 1, 'pods': 3}
@@ -0,0 +1,91 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import os
+import time
+
+from mlt.utils import manifest_helpers
+
+
+def manifest(run_id, image='app:1'):
+    obj = {'kind': 'Job', 'apiVersion': 'batch/v1',
+           'metadata': {'name': 'app-' + run_id,
+                        'labels': {'mlt-run-id': run_id}}}
+    text = "kind: Job\nmetadata:\n  name: app-{0}\n  labels:\n" \
+           "    mlt-run-id: {0}\nimage: {1}\n".format(run_id, image)
+    return manifest_helpers.manifest(obj, text, run_id)
+
+
+def test_manifest_is_the_same_in_every_run():
+    first, second = manifest('run-1'), manifest('run-2')
+    assert first == second
+    assert first['key'] == 'Job/app-' + manifest_helpers.RUN_MARKER
+    assert manifest_helpers.is_per_run(first['key'])
+    assert not manifest_helpers.is_per_run('Service/app')
+    assert manifest_helpers.for_run(first['text'], 'run-3') == \
+        manifest('run-3')['text'].replace(manifest_helpers.RUN_MARKER,
+                                          'run-3')
+    assert manifest('run-1', image='app:2')['hash'] != first['hash']
+
+
+def test_render_key():
+    key = manifest_helpers.render_key('job.yaml', 'kind: Job', image='app:1')
+    assert key == manifest_helpers.render_key('job.yaml', 'kind: Job',
+                                              image='app:1')
+    assert key != manifest_helpers.render_key('job.yaml', 'kind: Job',
+                                              image='app:2')
+    assert key != manifest_helpers.render_key('job.yaml', 'kind: Pod',
+                                              image='app:1')
+
+
+def test_store_and_load():
+    assert manifest_helpers.load('missing') is None
+    manifest_helpers.store('key', [manifest('run-1')])
+    assert manifest_helpers.load('key') == [manifest('run-1')]
+
+
+def test_store_prunes_least_recently_used(monkeypatch):
+    monkeypatch.setattr(manifest_helpers.constants, 'RENDER_CACHE_KEPT', 3)
+    for age, key in enumerate(['recent', 'older', 'oldest']):
+        manifest_helpers.store(key, [manifest(key)])
+        mtime = time.time() - 100 * (age + 1)
+        os.utime(manifest_helpers._path(key), (mtime, mtime))
+    # loading a render counts as using it
+    assert manifest_helpers.load('oldest') is not None
+
+    manifest_helpers.store('new', [manifest('new')])
+    assert sorted(os.listdir(os.path.dirname(
+        manifest_helpers._path('new')))) == \
+        ['new.json', 'oldest.json', 'recent.json']
+
+
+def test_diff():
+    old = manifest('run-1')
+    new = manifest('run-2', image='app:2')
+    changes = manifest_helpers.diff({old['key']: old['text']},
+                                    {new['key']: new['text'],
+                                     'Service/app': 'kind: Service\n'})
+    assert '--- Job/app-$run\n+++ Job/app-$run\n' in changes
+    assert '-image: app:1\n+image: app:2\n' in changes
+    assert '--- /dev/null\n+++ Service/app\n' in changes
+    # the run id differs, but only shows up as context
+    assert '     mlt-run-id: $run\n' in changes
+    assert '-    mlt-run-id' not in changes
+    assert manifest_helpers.diff({'a': 'x'}, {'a': 'x'}) == ''
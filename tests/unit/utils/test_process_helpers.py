@@ -19,45 +19,38 @@
 #
 
 import pytest
+import sys
+import time
 from mock import patch
-from subprocess import CalledProcessError
 
-from mlt.utils.process_helpers import run, run_popen
+from mlt.utils.process_helpers import (run, run_capture, run_popen,
+                                       StreamingProcess)
 from test_utils.io import catch_stdout
 
 
-@patch('mlt.utils.process_helpers.check_output')
-def test_run_no_cwd(check_output):
-    """Assert a command was called with no current working dir
-       This command should return the value of `bar`
-    """
-    check_output.return_value.decode.return_value = 'bar'
-    output = run('ls')
-    assert output == 'bar'
+def python(code):
+    return [sys.executable, '-c', code]
 
 
-@patch('mlt.utils.process_helpers.check_output')
-def test_run_cwd(check_output):
-    """Assert a command was called with /tmp as working dir
-       This command should return the value of `foo`
-    """
-    check_output.return_value.decode.return_value = 'foo'
-    output = run('ls', '/tmp')
-    assert output == 'foo'
+def test_run_no_cwd():
+    """This command should return the value of `bar`"""
+    output = run(python('print("bar")'))
+    assert output.strip() == 'bar'
 
 
-@patch('mlt.utils.process_helpers.check_output')
-def test_run_error(check_output):
-    """There was a bad command made, therefore no output"""
-    check_output.side_effect = CalledProcessError(
-        returncode=2, cmd='Bad Command!')
+def test_run_cwd(tmpdir):
+    """Assert a command was called with tmpdir as working dir"""
+    output = run(python('import os; print(os.getcwd())'), str(tmpdir))
+    assert output.strip() == str(tmpdir)
+
+
+def test_run_error():
+    """a failing command shows its output before we exit"""
     with catch_stdout() as caught_output:
         with pytest.raises(SystemExit):
-            run('ls')
+            run(python('print("broken"); raise SystemExit(2)'))
         output = caught_output.getvalue().strip()
-    # since we're mocking CalledProcessError call, not sure we can simulate
-    # exception raised by actual check_output call, so e.output is None
-    assert output == 'None'
+    assert output == 'broken'
 
 
 @patch('mlt.utils.process_helpers.Popen')
@@ -74,3 +67,44 @@ def test_run_popen_shell(popen):
     popen.return_value = 0
     result = run_popen('ls /tmp', shell=True)
     assert result == 0
+
+
+def test_streaming_process_drains_large_output():
+    """far more output than a pipe buffer holds, on both streams, while
+       nobody reads until the command is done"""
+    process = StreamingProcess(python(
+        'import sys\n'
+        'for i in range(20000):\n'
+        '    sys.stdout.write("out %d\\n" % i)\n'
+        '    sys.stderr.write("err %d\\n" % i)\n'), tail_lines=3)
+    assert process.wait(timeout=30) == 0
+    assert process.stdout_text() == 'out 19997\nout 19998\nout 19999\n'
+    assert process.stderr_text().splitlines()[-1] == 'err 19999'
+
+
+def test_streaming_process_callbacks():
+    lines = []
+    exited = []
+    process = StreamingProcess(
+        python('print("one"); print("two")'), on_stdout=lines.append,
+        on_exit=lambda: exited.append(True))
+    assert process.wait() == 0
+    assert lines == ['one\n', 'two\n']
+    assert exited == [True]
+    assert process.duration >= 0
+    assert process.finished is not None
+
+
+def test_streaming_process_wait_timeout():
+    process = StreamingProcess(python('import time; time.sleep(10)'))
+    started = time.time()
+    assert process.wait(timeout=0.1) is None
+    assert time.time() - started < 5
+    process.terminate()
+    assert process.wait() != 0
+
+
+def test_run_capture_keeps_everything():
+    process = run_capture(python('for i in range(500): print(i)'))
+    assert process.returncode == 0
+    assert len(process.stdout_text().splitlines()) == 500
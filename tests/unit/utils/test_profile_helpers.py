@@ -0,0 +1,101 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import json
+import sys
+
+import pytest
+
+from mlt.utils import profile_helpers
+from mlt.utils.process_helpers import run_capture
+
+
+@pytest.fixture(autouse=True)
+def profiling():
+    profile_helpers.start()
+    yield
+    profile_helpers.finish('')
+
+
+def test_spans_only_kept_when_profiling():
+    profile_helpers.finish('')
+    with profile_helpers.span('render', 'render'):
+        pass
+    assert not profile_helpers.enabled()
+    assert profile_helpers._spans is None
+
+
+def test_span_kept_when_block_raises():
+    with pytest.raises(ValueError):
+        with profile_helpers.span('apply', 'phase', run='abc'):
+            raise ValueError()
+    span, = profile_helpers._spans
+    assert (span['name'], span['cat'], span['args']) == (
+        'apply', 'phase', {'run': 'abc'})
+    assert span['duration'] >= 0
+
+
+def test_traced():
+    @profile_helpers.traced('wait')
+    def _wait_for_pods(seconds):
+        return seconds
+
+    assert _wait_for_pods(1) == 1
+    assert [(s['name'], s['cat']) for s in profile_helpers._spans] == [
+        ('wait for pods', 'wait')]
+
+
+def test_subprocess_span():
+    run_capture([sys.executable, '-c', 'pass'])
+    span, = profile_helpers._spans
+    assert span['cat'] == 'exec'
+    assert span['args']['command'][0] == sys.executable
+
+
+@pytest.mark.parametrize('command,name', [
+    (['kubectl', '--namespace', 'ns', 'apply', '-f', 'k8s'],
+     'kubectl apply'),
+    (['kubectl', '--context=prod', 'get', '--raw', '/api'], 'kubectl get'),
+    (['/usr/bin/docker', 'push', 'gcr.io/app:1'], 'docker push'),
+    (['python'], 'python'),
+    ('CONTAINER_NAME=app:1 make build', 'make build'),
+])
+def test_command_name(command, name):
+    assert profile_helpers.command_name(command) == name
+
+
+def test_chrome_trace(tmpdir):
+    profile_helpers.add('push', 'phase', profile_helpers._started + 1, 2.5)
+    trace = tmpdir.join('trace.json')
+    profile_helpers.finish(str(trace))
+    events = json.loads(trace.read())['traceEvents']
+    assert events[0]['ph'] == 'X'
+    assert (events[0]['ts'], events[0]['dur']) == (1000000, 2500000)
+    assert events[1]['ph'] == 'M' and events[1]['name'] == 'thread_name'
+
+
+def test_summary():
+    for duration in (1.0, 3.0):
+        profile_helpers.add('apply', 'phase', 0, duration)
+    profile_helpers.add('render', 'phase', 0, 0.5)
+    lines = profile_helpers.summary(profile_helpers._spans).splitlines()
+    assert lines[0].split() == profile_helpers.SUMMARY_COLUMNS
+    assert lines[1].split() == ['apply', 'phase', '2', '4.000s', '3.000s']
+    assert lines[2].split()[0] == 'render'
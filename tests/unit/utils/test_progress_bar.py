@@ -18,56 +18,138 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import time
 from mock import patch, MagicMock
 
-from mlt.utils.progress_bar import duration_progress
+from mlt.utils.progress_bar import (add_duration, duration_progress,
+                                    estimate_duration, OutputProgress,
+                                    DURATION_HISTORY_SIZE)
 
 
+def test_estimate_duration():
+    """the median of past durations, None when there aren't any"""
+    assert estimate_duration(None) is None
+    assert estimate_duration([]) is None
+    assert estimate_duration([3, 1, 100]) == 3
+    assert estimate_duration([1, 2, 3, 4]) == 2.5
+
+
+def test_add_duration_keeps_recent_history():
+    durations = None
+    for i in range(DURATION_HISTORY_SIZE + 2):
+        durations = add_duration(durations, i)
+    assert len(durations) == DURATION_HISTORY_SIZE
+    assert durations[-1] == DURATION_HISTORY_SIZE + 1
+
+
+def feed(*lines):
+    output = OutputProgress()
+    for line in lines:
+        output.feed(line)
+    return output
+
+
+def test_output_progress_build_steps():
+    """a step only counts as done once the next one starts"""
+    output = feed('Step 1/4 : FROM python\n', ' ---> abc\n',
+                  'Step 3/4 : RUN make\n')
+    assert output.fraction == 0.5
+
+
+def test_output_progress_buildkit_steps():
+    output = feed('#5 [2/5] RUN pip install\n')
+    assert output.fraction == 0.2
+
+
+def test_output_progress_push_layers():
+    output = feed('0123456789ab: Preparing\n', 'abcdef012345: Preparing\n',
+                  '0123456789ab: Pushed\n')
+    assert output.fraction == 0.5
+    assert output.layers['abcdef012345'] == 'Preparing'
+
+
+def test_output_progress_unknown_output():
+    output = feed('hello\n')
+    assert output.fraction is None
+
+
+def test_output_progress_wait_wakes_on_close():
+    output = OutputProgress()
+    output.close()
+    started = time.time()
+    output.wait(10)
+    assert time.time() - started < 5
+    assert output.closed
+
+
+@patch('mlt.utils.progress_bar.time')
 @patch('mlt.utils.progress_bar.progressbar')
-def test_duration_progress_not_done(progressbar):
-    """We have a duration of 1 and then we aren't done once
-       and then we finish, which means bar.next() is called twice inside
-       of the for loop and and update happens once as we're done early
-    """
+def test_duration_progress_not_done(progressbar, time):
+    """we sleep between updates until we're done, then fill the bar"""
+    time.time.side_effect = [0, 0.5]
     duration_progress('activity', 1, MagicMock(
-        side_effect=[False, True, True]))
+        side_effect=[False, True]))
+
+    bar = progressbar.ProgressBar.return_value
+    assert time.sleep.call_count == 1
+    assert [c[0][0] for c in bar.update.call_args_list] == [50, 100]
+
 
-    progressbar_obj = progressbar.ProgressBar.return_value.return_value
-    assert progressbar_obj.next.call_count == 2
-    assert progressbar_obj.update.call_count == 1
+@patch('mlt.utils.progress_bar.time')
+@patch('mlt.utils.progress_bar.progressbar')
+def test_duration_progress_capped_until_done(progressbar, time):
+    """running over the expected duration never shows 100% early"""
+    time.time.side_effect = [0, 5]
+    duration_progress('activity', 1, MagicMock(side_effect=[False, True]))
+
+    bar = progressbar.ProgressBar.return_value
+    assert bar.update.call_args_list[0][0][0] == 99
 
 
+@patch('mlt.utils.progress_bar.time')
 @patch('mlt.utils.progress_bar.progressbar')
-def test_duration_progress_duration_done(progressbar):
-    """We have a duration of 1 but then terminate immediately
-       So we have a bar.next() call, then we update as we're done early
-       and then `if not is_done()` is not called so func terminates
-    """
+def test_duration_progress_duration_done(progressbar, time):
+    """done straight away, the bar is filled without waiting"""
     duration_progress('activity', 1, lambda: True)
 
-    progressbar_obj = progressbar.ProgressBar.return_value.return_value
-    assert progressbar_obj.next.call_count == 1
-    assert progressbar_obj.update.call_count == 1
+    bar = progressbar.ProgressBar.return_value
+    time.sleep.assert_not_called()
+    bar.update.assert_called_once_with(100)
+
+
+@patch('mlt.utils.progress_bar.time')
+@patch('mlt.utils.progress_bar.progressbar')
+def test_duration_progress_uses_output(progressbar, time):
+    """output progress wins over elapsed time and we block on it"""
+    output = MagicMock(fraction=0.25)
+    time.time.return_value = 0
+    duration_progress('activity', 100, MagicMock(side_effect=[False, True]),
+                      output)
+
+    bar = progressbar.ProgressBar.return_value
+    assert bar.update.call_args_list[0][0][0] == 25
+    assert output.wait.call_count == 1
+    time.sleep.assert_not_called()
 
 
+@patch('mlt.utils.progress_bar.time')
 @patch('mlt.utils.progress_bar.progressbar')
-def test_duration_progress_no_duration_not_done(progressbar):
-    """We have no duration, then we aren't done yet, then we enter the while
-       loop for one iteration to update the bar and then terminate
-    """
+def test_duration_progress_no_duration_not_done(progressbar, time):
+    """no duration, so a spinner is updated once per refresh"""
     duration_progress('activity', None, MagicMock(
         side_effect=[False, False, False, True]))
 
-    progressbar_obj = progressbar.ProgressBar.return_value.return_value
-    progressbar_obj.next.assert_not_called()
-    progressbar_obj.update.call_count == 3
+    bar = progressbar.ProgressBar.return_value
+    assert bar.update.call_count == 3
+    assert time.sleep.call_count == 3
 
 
+@patch('mlt.utils.progress_bar.time')
 @patch('mlt.utils.progress_bar.progressbar')
-def test_duration_progress_no_duration_done(progressbar):
+def test_duration_progress_no_duration_done(progressbar, time):
     """Duration is None and we are done so nothing is called in the func"""
     duration_progress('activity', None, lambda: True)
 
-    progressbar_obj = progressbar.ProgressBar.return_value.return_value
-    progressbar_obj.next.assert_not_called()
-    progressbar_obj.update.assert_not_called()
+    bar = progressbar.ProgressBar.return_value
+    bar.update.assert_not_called()
+    time.sleep.assert_not_called()
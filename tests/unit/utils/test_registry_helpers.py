@@ -0,0 +1,129 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+from threading import Thread
+
+import pytest
+
+from mlt.utils.registry_helpers import (HTTPConnection, HTTPSConnection,
+                                        _connection_classes, manifest_digest,
+                                        parse_image_name, pushed_digest)
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+DIGEST = 'sha256:' + 'b' * 64
+
+
+class FakeRegistryHandler(BaseHTTPRequestHandler):
+    """answers manifest HEAD requests like a docker registry would"""
+    manifests = {'/v2/app/manifests/1234': DIGEST}
+    requests = []
+
+    def do_HEAD(self):
+        self.requests.append((self.command, self.path))
+        if self.path.startswith('/v2/private/'):
+            self.send_response(401)
+        elif self.path in self.manifests:
+            self.send_response(200)
+            self.send_header('Docker-Content-Digest',
+                             self.manifests[self.path])
+        else:
+            self.send_response(404)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def registry():
+    server = HTTPServer(('127.0.0.1', 0), FakeRegistryHandler)
+    thread = Thread(target=server.serve_forever,
+                    kwargs={'poll_interval': 0.05})
+    thread.daemon = True
+    thread.start()
+    del FakeRegistryHandler.requests[:]
+    try:
+        yield '127.0.0.1:{}'.format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('image,expected', [
+    ('localhost:5000/app:1234', ('localhost:5000', 'app', '1234')),
+    ('gcr.io/project/app:1234', ('gcr.io', 'project/app', '1234')),
+    ('registry:5000/app', ('registry:5000', 'app', 'latest')),
+    ('user/app:1234', ('registry-1.docker.io', 'user/app', '1234')),
+    ('app:1234', ('registry-1.docker.io', 'library/app', '1234')),
+])
+def test_parse_image_name(image, expected):
+    assert parse_image_name(image) == expected
+
+
+def test_pushed_digest():
+    output = "1234: digest: {} size: 1569\n".format(DIGEST)
+    assert pushed_digest("The push refers to repository\n" + output) == \
+        DIGEST
+    assert pushed_digest("error") is None
+
+
+def test_manifest_digest_present(registry):
+    assert manifest_digest(registry + '/app:1234') == DIGEST
+    # a single HEAD is all it takes
+    assert FakeRegistryHandler.requests == [
+        ('HEAD', '/v2/app/manifests/1234')]
+
+
+def test_manifest_digest_missing(registry):
+    assert manifest_digest(registry + '/app:5678') == ''
+
+
+def test_manifest_digest_unauthorized(registry):
+    assert manifest_digest(registry + '/private/app:1234') is None
+
+
+def test_manifest_digest_unreachable():
+    assert manifest_digest('127.0.0.1:1/app:1234', timeout=1) is None
+
+
+@pytest.mark.parametrize('registry,expected', [
+    ('localhost:5000', (HTTPConnection, HTTPSConnection)),
+    ('127.0.0.1:5000', (HTTPConnection, HTTPSConnection)),
+    ('[::1]:5000', (HTTPConnection, HTTPSConnection)),
+    ('gcr.io', (HTTPSConnection,)),
+    ('registry:5000', (HTTPSConnection,)),
+    ('localhost.example.com', (HTTPSConnection,)),
+])
+def test_connection_classes(registry, expected, monkeypatch):
+    """only local registries are tried over plain http"""
+    monkeypatch.delenv('MLT_INSECURE_REGISTRIES', raising=False)
+    assert _connection_classes(registry) == expected
+
+
+def test_connection_classes_insecure_registries(monkeypatch):
+    monkeypatch.setenv('MLT_INSECURE_REGISTRIES', 'other:80, registry:5000')
+    assert _connection_classes('registry:5000') == \
+        (HTTPSConnection, HTTPConnection)
+    assert _connection_classes('gcr.io') == (HTTPSConnection,)
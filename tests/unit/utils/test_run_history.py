@@ -0,0 +1,80 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import pytest
+
+from mlt.utils import run_history
+
+
+def test_record_and_list_runs():
+    run_history.record('build', 'abc', 100.0, 'success', duration=2.5,
+                       image='app:abc')
+    run_history.record('deploy', 'app-1-2-3', 200.0, 'failed',
+                       namespace='ns', phases={'push': 1.5})
+    runs = run_history.runs()
+    assert [run['run_id'] for run in runs] == ['app-1-2-3', 'abc']
+    assert runs[0]['details'] == {'namespace': 'ns', 'phases': {'push': 1.5}}
+    assert runs[1]['image'] == 'app:abc'
+    assert run_history.runs(action='build', limit=1) == [runs[1]]
+
+
+def test_durations_only_successful_oldest_first():
+    run_history.record('push', 'a', 1.0, 'success', duration=3.0)
+    run_history.record('push', 'b', 2.0, 'failed', duration=9.0)
+    run_history.record('push', 'c', 3.0, 'success', duration=4.0)
+    run_history.record('push', 'd', 4.0, 'success', duration=5.0)
+    run_history.record('build', 'e', 5.0, 'success', duration=7.0)
+    assert run_history.durations('push', 2) == [4.0, 5.0]
+    assert run_history.durations('deploy', 2) == []
+
+
+def test_find_by_prefix():
+    run_history.record('deploy', 'app-1a', 1.0, 'success')
+    run_history.record('deploy', 'app-1b', 2.0, 'success')
+    run_history.record('deploy', 'app_2', 3.0, 'success')
+    assert [run['run_id'] for run in run_history.find('app-1a')] == \
+        ['app-1a']
+    with pytest.raises(ValueError):
+        run_history.find('app-1')
+    # `_` isn't a wildcard
+    assert run_history.find('app-2') == []
+
+
+def test_deployed_run():
+    run_history.record('push', 'app-1', 1.0, 'success')
+    assert run_history.deployed_run('app-1') is None
+    run_history.record('deploy', 'app-1', 2.0, 'success',
+                       objects=['TFJob/app-1'],
+                       api_versions={'TFJob': 'kubeflow.org/v1alpha2'})
+    assert run_history.deployed_run('app') == {
+        'app_run_id': 'app-1', 'app_run_objects': ['TFJob/app-1'],
+        'app_run_api_versions': {'TFJob': 'kubeflow.org/v1alpha2'}}
+
+
+def test_load_deployed_run_missing():
+    with pytest.raises(SystemExit):
+        run_history.load_deployed_run('nope')
+
+
+def test_unreadable_history(monkeypatch, tmpdir):
+    # a directory can't be opened as a database
+    monkeypatch.setattr('mlt.utils.constants.RUN_HISTORY_FILE', str(tmpdir))
+    run_history.record('build', 'abc', 1.0, 'success')
+    assert run_history.runs() == []
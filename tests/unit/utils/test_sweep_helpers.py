@@ -0,0 +1,74 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import json
+
+import pytest
+
+from mlt.utils.sweep_helpers import describe, load_spec, points
+
+
+def test_grid_points():
+    assert points({'grid': {'lr': [0.1, 0.01], 'batch_size': [32, 64]}}) == [
+        {'batch_size': 32, 'lr': 0.1}, {'batch_size': 32, 'lr': 0.01},
+        {'batch_size': 64, 'lr': 0.1}, {'batch_size': 64, 'lr': 0.01}]
+
+
+def test_random_points():
+    spec = {'grid': {'batch_size': [32, 64]},
+            'random': {'dropout': {'min': 0.1, 'max': 0.5},
+                       'decay': {'min': 1e-5, 'max': 1e-2, 'log': True},
+                       'optimizer': ['adam', 'sgd']},
+            'samples': 3, 'seed': 42}
+    sampled = points(spec)
+    assert len(sampled) == 6
+    assert [point['batch_size'] for point in sampled] == [32] * 3 + [64] * 3
+    for point in sampled:
+        assert 0.1 <= point['dropout'] <= 0.5
+        assert 1e-5 <= point['decay'] <= 1e-2
+        assert point['optimizer'] in ('adam', 'sgd')
+    # the same seed gives the same sweep
+    assert points(spec) == sampled
+
+
+@pytest.mark.parametrize('spec', [
+    [], {}, {'grid': {}}, {'grid': {'lr': []}}, {'grid': {'lr': 0.1}},
+    {'random': {'lr': {'min': 1}}}, {'random': {'lr': {'min': 2, 'max': 1}}},
+    {'random': {'lr': {'min': 0, 'max': 1, 'log': True}}},
+    {'grid': {'lr': [1]}, 'random': {'lr': [2]}},
+    {'grid': {'lr': [1]}, 'samples': 0}, {'grid': {'lr': [1]}, 'runs': 2}])
+def test_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        points(spec)
+
+
+def test_load_spec(tmpdir):
+    spec = tmpdir.join('sweep.json')
+    spec.write(json.dumps({'grid': {'lr': [0.1]}}))
+    assert load_spec(str(spec)) == {'grid': {'lr': [0.1]}}
+    spec.write('{"grid": ')
+    with pytest.raises(ValueError, match="isn't valid JSON"):
+        load_spec(str(spec))
+    with pytest.raises(ValueError, match="Unable to read"):
+        load_spec(str(tmpdir.join('missing.json')))
+
+
+def test_describe():
+    assert describe({'lr': 0.1, 'batch_size': 32}) == 'batch_size=32 lr=0.1'